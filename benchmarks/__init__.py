@@ -0,0 +1,3 @@
+"""
+Microbenchmarks of the hot paths of the service, see ``python -m benchmarks -h``.
+"""
@@ -0,0 +1,78 @@
+import argparse
+import json
+import sys
+
+from benchmarks.suite import BENCHMARKS, compare, report, run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description="Run the microbenchmarks."
+    )
+    parser.add_argument(
+        "-b",
+        "--bench",
+        action="append",
+        choices=sorted(BENCHMARKS),
+        help="benchmarks to run, all by default",
+    )
+    parser.add_argument(
+        "-n",
+        "--jobs",
+        default="1,100,10000",
+        help="comma separated job counts, from 1 up to 1000000 (default: %(default)s)",
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output", help="file to store the results in")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="slowdown over the baseline failing the run (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        help="seconds per item any benchmark failing the run takes over",
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.bench or BENCHMARKS:
+        for count in map(int, args.jobs.split(",")):
+            result = run(name, count, repeat=args.repeat)
+            results.append(result)
+            print(
+                f"{result.name:<28} median {result.median * 1e3:10.3f}ms"
+                f"  {result.per_item * 1e6:10.2f}us/item",
+                flush=True,
+            )
+
+    code = 0
+    if args.budget is not None:
+        for result in results:
+            if result.per_item > args.budget:
+                print(
+                    f"over budget: {result.name} takes {result.per_item:.3f}s/item",
+                    file=sys.stderr,
+                )
+                code = 1
+
+    current = report(results)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(current, fp, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = compare(current, baseline, threshold=args.threshold)
+        for name, change in regressions:
+            print(f"regression: {name} is {change:.0%} slower", file=sys.stderr)
+        return 1 if regressions else code
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,595 @@
+"""
+A fake PBS toolchain for load tests: ``qsub``, ``qstat``, ``qselect``, ``qdel``,
+``qhold``, ``qrls`` and ``qalter`` scripts installed under a directory to be used as
+``PBS_EXEC``, sharing their jobs through a sqlite database. Commands can be
+slowed down and made to fail at random, and jobs can be made to go through the
+queued, running and finished states over time. A stand-in pbs_server answers
+job status batch requests over the same jobs.
+
+    $ python -m benchmarks.fakepbs /tmp/pbs --jobs 10000 --latency 0.01
+    $ SCHED_TYPE=PBS PBS_EXEC=/tmp/pbs PBS_HOME=/tmp/pbs PBS_SERVER=pbs00 \\
+        flask run
+
+    $ python -m benchmarks.fakepbs /tmp/pbs --jobs 10000 --port 15001
+    $ SCHED_TRANSPORT=ifl SCHED_IFL_HOST=localhost SCHED_IFL_AUTH=none \\
+        flask run
+"""
+from __future__ import annotations
+
+import argparse
+import getopt
+import getpass
+import json
+import operator
+import os
+import random
+import socket
+import socketserver
+import sqlite3
+import stat
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Optional
+
+from benchmarks.generator import pbs_date, qstat_record
+from src.services.ifl import (
+    FINISHED_JOB,
+    PROTOCOL_TYPE,
+    PROTOCOL_VERSION,
+    TIME_ATTRS,
+    UNKNOWN_JOB,
+    Reader,
+    Reply,
+    Request,
+    Writer,
+)
+
+__all__ = ("install", "main", "serve")
+
+_CONFIG = "fakepbs.json"
+_COMMANDS = ("qalter", "qdel", "qhold", "qrls", "qselect", "qstat", "qsub")
+
+# qsub options taking a value, as in getopt
+_QSUB_OPTS = "a:A:c:C:e:fhIj:J:k:l:m:M:N:o:p:P:q:r:R:S:u:v:VW:Xz"
+
+# states reported only when asking for the job history
+_HISTORY = ("F", "M")
+
+# comparisons of the times qselect selects jobs by
+_COMPARISONS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "ge": operator.ge,
+    "gt": operator.gt,
+    "le": operator.le,
+    "lt": operator.lt,
+}
+
+_SCRIPT = """#!{python}
+import sys
+
+sys.path.insert(0, {root!r})
+from benchmarks.fakepbs import main
+
+sys.exit(main())
+"""
+
+
+class _Error(Exception):
+    def __init__(self, message: str, code: int):
+        super().__init__(message)
+        self.code = code
+
+
+def install(
+    path: str,
+    jobs: int = 0,
+    server: str = "pbs00",
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    failure_rate: float = 0.0,
+    queue_time: Optional[float] = None,
+    run_time: Optional[float] = None,
+    seed: int = 0,
+):
+    """
+    Install the fake toolchain under ``path``, with ``jobs`` jobs already
+    known to the server. Commands take ``latency`` seconds plus up to
+    ``jitter`` more, and fail with probability ``failure_rate``. Submitted
+    jobs start running after ``queue_time`` seconds and finish ``run_time``
+    seconds later, or stay queued if not given.
+    """
+    bin_path = os.path.join(path, "bin")
+    os.makedirs(bin_path, exist_ok=True)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for command in _COMMANDS:
+        script = os.path.join(bin_path, command)
+        with open(script, "w") as fp:
+            fp.write(_SCRIPT.format(python=sys.executable, root=root))
+        os.chmod(script, os.stat(script).st_mode | stat.S_IXUSR | stat.S_IXGRP)
+
+    config = {
+        "server": server,
+        "state": os.path.join(path, "fakepbs.db"),
+        "latency": latency,
+        "jitter": jitter,
+        "failure_rate": failure_rate,
+        "queue_time": queue_time,
+        "run_time": run_time,
+    }
+    with open(os.path.join(path, _CONFIG), "w") as fp:
+        json.dump(config, fp, indent=2)
+
+    if os.path.exists(config["state"]):
+        os.remove(config["state"])
+    with _connect(config) as db:
+        rng = random.Random(seed)
+        now = time.time()
+        db.executemany(
+            "INSERT INTO jobs (seq, submitted, record) VALUES (?, ?, ?)",
+            (
+                (idx + 1, now, json.dumps(qstat_record(idx + 1, rng)))
+                for idx in range(jobs)
+            ),
+        )
+
+
+def _connect(config: dict) -> sqlite3.Connection:
+    db = sqlite3.connect(config["state"], timeout=30)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "seq INTEGER PRIMARY KEY AUTOINCREMENT, submitted REAL, record TEXT)"
+    )
+    return db
+
+
+def _strptime(value: str) -> datetime:
+    """Parse a date the way PBS prints it, e.g. ``Fri Feb 3 10:41:52 2023``."""
+    return datetime.strptime(value, "%a %b %d %H:%M:%S %Y")
+
+
+def _seq(job_id: str, server: str) -> Optional[int]:
+    seq, _, name = job_id.partition(".")
+    if not seq.isdigit() or name not in ("", server):
+        return None
+    return int(seq)
+
+
+def _advance(config: dict, record: dict, submitted: float) -> dict:
+    """Move a submitted job along its states as time goes by."""
+    queue_time, run_time = config["queue_time"], config["run_time"]
+    if queue_time is None or record.get("job_state") not in ("Q", "R"):
+        return record
+    age = time.time() - submitted
+    if age >= queue_time:
+        started = pbs_date(datetime.fromtimestamp(submitted + queue_time))
+        record.update(job_state="R", stime=started, mtime=started, run_count=1)
+        record["comment"] = f"Job run at {started} on (cn01)"
+    if run_time is not None and age >= queue_time + run_time:
+        ended = pbs_date(datetime.fromtimestamp(submitted + queue_time + run_time))
+        record.update(job_state="F", Exit_status=0, mtime=ended, obittime=ended)
+        record["comment"] = "Job run and finished"
+    return record
+
+
+def _stat(
+    config: dict,
+    db: sqlite3.Connection,
+    ids: list[str],
+    queues: set[str],
+    history: bool,
+    missing: list[str],
+    finished: list[str],
+) -> Iterator[tuple[str, dict]]:
+    """
+    The jobs of the given ids, or of every job, from the given queues if
+    any, the way qstat sees them. Ids unknown or of finished jobs, when
+    not asking for the history, are added to ``missing`` and ``finished``.
+    """
+    server = config["server"]
+    if ids:
+        rows = []
+        for job_id in ids:
+            seq = _seq(job_id, server)
+            row = db.execute(
+                "SELECT seq, submitted, record FROM jobs WHERE seq = ?", (seq,)
+            ).fetchone()
+            if row is None:
+                missing.append(job_id)
+            else:
+                rows.append(row)
+    else:
+        rows = db.execute("SELECT seq, submitted, record FROM jobs ORDER BY seq")
+
+    for seq, submitted, record in rows:
+        job = _advance(config, json.loads(record), submitted)
+        if queues and job.get("queue") not in queues:
+            continue
+        if job.get("job_state") in _HISTORY and not history:
+            if ids:
+                finished.append(f"{seq}.{server}")
+            continue
+        yield f"{seq}.{server}", job
+
+
+def _qstat(config: dict, args: list[str]) -> int:
+    history, names = False, []
+    idx = 0
+    while idx < len(args):
+        arg = args[idx]
+        if arg == "-F":
+            idx += 1
+        elif arg.startswith("-"):
+            history |= "x" in arg
+        else:
+            names.append(arg)
+        idx += 1
+
+    server = config["server"]
+    ids = [name for name in names if "." in name or name.isdigit()]
+    queues = {name for name in names if name not in ids}
+    missing, finished = [], []
+    with _connect(config) as db:
+        out = sys.stdout
+        out.write(f'{{"timestamp":{int(time.time())},"pbs_version":"2022.1.1",')
+        out.write(f'"pbs_server":"{server}","Jobs":{{')
+        first = True
+        for job_id, job in _stat(config, db, ids, queues, history, missing, finished):
+            out.write("" if first else ",")
+            out.write(f'"{job_id}":{json.dumps(job)}')
+            first = False
+        out.write("}}\n")
+
+    for job_id in missing:
+        print(f"qstat: Unknown Job Id {job_id}", file=sys.stderr)
+    for job_id in finished:
+        print(
+            f"qstat: {job_id} Job has finished, use -x or -H to obtain "
+            "historical job information",
+            file=sys.stderr,
+        )
+    if missing:
+        return 153
+    return 35 if finished else 0
+
+
+def _qselect(config: dict, args: list[str]) -> int:
+    """
+    Print the ids of the jobs in the given states and queue, and modified
+    in the given times, e.g. ``-x -s FM -tm.ge.202302031041.52``.
+    """
+    try:
+        opts, _ = getopt.getopt(args, "xs:q:t:")
+    except getopt.GetoptError as ex:
+        raise _Error(f"qselect: {ex}", code=2)
+
+    history, states, queues, times = False, None, set(), []
+    for opt, value in opts:
+        if opt == "-x":
+            history = True
+        elif opt == "-s":
+            states = set(value)
+        elif opt == "-q":
+            queues.add(value)
+        elif opt == "-t":
+            field, op, stamp = value.split(".", 2)
+            if field != "m" or op not in _COMPARISONS:
+                raise _Error(f"qselect: illegal -t value {value}", code=2)
+            times.append((_COMPARISONS[op], datetime.strptime(stamp, "%Y%m%d%H%M.%S")))
+
+    with _connect(config) as db:
+        for job_id, job in _stat(config, db, [], queues, history, [], []):
+            if states is not None and job.get("job_state") not in states:
+                continue
+            modified = _strptime(job["mtime"])
+            if all(compare(modified, value) for compare, value in times):
+                print(job_id)
+    return 0
+
+
+def _qsub(config: dict, args: list[str]) -> int:
+    try:
+        opts, command = getopt.getopt(args, _QSUB_OPTS)
+    except getopt.GetoptError as ex:
+        raise _Error(f"qsub: {ex}", code=2)
+
+    user, host = getpass.getuser(), socket.gethostname()
+    now = pbs_date(datetime.now())
+    record = {
+        "Job_Name": "STDIN",
+        "Job_Owner": f"{user}@{host}",
+        "job_state": "Q",
+        "queue": "workq",
+        "server": config["server"],
+        "ctime": now,
+        "mtime": now,
+        "qtime": now,
+        "etime": now,
+        "Hold_Types": "n",
+        "Join_Path": "n",
+        "Priority": 0,
+        "Rerunable": "True",
+        "Submit_arguments": " ".join(args),
+        "Submit_Host": host,
+        "Variable_List": {"PBS_O_LOGNAME": user, "PBS_O_HOST": host},
+    }
+    resources = {}
+    for opt, value in opts:
+        if opt == "-N":
+            record["Job_Name"] = value
+        elif opt == "-q":
+            record["queue"] = value
+        elif opt == "-A":
+            record["Account_Name"] = value
+        elif opt == "-l":
+            for item in value.split(","):
+                key, _, val = item.partition("=")
+                resources[key] = val
+        elif opt == "-h":
+            record.update(job_state="H", Hold_Types="u")
+    if resources:
+        record["Resource_List"] = resources
+    if not command:
+        raise _Error("qsub: a job script or command is required", code=2)
+
+    with _connect(config) as db:
+        cursor = db.execute(
+            "INSERT INTO jobs (submitted, record) VALUES (?, ?)",
+            (time.time(), json.dumps(record)),
+        )
+        print(f"{cursor.lastrowid}.{config['server']}")
+    return 0
+
+
+def _control(config: dict, command: str, job_ids: list[str], change) -> int:
+    """
+    Apply a change to the given jobs, reporting each one it failed for
+    the way PBS commands do. ``change`` returns an error for a job, if any.
+    """
+    server, code = config["server"], 0
+    with _connect(config) as db:
+        for job_id in job_ids:
+            seq = _seq(job_id, server)
+            # errors name jobs by their full id, as PBS does
+            if seq is not None:
+                job_id = f"{seq}.{server}"
+            row = db.execute(
+                "SELECT submitted, record FROM jobs WHERE seq = ?", (seq,)
+            ).fetchone()
+            if row is None:
+                print(f"{command}: Unknown Job Id {job_id}", file=sys.stderr)
+                code = 153
+                continue
+            job = _advance(config, json.loads(row[1]), row[0])
+            if job.get("job_state") in _HISTORY:
+                print(f"{command}: Job has finished {job_id}", file=sys.stderr)
+                code = 35
+                continue
+            error = change(job)
+            if error:
+                print(f"{command}: {error} {job_id}", file=sys.stderr)
+                code = 168
+                continue
+            job["mtime"] = pbs_date(datetime.now())
+            db.execute(
+                "UPDATE jobs SET record = ? WHERE seq = ?", (json.dumps(job), seq)
+            )
+    return code
+
+
+def _qdel(config: dict, args: list[str]) -> int:
+    def delete(job):
+        job.update(job_state="F", comment="Job deleted")
+
+    job_ids = [arg for arg in args if not arg.startswith("-")]
+    return _control(config, "qdel", job_ids, delete)
+
+
+def _qhold(config: dict, args: list[str]) -> int:
+    def hold(job):
+        if job.get("job_state") not in ("Q", "H"):
+            return "Request invalid for state of job"
+        job.update(job_state="H", Hold_Types="u")
+
+    job_ids = [arg for arg in args if not arg.startswith("-")]
+    return _control(config, "qhold", job_ids, hold)
+
+
+def _qrls(config: dict, args: list[str]) -> int:
+    def release(job):
+        if job.get("job_state") == "H":
+            job.update(job_state="Q", Hold_Types="n")
+
+    job_ids = [arg for arg in args if not arg.startswith("-")]
+    return _control(config, "qrls", job_ids, release)
+
+
+def _qalter(config: dict, args: list[str]) -> int:
+    try:
+        opts, job_ids = getopt.getopt(args, _QSUB_OPTS)
+    except getopt.GetoptError as ex:
+        raise _Error(f"qalter: {ex}", code=2)
+
+    def alter(job):
+        if job.get("job_state") not in ("Q", "H"):
+            return "Cannot modify attribute while job running"
+        for opt, value in opts:
+            if opt == "-N":
+                job["Job_Name"] = value
+            elif opt == "-A":
+                job["Account_Name"] = value
+            elif opt == "-P":
+                job["project"] = value
+            elif opt == "-p":
+                job["Priority"] = int(value)
+            elif opt == "-l":
+                for item in value.split(","):
+                    key, _, val = item.partition("=")
+                    job.setdefault("Resource_List", {})[key] = val
+
+    return _control(config, "qalter", job_ids, alter)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Entry point of the installed commands, dispatching on their name."""
+    argv = sys.argv if argv is None else argv
+    command = os.path.basename(argv[0])
+    base = os.path.dirname(os.path.dirname(os.path.abspath(argv[0])))
+    with open(os.path.join(base, _CONFIG)) as fp:
+        config = json.load(fp)
+
+    delay = config["latency"] + random.uniform(0, config["jitter"])
+    if delay > 0:
+        time.sleep(delay)
+    try:
+        if random.random() < config["failure_rate"]:
+            raise _Error(
+                f"Connection refused\n{command}: cannot connect to server "
+                f"{config['server']} (errno=15010)",
+                code=1,
+            )
+        commands = {
+            "qalter": _qalter,
+            "qdel": _qdel,
+            "qhold": _qhold,
+            "qrls": _qrls,
+            "qselect": _qselect,
+            "qstat": _qstat,
+            "qsub": _qsub,
+        }
+        return commands[command](config, argv[1:])
+    except _Error as ex:
+        print(str(ex), file=sys.stderr)
+        return ex.code
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """A connection to the stand-in pbs_server, answering requests in turn."""
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        reader = Reader(self.rfile)
+        while True:
+            try:
+                reader.uint()  # protocol type
+            except ConnectionError:
+                return
+            reader.uint()  # protocol version
+            kind, _ = reader.uint(), reader.string()
+            if kind == Request.STATUS_JOB:
+                name, _ = reader.string(), reader.attrs()
+            elif kind == Request.AUTHENTICATE:
+                method = [reader.string() for _ in range(3)][0]
+            else:
+                # the rest of the request can't be told apart from the next
+                return
+            extend = reader.string() if reader.uint() else ""
+            with server.lock:
+                server.requests += 1
+
+            delay = server.config["latency"] + random.uniform(
+                0, server.config["jitter"]
+            )
+            if delay > 0:
+                time.sleep(delay)
+            if kind == Request.AUTHENTICATE:
+                if method != "munge":
+                    self._reply(15019, Reply.TEXT, Writer().string("bad auth"))
+                else:
+                    self._reply(0, Reply.NULL, Writer())
+            else:
+                self._status(name, history="x" in extend)
+
+    def _status(self, name: str, history: bool):
+        config = self.server.config
+        ids = [name] if "." in name or name.isdigit() else []
+        queues = {name} if name and not ids else set()
+        missing, finished = [], []
+        with _connect(config) as db:
+            jobs = list(_stat(config, db, ids, queues, history, missing, finished))
+        if missing:
+            text = Writer().string(f"Unknown Job Id {missing[0]}")
+            return self._reply(UNKNOWN_JOB, Reply.TEXT, text)
+        if finished:
+            text = Writer().string(f"Job has finished {finished[0]}")
+            return self._reply(FINISHED_JOB, Reply.TEXT, text)
+
+        body = Writer().uint(len(jobs))
+        for job_id, job in jobs:
+            body.uint(2).string(job_id).attrs(list(_attrs(job)))
+        self._reply(0, Reply.STATUS, body)
+
+    def _reply(self, code: int, choice: int, body: Writer):
+        header = Writer().uint(PROTOCOL_TYPE).uint(PROTOCOL_VERSION)
+        header.int(code).int(0).uint(choice)
+        self.wfile.write(header.getvalue() + body.getvalue())
+
+
+def _attrs(job: dict) -> Iterator[tuple[str, Optional[str], str]]:
+    """The attributes of a job as sent over the wire, times as epochs."""
+    for name, value in job.items():
+        if name in TIME_ATTRS:
+            yield name, None, str(int(_strptime(value).timestamp()))
+        elif name == "Variable_List":
+            # commas within values are escaped
+            items = (f"{k}={v}".replace(",", r"\,") for k, v in value.items())
+            yield name, None, ",".join(items)
+        elif isinstance(value, dict):
+            for resource, item in value.items():
+                yield name, resource, str(item)
+        else:
+            yield name, None, str(value)
+
+
+def serve(path: str, host: str = "127.0.0.1", port: int = 0):
+    """
+    A stand-in pbs_server over the jobs of the toolchain installed under
+    ``path``, to be run with ``serve_forever``. It answers job status and
+    authentication requests, with the latency and jitter of the commands.
+    """
+    with open(os.path.join(path, _CONFIG)) as fp:
+        config = json.load(fp)
+    server = socketserver.ThreadingTCPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.config = config
+    server.lock = threading.Lock()
+    server.connections = server.requests = 0
+    return server
+
+
+def _install_main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.fakepbs",
+        description="Install a fake PBS toolchain, to be used as PBS_EXEC.",
+    )
+    parser.add_argument("path", help="where to install it")
+    parser.add_argument("-n", "--jobs", type=int, default=0, help="jobs to start with")
+    parser.add_argument("--server", default="pbs00")
+    parser.add_argument("--latency", type=float, default=0.0, help="in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--queue-time", type=float, help="in seconds")
+    parser.add_argument("--run-time", type=float, help="in seconds")
+    parser.add_argument("--port", type=int, help="serve batch requests on it")
+    args = parser.parse_args()
+    install(
+        args.path,
+        jobs=args.jobs,
+        server=args.server,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        queue_time=args.queue_time,
+        run_time=args.run_time,
+    )
+    if args.port is not None:
+        serve(args.path, host="", port=args.port).serve_forever()
+
+
+if __name__ == "__main__":
+    _install_main()
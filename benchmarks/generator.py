@@ -0,0 +1,143 @@
+import io
+import json
+import random
+from datetime import datetime, timedelta
+from typing import TextIO
+
+__all__ = (
+    "pbs_date",
+    "qstat_array_json",
+    "qstat_record",
+    "qstat_json",
+    "write_qstat_json",
+)
+
+_STATES = "QQRRRRFFHE"
+_QUEUES = ("workq", "short", "long", "gpu")
+_EPOCH = datetime(2023, 2, 3, 10, 41, 52)
+
+
+def pbs_date(value: datetime) -> str:
+    """A date the way PBS prints it, e.g. ``Fri Feb 3 10:41:52 2023``."""
+    return f"{value:%a %b} {value.day} {value:%H:%M:%S %Y}"
+
+
+def qstat_record(idx: int, rng: random.Random) -> dict:
+    """A job record as found in the output of ``qstat -f -F json``."""
+    owner = f"user{rng.randrange(100):02d}"
+    ncpus = rng.choice((1, 4, 24, 48))
+    created = _EPOCH + timedelta(seconds=idx * 7)
+    state = rng.choice(_STATES)
+    record = {
+        "Job_Name": f"job{idx}",
+        "Job_Owner": f"{owner}@ln01.cluster",
+        "job_state": state,
+        "queue": rng.choice(_QUEUES),
+        "server": "pbs00",
+        "Account_Name": "pbs_account",
+        "Checkpoint": "u",
+        "ctime": pbs_date(created),
+        "Error_Path": f"ln01.cluster:/home/{owner}/job{idx}.e{idx}",
+        "Hold_Types": "n",
+        "Join_Path": "n",
+        "Keep_Files": "n",
+        "Mail_Points": "a",
+        "mtime": pbs_date(created + timedelta(seconds=30)),
+        "Output_Path": f"ln01.cluster:/home/{owner}/job{idx}.o{idx}",
+        "Priority": 0,
+        "qtime": pbs_date(created + timedelta(seconds=1)),
+        "Rerunable": "True",
+        "Resource_List": {
+            "mem": f"{ncpus * 2}gb",
+            "ncpus": ncpus,
+            "nodect": 1,
+            "place": "free",
+            "select": f"1:ncpus={ncpus}:mem={ncpus * 2}gb",
+            "walltime": "24:00:00",
+        },
+        "substate": 42,
+        "Variable_List": {
+            "PBS_O_HOME": f"/home/{owner}",
+            "PBS_O_LOGNAME": owner,
+            "PBS_O_PATH": "/usr/local/bin:/usr/bin:/bin",
+            "PBS_O_SHELL": "/bin/bash",
+            "PBS_O_WORKDIR": f"/home/{owner}",
+            "PBS_O_SYSTEM": "Linux",
+            "PBS_O_QUEUE": "workq",
+            "PBS_O_HOST": "ln01.cluster",
+        },
+        "etime": pbs_date(created + timedelta(seconds=1)),
+        "Submit_arguments": f"-l select=1:ncpus={ncpus} -- /bin/sleep 1000",
+        "project": "_pbs_project_default",
+        "Submit_Host": "ln01.cluster",
+    }
+    if state in "RFE":
+        record.update(
+            {
+                "resources_used": {
+                    "cpupercent": rng.randrange(100 * ncpus),
+                    "cput": "00:10:00",
+                    "mem": f"{rng.randrange(1, 1 << 20)}kb",
+                    "ncpus": ncpus,
+                    "vmem": f"{rng.randrange(1, 1 << 20)}kb",
+                    "walltime": "00:02:00",
+                },
+                "exec_host": f"cn{idx % 100:02d}/0*{ncpus}",
+                "stime": pbs_date(created + timedelta(seconds=5)),
+                "session_id": 10000 + idx,
+                "comment": f"Job run at {pbs_date(created)} on (cn{idx % 100:02d})",
+                "run_count": 1,
+            }
+        )
+    return record
+
+
+def write_qstat_json(fp: TextIO, count: int, seed: int = 0):
+    """
+    Write a ``qstat -f -F json`` document of ``count`` jobs, one job at a
+    time, so that even a million of them never sit in memory at once.
+    """
+    rng = random.Random(seed)
+    fp.write('{"timestamp":1675417312,"pbs_version":"2022.1.1",')
+    fp.write('"pbs_server":"pbs00","Jobs":{')
+    for idx in range(count):
+        if idx:
+            fp.write(",")
+        fp.write(f'"{idx}.pbs00":')
+        fp.write(json.dumps(qstat_record(idx, rng)))
+    fp.write("}}")
+
+
+def qstat_json(count: int, seed: int = 0) -> str:
+    fp = io.StringIO()
+    write_qstat_json(fp, count, seed=seed)
+    return fp.getvalue()
+
+
+def qstat_array_json(count: int, seed: int = 0) -> str:
+    """
+    A ``qstat -x -t -f -F json`` document of an array job of ``count``
+    subjobs: mostly expired ones, then running, then queued ones, with a
+    few running late among the expired.
+    """
+    rng = random.Random(seed)
+    parent = qstat_record(0, rng)
+    parent.update(
+        job_state="B",
+        array=True,
+        array_indices_submitted=f"1-{count}",
+        array_indices_remaining=f"{count // 2 + 1}-{count}",
+    )
+    fp = io.StringIO()
+    fp.write('{"timestamp":1675417312,"pbs_version":"2022.1.1",')
+    fp.write(f'"pbs_server":"pbs00","Jobs":{{"0[].pbs00":{json.dumps(parent)}')
+    for idx in range(1, count + 1):
+        if idx <= count // 2:
+            state = "R" if rng.random() < 0.01 else "X"
+        else:
+            state = "R" if idx <= count * 6 // 10 else "Q"
+        record = qstat_record(idx, rng)
+        record.update(job_state=state, array_id="0[].pbs00", array_index=idx)
+        fp.write(f',"0[{idx}].pbs00":{json.dumps(record)}')
+    fp.write("}}")
+    return fp.getvalue()
@@ -0,0 +1,197 @@
+"""
+Load driver firing concurrent qsub/qstat traffic at a running service, e.g.
+one backed by the fake toolchain of :mod:`benchmarks.fakepbs`.
+
+    $ python -m benchmarks.load http://localhost:5000 -u user -p pass \\
+        --concurrency 32 --duration 60 --mix qstat=8,qstat_list=1,qsub=1
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from base64 import b64encode
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+__all__ = ("Stats", "percentile", "run")
+
+_QSUB_BODY = {"name": "load", "queue": "workq", "submit_args": "-- /bin/sleep 60"}
+
+
+class Stats(NamedTuple):
+    requests: int
+    errors: int
+    throughput: float
+    p50: float
+    p95: float
+    p99: float
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """The nearest-rank percentile of already sorted values."""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[rank]
+
+
+class _Driver:
+    def __init__(self, url: str, auth: str, mix: dict[str, int], timeout: float):
+        self.url = url.rstrip("/")
+        self.headers = {"Authorization": f"Basic {auth}"}
+        self.ops, self.weights = zip(*mix.items())
+        self.timeout = timeout
+        self.job_ids: list[str] = []
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def request(self, method: str, path: str, body: Optional[dict] = None):
+        data, headers = None, dict(self.headers)
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(
+            f"{self.url}{path}", data=data, headers=headers, method=method
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            return json.loads(response.read() or "null")
+
+    def call(self, op: str, rng: random.Random):
+        if op == "qsub":
+            job_id = self.request("POST", "/pbs/qsub", _QSUB_BODY)["job_id"]
+            with self.lock:
+                self.job_ids.append(job_id)
+        elif op == "qstat":
+            with self.lock:
+                job_id = rng.choice(self.job_ids) if self.job_ids else "1"
+            try:
+                self.request("GET", f"/pbs/qstat/{job_id}")
+            except urllib.error.HTTPError as ex:
+                if ex.code != 404:
+                    raise
+        elif op == "qstat_list":
+            self.request("GET", "/pbs/qstat")
+        else:
+            raise ValueError(f"unknown operation '{op}'")
+
+    def worker(self, deadline: float, seed: int):
+        rng = random.Random(seed)
+        while time.monotonic() < deadline:
+            op = rng.choices(self.ops, weights=self.weights)[0]
+            start = time.perf_counter()
+            try:
+                self.call(op, rng)
+            except Exception:
+                with self.lock:
+                    self.errors[op] += 1
+                continue
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.latencies[op].append(elapsed)
+
+
+def run(
+    url: str,
+    username: str,
+    password: str,
+    concurrency: int = 8,
+    duration: float = 10.0,
+    mix: Optional[dict[str, int]] = None,
+    timeout: float = 60.0,
+) -> dict[str, Stats]:
+    """
+    Fire requests from ``concurrency`` threads for ``duration`` seconds and
+    get the stats per operation, along with their ``total``.
+    """
+    auth = b64encode(f"{username}:{password}".encode()).decode()
+    driver = _Driver(url, auth, mix or {"qstat": 8, "qsub": 1}, timeout=timeout)
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=driver.worker, args=(deadline, seed), daemon=True)
+        for seed in range(concurrency)
+    ]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    def stats(latencies: list[float], errors: int) -> Stats:
+        latencies = sorted(latencies)
+        return Stats(
+            requests=len(latencies) + errors,
+            errors=errors,
+            throughput=len(latencies) / elapsed,
+            p50=percentile(latencies, 50),
+            p95=percentile(latencies, 95),
+            p99=percentile(latencies, 99),
+        )
+
+    results = {
+        op: stats(driver.latencies[op], driver.errors[op])
+        for op in sorted(set(driver.latencies) | set(driver.errors))
+    }
+    results["total"] = stats(
+        [t for values in driver.latencies.values() for t in values],
+        sum(driver.errors.values()),
+    )
+    return results
+
+
+def _parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for item in value.split(","):
+        op, _, weight = item.partition("=")
+        mix[op] = int(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load", description="Load test a running service."
+    )
+    parser.add_argument("url", help="base URL of the API, application root included")
+    parser.add_argument("-u", "--username", required=True)
+    parser.add_argument("-p", "--password", required=True)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-d", "--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--mix",
+        type=_parse_mix,
+        default="qstat=8,qsub=1",
+        help="weights of the operations among qstat, qstat_list and qsub "
+        "(default: %(default)s)",
+    )
+    parser.add_argument("-o", "--output", help="file to store the results in")
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.url,
+        args.username,
+        args.password,
+        concurrency=args.concurrency,
+        duration=args.duration,
+        mix=args.mix,
+    )
+    print(f"{'op':<12}{'reqs':>8}{'errors':>8}{'req/s':>10}", end="")
+    print(f"{'p50':>10}{'p95':>10}{'p99':>10}")
+    for op, stats in results.items():
+        print(
+            f"{op:<12}{stats.requests:>8}{stats.errors:>8}{stats.throughput:>10.1f}"
+            f"{stats.p50 * 1e3:>8.1f}ms{stats.p95 * 1e3:>8.1f}ms"
+            f"{stats.p99 * 1e3:>8.1f}ms"
+        )
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump({op: s._asdict() for op, s in results.items()}, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
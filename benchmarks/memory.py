@@ -0,0 +1,107 @@
+"""
+Memory held per job by the snapshot cache, measured with ``tracemalloc``
+over a whole refresh of a ``QstatSnapshot``: its compact records along
+with the sorted table and indexes of the jobs. Jobs kept as ``JobStat``
+models, in a plain index, are measured as a reference.
+
+    $ python -m benchmarks.memory -n 100000 --target 1024
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import random
+import sys
+import tracemalloc
+from collections.abc import Callable, Iterator
+
+from benchmarks.generator import qstat_record
+from src.services.pbs import build_job
+from src.services.snapshot import QstatSnapshot
+
+__all__ = ("STORES", "measure")
+
+
+class _Sched:
+    """Scheduler listing the jobs of the given records, decoded as they go."""
+
+    def __init__(self, lines: list[str]):
+        self.lines = lines
+
+    def records(self) -> Iterator[tuple[str, dict]]:
+        for line in self.lines:
+            job_id, record = json.loads(line)
+            yield job_id, record
+
+
+def _jobstat(lines: list[str]) -> object:
+    return {
+        job_id: build_job(job_id, record) for job_id, record in _Sched(lines).records()
+    }
+
+
+def _snapshot(lines: list[str]) -> object:
+    snapshot = QstatSnapshot(sched=_Sched(lines))
+    snapshot.refresh()
+    return snapshot
+
+
+# how each store keeps the jobs of the given lines of records
+STORES: dict[str, Callable[[list[str]], object]] = {
+    "jobstat": _jobstat,
+    "snapshot": _snapshot,
+}
+
+
+def measure(store: str, count: int, seed: int = 0) -> float:
+    """
+    Bytes held per job by a store of ``count`` jobs. Each job is decoded
+    from its JSON inside the measure, so that whatever the store keeps of
+    it, e.g. its id, is accounted for.
+    """
+    rng = random.Random(seed)
+    lines = [
+        json.dumps([f"{idx}.pbs00", qstat_record(idx, rng)]) for idx in range(count)
+    ]
+    build = STORES[store]
+    build(lines[:1])  # warm up caches, e.g. field plans
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        held = build(lines)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del held
+    return size / count
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.memory",
+        description="Measure the memory held per job by the snapshot cache.",
+    )
+    parser.add_argument("-n", "--jobs", type=int, default=10000)
+    parser.add_argument(
+        "--target",
+        type=float,
+        help="fail if the snapshot takes more bytes per job than this",
+    )
+    args = parser.parse_args(argv)
+
+    results = {store: measure(store, args.jobs) for store in STORES}
+    for store, size in results.items():
+        print(f"{store:<10} {size:>10.0f} B/job {size * args.jobs / 2**20:>10.1f} MiB")
+    print(f"{'ratio':<10} {results['jobstat'] / results['snapshot']:>10.1f}x")
+    if args.target is not None and results["snapshot"] > args.target:
+        print(f"snapshot over the target of {args.target:.0f} B/job", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import collections
+import contextlib
+import io
+import itertools
+import platform
+import random
+import statistics
+import tempfile
+import time
+from base64 import b64encode
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import AbstractContextManager
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+from unittest import mock
+
+from benchmarks.generator import (
+    qstat_array_json,
+    qstat_json,
+    qstat_record,
+    write_qstat_json,
+)
+from src.models.job import JobStat, JobSubmit
+from src.services.executor import Executor
+from src.services.pbs import PBS
+from src.utils import build_extra, unflatten
+from src.utils.jsonstream import iter_items
+
+__all__ = ("BENCHMARKS", "Result", "compare", "report", "run")
+
+
+class Result(NamedTuple):
+    name: str
+    # items handled per call, e.g. jobs parsed
+    items: int
+    repeat: int
+    min: float
+    median: float
+    mean: float
+
+    @property
+    def per_item(self) -> float:
+        return self.median / self.items
+
+
+# benchmarks by name, each a context manager taking the job count and
+# yielding the callable to time along with how many items a call handles
+BENCHMARKS: dict[str, Callable[[int], AbstractContextManager]] = {}
+
+
+def benchmark(name: str):
+    def wrapper(func):
+        BENCHMARKS[name] = contextlib.contextmanager(func)
+        return func
+
+    return wrapper
+
+
+# distinct records cycled through, so that a million jobs take no more
+# memory than this many
+_POOL_SIZE = 1000
+
+
+def _records(count: int) -> Callable[[], Iterator[tuple[str, dict]]]:
+    """Iterators over ``count`` job records, generated once per pool entry."""
+    rng = random.Random(0)
+    pool = [
+        (f"{idx}.pbs00", qstat_record(idx, rng))
+        for idx in range(min(count, _POOL_SIZE))
+    ]
+    return lambda: itertools.islice(itertools.cycle(pool), count)
+
+
+def _consume(items: Iterable):
+    """Run through the items, keeping none of them."""
+    collections.deque(items, maxlen=0)
+
+
+@benchmark("jobstat_parse")
+def _jobstat_parse(count: int):
+    records = _records(count)
+    yield lambda: _consume(JobStat(job_id=k, **v) for k, v in records()), count
+
+
+@benchmark("qstat_stream")
+def _qstat_stream(count: int):
+    # read back from a file, as from a pipe, rather than held in memory
+    with tempfile.TemporaryFile("w+") as fp:
+        write_qstat_json(fp, count)
+
+        def call():
+            fp.seek(0)
+            _consume(iter_items(fp, key="Jobs"))
+
+        yield call, count
+
+
+@benchmark("unflatten")
+def _unflatten(count: int):
+    records = _records(count)
+    yield lambda: _consume(unflatten(JobStat, dict(v)) for _, v in records()), count
+
+
+@benchmark("build_extra")
+def _build_extra(count: int):
+    records = _records(count)
+    yield lambda: _consume(build_extra(JobStat, v) for _, v in records()), count
+
+
+@benchmark("to_argv")
+def _to_argv(count: int):
+    job = JobSubmit(
+        name="STDIN",
+        queue="workq",
+        submit_args="-- /bin/sleep 1000",
+        resources={"mem": "10gb", "cpu": 4, "node_count": 1, "walltime": "02:00:00"},
+        extra={
+            "priority": 0,
+            "account": "pbs_account",
+            "paths": {"stdout": "/tmp/STDIN.o1", "join_mode": "oe"},
+            "flags": {"rerunable": True, "copy_env": False},
+            "notify_on": {"to": ["user@email.com"], "on_finished": True},
+            "env": {"HOME": "/home/user", "SHELL": "/bin/bash"},
+        },
+    )
+    yield lambda: _consume(job.to_argv() for _ in range(count)), count
+
+
+@contextlib.contextmanager
+def _output(output: str) -> Iterator:
+    """Scheduler commands answering ``output``."""
+
+    @contextlib.contextmanager
+    def stream(self, cmd, timeout=None):
+        yield io.StringIO(output)
+
+    with mock.patch.object(Executor, "stream", stream), mock.patch.object(
+        Executor, "run", return_value=output
+    ):
+        yield
+
+
+@benchmark("qstat_array")
+def _qstat_array(count: int):
+    pbs = PBS(env={"EXEC_PATH": "/opt/pbs"})
+    with _output(qstat_array_json(count)):
+        yield lambda: pbs.qstat_array("0[].pbs00"), count
+
+
+@contextlib.contextmanager
+def _app(output: str) -> Iterator:
+    """A test client of the app, with scheduler commands answering ``output``."""
+    from src.app import create_app
+
+    with _output(output):
+        app = create_app(
+            environ="testing", configs={"SCHED_ENV": {"EXEC_PATH": "/opt/pbs"}}
+        )
+        yield app.test_client()
+
+
+@benchmark("startup")
+def _startup(count: int):
+    from src.app import create_app
+
+    def call():
+        for _ in range(count):
+            create_app(environ="testing")
+
+    yield call, count
+
+
+_AUTH = {"Authorization": f"Basic {b64encode(b'user:pass').decode()}"}
+
+
+@benchmark("api_qstat")
+def _api_qstat(count: int):
+    with _app(qstat_json(1)) as client:
+
+        def call():
+            for _ in range(count):
+                client.get("/pbs/qstat/0.pbs00", headers=_AUTH)
+
+        yield call, count
+
+
+@benchmark("api_qstat_list")
+def _api_qstat_list(count: int):
+    with _app(qstat_json(count)) as client:
+        yield lambda: client.get("/pbs/qstat", headers=_AUTH), count
+
+
+@benchmark("api_qsub")
+def _api_qsub(count: int):
+    body = {"name": "STDIN", "submit_args": "-- /bin/sleep 1000"}
+    with _app("0.pbs00") as client:
+
+        def call():
+            for _ in range(count):
+                client.post("/pbs/qsub", headers=_AUTH, json=body)
+
+        yield call, count
+
+
+def run(name: str, count: int, repeat: int = 5) -> Result:
+    with BENCHMARKS[name](count) as (func, items):
+        func()  # warm up caches, e.g. field plans and lazy imports
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return Result(
+        name=f"{name}[{count}]",
+        items=items,
+        repeat=repeat,
+        min=min(timings),
+        median=statistics.median(timings),
+        mean=statistics.fmean(timings),
+    )
+
+
+def report(results: list[Result]) -> dict:
+    """The results in the format they are stored and compared in."""
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "results": {r.name: {**r._asdict(), "per_item": r.per_item} for r in results},
+    }
+
+
+def compare(
+    current: dict, baseline: dict, threshold: float = 0.2
+) -> list[tuple[str, float]]:
+    """
+    Get the benchmarks whose median got slower than in the baseline by more
+    than ``threshold``, along with how much slower, e.g. 0.5 for 50%.
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        base: Optional[dict] = baseline["results"].get(name)
+        if base is None or not base["median"]:
+            continue
+        change = result["median"] / base["median"] - 1
+        if change > threshold:
+            regressions.append((name, change))
+    return regressions
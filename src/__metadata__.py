@@ -2,8 +2,11 @@ from importlib import metadata
 
 
 pkg_name = "jobsched-api"
-__title__: str = metadata.metadata(pkg_name)["name"]
-__description__: str = metadata.metadata(pkg_name)["summary"]
-__version__: str = metadata.metadata(pkg_name)["version"]
-__author__: str = metadata.metadata(pkg_name)["author"]
-__license__: str = metadata.metadata(pkg_name)["license"]
+
+# parsing the package metadata is not free, do it once
+_metadata = metadata.metadata(pkg_name)
+__title__: str = _metadata["name"]
+__description__: str = _metadata["summary"]
+__version__: str = _metadata["version"]
+__author__: str = _metadata["author"]
+__license__: str = _metadata["license"]
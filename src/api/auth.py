@@ -1,9 +1,10 @@
 from functools import wraps
 
-from flask import abort, g, request
+from flask import abort, current_app, g, request
 from werkzeug.local import LocalProxy
 
 from src.services.auth import AuthSvc
+from src.services.tracing import span
 
 
 # proxy to load username
@@ -24,10 +25,15 @@ def requires_auth(schemes=("basic",)):
         def decorated(*args, **kwargs):
             if "basic" in schemes:
                 auth = request.authorization
-                if auth and AuthSvc.authenticate(
-                    username=auth.username, password=auth.password
-                ):
+                with span("auth"):
+                    valid = auth and AuthSvc.authenticate(
+                        username=auth.username, password=auth.password
+                    )
+                if valid:
                     g.username = auth.username
+                    tracer = current_app.extensions.get("tracer")
+                    if tracer is not None:
+                        tracer.authorize(auth.username)
                     return func(*args, **kwargs)
             elif "bearer" in schemes:
                 raise NotImplementedError
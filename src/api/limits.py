@@ -0,0 +1,22 @@
+from functools import wraps
+
+from flask import current_app
+
+from src.api.auth import current_username
+
+
+def rate_limited(cost=1.0):
+    """Admit requests of the current user within the rate limits, if any.
+    Fail with a 429 telling when to retry otherwise."""
+
+    def wrapper(func):
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            limiter = current_app.extensions.get("sched_limiter")
+            if limiter is not None:
+                limiter.admit(current_username._get_current_object(), cost=cost)
+            return func(*args, **kwargs)
+
+        return decorated
+
+    return wrapper
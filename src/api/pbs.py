@@ -1,23 +1,168 @@
 from __future__ import annotations
 
+import itertools
 import json
+from datetime import datetime
+from typing import Optional
 
-from flask import abort, current_app, request
+from flask import Response, abort, current_app, request
 from flask.views import MethodView
 from pydantic import ValidationError
 from shell import CommandError
+from werkzeug.http import generate_etag
 from werkzeug.local import LocalProxy
 
-from src.api.auth import requires_auth
-from src.models.job import JobStat, JobSubmit
-from src.services.pbs import PBS
+from src.api.auth import current_username, requires_auth
+from src.api.limits import rate_limited
+from src.models.job import (
+    JobAlterBatch,
+    JobArrayStat,
+    JobStat,
+    JobStatus,
+    JobSubmit,
+)
+from src.services.events import (
+    JobEvents,
+    Subscription,
+    TooManySubscriptions,
+    job_changes,
+)
+from src.services.jobtable import decode_cursor, encode_cursor
+from src.services.pbs import JOB_ID_RE, PBS, QUEUE_RE
+from src.services.tracing import span
+from src.utils.encoding import compress, dumps, dumps_model, join_array
+from src.utils.ranges import parse_ranges
 
-# proxy to load PBS service
-_PBS = LocalProxy(lambda: PBS(env=current_app.config["SCHED_ENV"]))
+# proxy to load PBS service, acting on behalf of the current user
+_PBS = LocalProxy(
+    lambda: PBS(
+        env=current_app.config["SCHED_ENV"],
+        executor=current_app.extensions["sched_executor"],
+        broker=current_app.extensions.get("sched_broker"),
+        username=current_username._get_current_object(),
+        limiter=current_app.extensions.get("sched_limiter"),
+        coalescer=current_app.extensions.get("qstat_coalescer"),
+        ifl=current_app.extensions.get("sched_ifl"),
+        history=current_app.extensions.get("qstat_history"),
+    )
+)
+
+
+def _cache_headers(response: Response) -> Response:
+    response.cache_control.private = True
+    response.cache_control.must_revalidate = True
+    response.cache_control.max_age = current_app.config["QSTAT_CACHE_MAX_AGE"]
+    return response
+
+
+def _json_response(body: bytes, etag: Optional[str] = None) -> Response:
+    """
+    A response for an encoded JSON body, or a bodiless 304 if the client has
+    it already. Large bodies are gzipped for clients accepting it.
+    """
+    etag = etag or generate_etag(body)
+    min_size = current_app.config["JSON_GZIP_MIN_SIZE"]
+    gzipped = (
+        min_size is not None
+        and len(body) >= min_size
+        and "gzip" in request.accept_encodings
+    )
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        if gzipped:
+            with span("response.compress", size=len(body)):
+                body = compress(body)
+        response = current_app.response_class(body, mimetype="application/json")
+        if gzipped:
+            response.content_encoding = "gzip"
+
+    # the compressed body is equivalent, not identical, to the plain one
+    response.set_etag(etag, weak=gzipped)
+    response.vary.add("Accept-Encoding")
+    return _cache_headers(response)
+
+
+def _owned_only() -> bool:
+    """
+    Whether users may only see their own jobs. Commands run as users leave
+    it to the server, so the jobs of the snapshot are restricted the same.
+    """
+    return current_app.extensions.get("sched_broker") is not None
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventsAPI(MethodView):
+    @requires_auth(schemes=["basic"])
+    def get(self):
+        """
+        stream the state changes of jobs as server-sent events
+        ---
+        tags:
+            - PBS
+        security:
+            - BasicAuth: []
+        parameters:
+            - in: query
+              name: jobs
+              schema:
+                type: string
+              description: comma separated job ids, defaults to the user jobs
+        responses:
+            200:
+                content:
+                    text/event-stream:
+                        schema:
+                            type: string
+            401:
+            405:
+            503:
+        """
+        snapshot = current_app.extensions.get("qstat_snapshot")
+        events: None | JobEvents = current_app.extensions.get("job_events")
+        if snapshot is None or events is None:
+            abort(code=503, description="job events require the qstat snapshot")
+
+        jobs = request.args.get("jobs")
+        try:
+            sub = events.subscribe(
+                jobs=set(jobs.split(",")) if jobs else None,
+                owner=current_username._get_current_object(),
+                owned_only=_owned_only(),
+            )
+        except TooManySubscriptions as ex:
+            abort(code=503, description=str(ex))
+        keepalive = current_app.config["EVENTS_KEEPALIVE"]
+
+        # the current state first, changes from then on
+        initial = [
+            _sse("job", {"job_id": job_id, **job_changes(None, job.job())})
+            for job_id, job in snapshot.jobs().items()
+            if sub.matches(job_id, job)
+        ]
+
+        def stream(sub: Subscription):
+            try:
+                yield from initial
+                while not sub.overflow:
+                    event = sub.get(timeout=keepalive)
+                    yield ": keepalive\n\n" if event is None else _sse(*event)
+            finally:
+                events.unsubscribe(sub)
+
+        return Response(
+            stream(sub),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
 
 class QstatAPI(MethodView):
     @requires_auth(schemes=["basic"])
+    @rate_limited()
     def get(self, job_id):
         """
         get job stats given a search criteria
@@ -38,18 +183,270 @@ class QstatAPI(MethodView):
                 content:
                     application/json:
                         schema: JobStat
+            304:
+                description: the job did not change since the given ETag
             401:
             404:
             405:
         """
-        job: None | JobStat = _PBS.qstat(job_id)
-        if not job:
+        if not JOB_ID_RE.match(job_id):
             abort(code=404, description=f"job '{job_id}' not found")
-        return json.loads(job.json())
+        snapshot = current_app.extensions.get("qstat_snapshot")
+        owner = current_username._get_current_object() if _owned_only() else None
+        encoded = snapshot.encoded(job_id, owner=owner) if snapshot else None
+        if encoded is None:
+            # not in the snapshot (or stale, or not the user's to see there),
+            # ask the scheduler directly
+            job: None | JobStat = _PBS.qstat(job_id)
+            if not job:
+                abort(code=404, description=f"job '{job_id}' not found")
+            with span("response.encode"):
+                body = dumps_model(job)
+            return _json_response(body)
+        etag, body = encoded
+        return _json_response(body, etag=etag)
+
+
+class QstatArrayAPI(MethodView):
+    @requires_auth(schemes=["basic"])
+    @rate_limited()
+    def get(self, job_id):
+        """
+        summarize the states of the subjobs of an array job as ranges of
+        their indices
+        ---
+        tags:
+            - PBS
+        security:
+            - BasicAuth: []
+        parameters:
+            - in: path
+              name: job_id
+              schema:
+                type: string
+              required: True
+              description: the id of the array job, e.g. '12[].pbs00'
+            - in: query
+              name: indices
+              schema:
+                type: string
+              description: the subjobs to get in full, e.g. '1-10:2,15'
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema: JobArrayStat
+            304:
+                description: the array did not change since the given ETag
+            400:
+            401:
+            404:
+            405:
+        """
+        if not JOB_ID_RE.match(job_id):
+            abort(code=404, description=f"array job '{job_id}' not found")
+        indices = request.args.get("indices")
+        if indices:
+            max_size = current_app.config["QSTAT_ARRAY_MAX_SUBJOBS"]
+            try:
+                # stop short of expanding ranges larger than allowed
+                indices = set(itertools.islice(parse_ranges(indices), max_size + 1))
+            except ValueError as ex:
+                abort(code=400, description=str(ex))
+            if len(indices) > max_size:
+                abort(code=400, description=f"at most {max_size} subjobs in full")
+
+        array: None | JobArrayStat = _PBS.qstat_array(job_id, indices=indices or None)
+        if array is None:
+            abort(code=404, description=f"array job '{job_id}' not found")
+        with span("response.encode"):
+            body = dumps_model(array)
+        return _json_response(body)
+
+
+class QstatListAPI(MethodView):
+    @requires_auth(schemes=["basic"])
+    @rate_limited()
+    def get(self):
+        """
+        list the stats of the jobs matching a search criteria
+        ---
+        tags:
+            - PBS
+        security:
+            - BasicAuth: []
+        parameters:
+            - in: query
+              name: status
+              schema:
+                type: string
+              description: comma separated job statuses, e.g. 'R,Q'
+            - in: query
+              name: owner
+              schema:
+                type: string
+              description: the user owning the jobs
+            - in: query
+              name: queue
+              schema:
+                type: string
+              description: the queue the jobs are in
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema:
+                            type: array
+                            items: JobStat
+            304:
+                description: the jobs did not change since the given ETag
+            400:
+            401:
+            405:
+        """
+        status = request.args.get("status")
+        try:
+            statuses = [JobStatus(s) for s in status.split(",")] if status else None
+        except ValueError as ex:
+            abort(code=400, description=str(ex))
+        queue = request.args.get("queue")
+        if queue is not None and not QUEUE_RE.match(queue):
+            abort(code=400, description=f"invalid queue '{queue}'")
+
+        jobs: list[JobStat] = _PBS.qstat(
+            status=statuses,
+            owner=request.args.get("owner"),
+            queue=queue,
+        )
+        with span("response.encode", jobs=len(jobs)):
+            body = join_array(dumps_model(job) for job in jobs)
+        return _json_response(body)
+
+
+class JobsAPI(MethodView):
+    @requires_auth(schemes=["basic"])
+    @rate_limited()
+    def get(self):
+        """
+        page through the jobs of the snapshot matching a search criteria,
+        oldest first
+        ---
+        tags:
+            - PBS
+        security:
+            - BasicAuth: []
+        parameters:
+            - in: query
+              name: status
+              schema:
+                type: string
+              description: comma separated job statuses, e.g. 'R,Q'
+            - in: query
+              name: owner
+              schema:
+                type: string
+              description: the user owning the jobs
+            - in: query
+              name: queue
+              schema:
+                type: string
+              description: the queue the jobs are in
+            - in: query
+              name: created_after
+              schema:
+                type: string
+                format: date-time
+              description: the jobs created since then
+            - in: query
+              name: created_before
+              schema:
+                type: string
+                format: date-time
+              description: the jobs created before then
+            - in: query
+              name: limit
+              schema:
+                type: integer
+              description: the number of jobs per page
+            - in: query
+              name: cursor
+              schema:
+                type: string
+              description: the cursor of the page, as returned with the last one
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                jobs:
+                                    type: array
+                                    items: JobStat
+                                next:
+                                    type: string
+                                    description: the cursor of the next page
+            304:
+                description: the page did not change since the given ETag
+            400:
+            401:
+            403:
+            405:
+            503:
+        """
+        snapshot = current_app.extensions.get("qstat_snapshot")
+        table = snapshot.table() if snapshot else None
+        if table is None:
+            abort(code=503, description="job listings require a fresh qstat snapshot")
+
+        args = request.args
+        status = args.get("status")
+        cursor = args.get("cursor")
+        try:
+            statuses = [JobStatus(s) for s in status.split(",")] if status else None
+            created_after, created_before = (
+                datetime.fromisoformat(args[name]) if args.get(name) else None
+                for name in ("created_after", "created_before")
+            )
+            limit = int(args.get("limit", current_app.config["JOBS_PAGE_SIZE"]))
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as ex:
+            abort(code=400, description=str(ex))
+        max_size = current_app.config["JOBS_PAGE_MAX_SIZE"]
+        if not 0 < limit <= max_size:
+            abort(code=400, description=f"limit must be between 1 and {max_size}")
+
+        owner = args.get("owner")
+        if _owned_only():
+            # users only list their own jobs, as the scheduler would let them
+            username = current_username._get_current_object()
+            if owner and owner.split("@")[0] != username:
+                abort(code=403, description="only your own jobs may be listed")
+            owner = username
+
+        jobs, last = table.page(
+            owner=owner,
+            queue=args.get("queue"),
+            statuses=statuses,
+            created_after=created_after,
+            created_before=created_before,
+            after=after,
+            limit=limit,
+        )
+        with span("response.encode", jobs=len(jobs)):
+            body = (
+                b'{"jobs":'
+                + join_array(dumps_model(job.job()) for job in jobs)
+                + b',"next":'
+                + dumps(encode_cursor(last) if last else None)
+                + b"}"
+            )
+        return _json_response(body)
 
 
 class QsubAPI(MethodView):
     @requires_auth(schemes=["basic"])
+    @rate_limited()
     def post(self):
         """
         submit a job given its properties
@@ -85,3 +482,273 @@ class QsubAPI(MethodView):
             abort(code=400, description=ex.errors())
         except CommandError as ex:
             abort(code=400, description=str(ex))
+
+
+class QsubBatchAPI(MethodView):
+    @requires_auth(schemes=["basic"])
+    @rate_limited()
+    def post(self):
+        """
+        submit many jobs at once given their properties
+        ---
+        tags:
+            - PBS
+        security:
+            - BasicAuth: []
+        requestBody:
+            description: the properties of each job
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: array
+                        items: JobSubmit
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema:
+                            type: array
+                            items:
+                                type: object
+                                properties:
+                                    job_id:
+                                        type: string
+                                        description: the id of the submitted job
+                                    error:
+                                        type: string
+                                        description: the reason the job failed
+            400:
+            401:
+            405:
+        """
+        data = request.json
+        if not isinstance(data, list):
+            abort(code=400, description="expected a list of jobs")
+        max_size = current_app.config["QSUB_BATCH_MAX_SIZE"]
+        if len(data) > max_size:
+            abort(code=400, description=f"at most {max_size} jobs per batch")
+
+        # validate every job before submitting any
+        jobs, errors = [], []
+        for idx, obj in enumerate(data):
+            try:
+                jobs.append(JobSubmit.parse_obj(obj))
+            except ValidationError as ex:
+                errors.append({"index": idx, "errors": ex.errors()})
+        if errors:
+            abort(code=400, description=errors)
+
+        results = _PBS.qsub_many(jobs, workers=current_app.config["QSUB_BATCH_WORKERS"])
+        return [
+            {"error": str(ret)} if isinstance(ret, Exception) else {"job_id": ret}
+            for ret in results
+        ]
+
+
+def _job_ids() -> list[str]:
+    """The job ids of a job control request, aborting if not valid."""
+    data = request.json
+    job_ids = data.get("job_ids") if isinstance(data, dict) else None
+    if not isinstance(job_ids, list) or not all(
+        isinstance(job_id, str) for job_id in job_ids
+    ):
+        abort(code=400, description="expected a list of job ids")
+    invalid = [job_id for job_id in job_ids if not JOB_ID_RE.match(job_id)]
+    if invalid:
+        abort(code=400, description=f"invalid job ids: {', '.join(invalid)}")
+    max_size = current_app.config["JOB_CONTROL_MAX_SIZE"]
+    if len(job_ids) > max_size:
+        abort(code=400, description=f"at most {max_size} jobs per request")
+    return job_ids
+
+
+def _control_results(job_ids: list[str], results: list[Optional[Exception]]):
+    return [
+        {"job_id": job_id} if ex is None else {"job_id": job_id, "error": str(ex)}
+        for job_id, ex in zip(job_ids, results)
+    ]
+
+
+class QdelAPI(MethodView):
+    @requires_auth(schemes=["basic"])
+    @rate_limited()
+    def post(self):
+        """
+        delete many jobs at once given their ids
+        ---
+        tags:
+            - PBS
+        security:
+            - BasicAuth: []
+        requestBody:
+            description: the ids of the jobs
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: object
+                        properties:
+                            job_ids:
+                                type: array
+                                items:
+                                    type: string
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema:
+                            type: array
+                            items:
+                                type: object
+                                properties:
+                                    job_id:
+                                        type: string
+                                    error:
+                                        type: string
+                                        description: the reason the job failed
+            400:
+            401:
+            405:
+        """
+        job_ids = _job_ids()
+        workers = current_app.config["JOB_CONTROL_WORKERS"]
+        return _control_results(job_ids, _PBS.qdel(job_ids, workers=workers))
+
+
+class QholdAPI(MethodView):
+    @requires_auth(schemes=["basic"])
+    @rate_limited()
+    def post(self):
+        """
+        hold many jobs at once given their ids
+        ---
+        tags:
+            - PBS
+        security:
+            - BasicAuth: []
+        requestBody:
+            description: the ids of the jobs
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: object
+                        properties:
+                            job_ids:
+                                type: array
+                                items:
+                                    type: string
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema:
+                            type: array
+                            items:
+                                type: object
+                                properties:
+                                    job_id:
+                                        type: string
+                                    error:
+                                        type: string
+                                        description: the reason the job failed
+            400:
+            401:
+            405:
+        """
+        job_ids = _job_ids()
+        workers = current_app.config["JOB_CONTROL_WORKERS"]
+        return _control_results(job_ids, _PBS.qhold(job_ids, workers=workers))
+
+
+class QrlsAPI(MethodView):
+    @requires_auth(schemes=["basic"])
+    @rate_limited()
+    def post(self):
+        """
+        release the holds of many jobs at once given their ids
+        ---
+        tags:
+            - PBS
+        security:
+            - BasicAuth: []
+        requestBody:
+            description: the ids of the jobs
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: object
+                        properties:
+                            job_ids:
+                                type: array
+                                items:
+                                    type: string
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema:
+                            type: array
+                            items:
+                                type: object
+                                properties:
+                                    job_id:
+                                        type: string
+                                    error:
+                                        type: string
+                                        description: the reason the job failed
+            400:
+            401:
+            405:
+        """
+        job_ids = _job_ids()
+        workers = current_app.config["JOB_CONTROL_WORKERS"]
+        return _control_results(job_ids, _PBS.qrls(job_ids, workers=workers))
+
+
+class QalterAPI(MethodView):
+    @requires_auth(schemes=["basic"])
+    @rate_limited()
+    def post(self):
+        """
+        change the properties of many jobs at once given their ids
+        ---
+        tags:
+            - PBS
+        security:
+            - BasicAuth: []
+        requestBody:
+            description: the ids of the jobs and the properties to change
+            required: true
+            content:
+                application/json:
+                    schema: JobAlterBatch
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema:
+                            type: array
+                            items:
+                                type: object
+                                properties:
+                                    job_id:
+                                        type: string
+                                    error:
+                                        type: string
+                                        description: the reason the job failed
+            400:
+            401:
+            405:
+        """
+        job_ids = _job_ids()
+        try:
+            props = JobAlterBatch.parse_obj(request.json).changes
+        except ValidationError as ex:
+            abort(code=400, description=ex.errors())
+        if not props.to_argv():
+            abort(code=400, description="expected properties to change")
+        workers = current_app.config["JOB_CONTROL_WORKERS"]
+        return _control_results(job_ids, _PBS.qalter(job_ids, props, workers=workers))
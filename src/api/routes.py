@@ -1,4 +1,16 @@
-from src.api.pbs import QstatAPI, QsubAPI
+from src.api.pbs import (
+    EventsAPI,
+    JobsAPI,
+    QalterAPI,
+    QdelAPI,
+    QholdAPI,
+    QrlsAPI,
+    QstatAPI,
+    QstatArrayAPI,
+    QstatListAPI,
+    QsubAPI,
+    QsubBatchAPI,
+)
 
 from flask import Blueprint
 
@@ -7,8 +19,19 @@ def register_routes() -> Blueprint:
     index = Blueprint("index", __name__)
 
     api = Blueprint("pbs", __name__, url_prefix="/pbs")
+    api.add_url_rule("/events", view_func=EventsAPI.as_view("events"))
+    api.add_url_rule("/jobs", view_func=JobsAPI.as_view("jobs"))
+    api.add_url_rule("/qstat", view_func=QstatListAPI.as_view("qstat_list"))
     api.add_url_rule("/qstat/<job_id>", view_func=QstatAPI.as_view("qstat"))
+    api.add_url_rule(
+        "/qstat/<job_id>/array", view_func=QstatArrayAPI.as_view("qstat_array")
+    )
     api.add_url_rule("/qsub", view_func=QsubAPI.as_view("qsub"))
+    api.add_url_rule("/qsub/batch", view_func=QsubBatchAPI.as_view("qsub_batch"))
+    api.add_url_rule("/qdel", view_func=QdelAPI.as_view("qdel"))
+    api.add_url_rule("/qhold", view_func=QholdAPI.as_view("qhold"))
+    api.add_url_rule("/qrls", view_func=QrlsAPI.as_view("qrls"))
+    api.add_url_rule("/qalter", view_func=QalterAPI.as_view("qalter"))
 
     index.register_blueprint(api)
 
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import json
+import threading
+from collections.abc import Callable
+
+import click
+from apispec import APISpec
+from apispec_plugins import FlaskPlugin, PydanticPlugin
+from apispec_plugins.base.types import AuthSchemes, Server, Tag
+from apispec_plugins.utils import base_template
+from flask import current_app
+from flask.cli import with_appcontext
+
+from src import __description__, __title__, __version__
+
+__all__ = ("FileSpec", "LazySpec", "build_spec", "spec_command")
+
+
+def build_spec(app, views: list[Callable]) -> APISpec:
+    """Build the OpenAPI spec of the given views from their docstrings."""
+    url_prefix = app.config["APPLICATION_ROOT"]
+    openapi_version = app.config["OPENAPI"]
+
+    spec_template = base_template(
+        openapi_version=openapi_version,
+        info={
+            "title": __title__,
+            "version": __version__,
+            "description": __description__,
+        },
+        servers=[Server(url=url_prefix)],
+        auths=[AuthSchemes.BasicAuth()],
+        tags=[
+            Tag(
+                name="PBS",
+                description="Operations on the PBS scheduler",
+            ),
+        ],
+    )
+
+    spec = APISpec(
+        title=__title__,
+        version=__version__,
+        openapi_version=openapi_version,
+        plugins=(FlaskPlugin(), PydanticPlugin()),
+        **spec_template,
+    )
+
+    # create paths from app views
+    for view in views:
+        spec.path(view=view, app=app, base_path=url_prefix)
+    return spec
+
+
+class LazySpec:
+    """
+    Stand-in for an ``APISpec``, built the first time it is asked for rather
+    than when the app starts, since parsing every view docstring is the
+    bulk of the startup time.
+    """
+
+    def __init__(self, build: Callable[[], APISpec]):
+        self._build = build
+        self._dict = None
+        self._lock = threading.Lock()
+
+    def to_dict(self) -> dict:
+        if self._dict is None:
+            with self._lock:
+                if self._dict is None:
+                    self._dict = self._build().to_dict()
+        return self._dict
+
+
+class FileSpec:
+    """
+    An OpenAPI spec precomputed with ``flask spec``. It must have been
+    generated with the same ``APPLICATION_ROOT`` and ``OPENAPI`` settings.
+    """
+
+    def __init__(self, path: str):
+        with open(path) as fp:
+            self._dict = json.load(fp)
+
+    def to_dict(self) -> dict:
+        return self._dict
+
+
+@click.command("spec")
+@click.option("-o", "--output", type=click.File("w"), default="-")
+@with_appcontext
+def spec_command(output):
+    """Write the OpenAPI spec of the app as JSON."""
+    # the spec holds dataclasses, which the app JSON provider knows about
+    spec = current_app.extensions["openapi_spec"].to_dict()
+    output.write(current_app.json.dumps(spec, indent=2))
+    output.write("\n")
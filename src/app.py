@@ -1,13 +1,26 @@
-from apispec import APISpec
-from apispec_plugins import FlaskPlugin, PydanticPlugin
-from apispec_plugins.base.types import AuthSchemes, Server, Tag
-from apispec_plugins.utils import base_template
+import atexit
+import os
+import tempfile
+import time
+
 from apispec_ui.flask import Swagger
-from flask import Flask
+from flask import Flask, g, request
 from flask_cors import CORS
 
-from src import __description__, __title__, __version__
 from src.api.routes import register_routes
+from src.api.spec import FileSpec, LazySpec, build_spec, spec_command
+from src.services.auth import AuthSvc, CredentialCache
+from src.services.broker import Broker
+from src.services.coalesce import Coalescer
+from src.services.events import JobEvents
+from src.services.executor import Executor
+from src.services.history import JobHistory
+from src.services.ifl import IFL, ConnectionPool, munge_auth
+from src.services.limits import Limiter
+from src.services.metrics import metrics
+from src.services.pbs import PBS
+from src.services.snapshot import QstatSnapshot
+from src.services.tracing import Tracer
 from src.settings.ctx import ctx_settings
 from src.settings.config import settings_class, swagger_configs
 
@@ -29,42 +42,203 @@ def setup_app(app):
     CORS(app)  # enable CORS
 
     url_prefix = app.config["APPLICATION_ROOT"]
-    openapi_version = app.config["OPENAPI"]
 
     # route wiring
     app.register_blueprint(register_routes(), url_prefix=url_prefix)
 
-    spec_template = base_template(
-        openapi_version=openapi_version,
-        info={
-            "title": __title__,
-            "version": __version__,
-            "description": __description__,
-        },
-        servers=[Server(url=url_prefix)],
-        auths=[AuthSchemes.BasicAuth()],
-        tags=[
-            Tag(
-                name="PBS",
-                description="Operations on the PBS scheduler",
-            ),
-        ],
-    )
-
-    spec = APISpec(
-        title=__title__,
-        version=__version__,
-        openapi_version=openapi_version,
-        plugins=(FlaskPlugin(), PydanticPlugin()),
-        **spec_template
-    )
-
-    # create paths from app views
-    for view in app.view_functions.values():
-        spec.path(view=view, app=app, base_path=url_prefix)
+    # the spec covers the API views only, not the ones added below
+    views = list(app.view_functions.values())
+    spec_file = app.config["OPENAPI_SPEC_FILE"]
+    if spec_file:
+        spec = FileSpec(spec_file)
+    elif app.config["OPENAPI_LAZY"]:
+        spec = LazySpec(lambda: build_spec(app, views))
+    else:
+        spec = build_spec(app, views)
+    app.extensions["openapi_spec"] = spec
+    app.cli.add_command(spec_command)
 
     # create views for Swagger
     Swagger(app=app, apispec=spec, config=swagger_configs(app_root=url_prefix))
 
+    # instrumentation
+    setup_metrics(app)
+    setup_tracing(app)
+
+    # credentials verification
+    setup_auth(app)
+
+    # scheduler background services
+    setup_sched(app)
+
     # settings within app ctx
     ctx_settings(app)
+
+
+_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds",
+    "Time taken to answer requests, by endpoint and status code.",
+    labels=("endpoint", "method", "status"),
+)
+
+
+def setup_metrics(app):
+    if not app.config["METRICS"]:
+        return
+    metrics.configure(
+        directory=app.config["METRICS_DIR"],
+        flush_interval=app.config["METRICS_FLUSH_INTERVAL"],
+    )
+    if metrics.directory is not None:
+        atexit.register(metrics.flush)
+
+    @app.before_request
+    def start_timer():
+        g.started_at = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started_at = g.pop("started_at", None)
+        if started_at is not None:
+            _REQUEST_SECONDS.observe(
+                time.perf_counter() - started_at,
+                endpoint=request.endpoint or "",
+                method=request.method,
+                status=response.status_code,
+            )
+        return response
+
+    url_prefix = app.config["APPLICATION_ROOT"].rstrip("/")
+    app.add_url_rule(
+        f"{url_prefix}/metrics",
+        "metrics",
+        view_func=lambda: app.response_class(
+            metrics.render(), mimetype="text/plain; version=0.0.4"
+        ),
+    )
+
+
+def setup_tracing(app):
+    if not app.config["TRACING"]:
+        return
+    tracer = Tracer(
+        path=app.config["TRACING_FILE"],
+        users=tuple(app.config["TRACING_USERS"]),
+        profile_rate=app.config["TRACING_PROFILE_RATE"],
+    )
+    app.extensions["tracer"] = tracer
+    header = app.config["TRACING_HEADER"]
+
+    @app.before_request
+    def start_trace():
+        value = request.headers.get(header)
+        if value:
+            name = f"{request.method} {request.path}"
+            g.trace_token = tracer.start(name, profile=value == "profile")
+
+    @app.after_request
+    def finish_trace(response):
+        token = g.pop("trace_token", None)
+        if token is not None:
+            trace = tracer.finish(
+                token,
+                endpoint=request.endpoint,
+                status=response.status_code,
+                username=g.get("username"),
+            )
+            if trace is not None:
+                response.headers["X-Trace-Id"] = trace.id
+        return response
+
+
+def setup_auth(app):
+    cache = None
+    if app.config["AUTH_CACHE"]:
+        cache = CredentialCache(
+            ttl=app.config["AUTH_CACHE_TTL"],
+            negative_ttl=app.config["AUTH_CACHE_NEGATIVE_TTL"],
+            max_size=app.config["AUTH_CACHE_MAX_SIZE"],
+            max_failures=app.config["AUTH_CACHE_MAX_FAILURES"],
+        )
+    AuthSvc.cache = cache
+
+
+def setup_sched(app):
+    # shared by every scheduler command spawned within this process
+    executor = Executor(
+        max_procs=app.config["SCHED_EXEC_MAX_PROCS"],
+        timeout=app.config["SCHED_EXEC_TIMEOUT"],
+        queue_timeout=app.config["SCHED_EXEC_QUEUE_TIMEOUT"],
+    )
+    app.extensions["sched_executor"] = executor
+
+    if app.config["SCHED_LIMITS"]:
+        directory = app.config["SCHED_LIMITS_DIR"] or os.path.join(
+            tempfile.gettempdir(), "jobsched-limits"
+        )
+        app.extensions["sched_limiter"] = Limiter(
+            directory=directory,
+            user_rate=app.config["SCHED_LIMITS_USER_RATE"],
+            user_burst=app.config["SCHED_LIMITS_USER_BURST"],
+            global_rate=app.config["SCHED_LIMITS_GLOBAL_RATE"],
+            global_burst=app.config["SCHED_LIMITS_GLOBAL_BURST"],
+            user_max_inflight=app.config["SCHED_LIMITS_USER_MAX_INFLIGHT"],
+            max_inflight=app.config["SCHED_LIMITS_MAX_INFLIGHT"],
+            inflight_wait=app.config["SCHED_LIMITS_INFLIGHT_WAIT"],
+        )
+
+    ifl = None
+    if app.config["SCHED_TRANSPORT"] == "ifl":
+        pool = ConnectionPool(
+            host=app.config["SCHED_IFL_HOST"] or app.config["SCHED_ENV"]["SERVER"],
+            port=app.config["SCHED_IFL_PORT"],
+            size=app.config["SCHED_IFL_POOL_SIZE"],
+            timeout=app.config["SCHED_IFL_TIMEOUT"],
+            auth=munge_auth if app.config["SCHED_IFL_AUTH"] == "munge" else None,
+        )
+        atexit.register(pool.close)
+        ifl = app.extensions["sched_ifl"] = IFL(pool)
+
+    history = None
+    if app.config["QSTAT_HISTORY"]:
+        history = app.extensions["qstat_history"] = JobHistory(
+            path=app.config["QSTAT_HISTORY_FILE"],
+            max_age=app.config["QSTAT_HISTORY_MAX_AGE"],
+        )
+
+    if app.config["QSTAT_COALESCE"]:
+        app.extensions["qstat_coalescer"] = Coalescer(
+            window=app.config["QSTAT_COALESCE_WINDOW"],
+            directory=app.config["QSTAT_COALESCE_DIR"],
+        )
+
+    if app.config["SCHED_BROKER"]:
+        broker = Broker(
+            executor=executor,
+            max_helpers=app.config["SCHED_BROKER_MAX_HELPERS"],
+            idle_timeout=app.config["SCHED_BROKER_IDLE_TIMEOUT"],
+            helpers_per_user=app.config["SCHED_BROKER_HELPERS_PER_USER"],
+        )
+        atexit.register(broker.close)
+        app.extensions["sched_broker"] = broker
+
+    if app.config["QSTAT_SNAPSHOT"]:
+        snapshot = QstatSnapshot(
+            sched=PBS(
+                env=app.config["SCHED_ENV"],
+                executor=executor,
+                ifl=ifl,
+                history=history,
+            ),
+            interval=app.config["QSTAT_SNAPSHOT_INTERVAL"],
+            max_age=app.config["QSTAT_SNAPSHOT_MAX_AGE"],
+            cache_size=app.config["QSTAT_SNAPSHOT_CACHE_SIZE"],
+        )
+        events = JobEvents(
+            max_pending=app.config["EVENTS_MAX_PENDING"],
+            max_subscriptions=app.config["EVENTS_MAX_STREAMS"],
+        )
+        snapshot.listeners.append(events.publish)
+        snapshot.start()
+        app.extensions["qstat_snapshot"] = snapshot
+        app.extensions["job_events"] = events
@@ -1,7 +1,9 @@
+import re
+import shlex
 from abc import ABC, abstractmethod
-from copy import deepcopy
 from datetime import datetime
 from enum import Enum
+from functools import lru_cache
 from typing import Any, Optional
 
 from apispec_plugins import BaseModel
@@ -21,6 +23,8 @@ class JobStatus(Enum):
     TRANSFER = "T"
     WAIT = "W"
     SUSPEND = "S"
+    # subjobs of array jobs done with, deleted ones included
+    EXPIRED = "X"
 
 
 class JobBaseModel(BaseModel, ABC, allow_population_by_field_name=True):
@@ -62,6 +66,39 @@ class JobResourcesType(BaseModel):
     used: Optional[JobResources] = Field(None, alias="resources_used")
 
 
+_DATE_FORMAT = "%a %b %d %H:%M:%S %Y"
+_MONTHS = {
+    month: idx
+    for idx, month in enumerate(
+        ("Jan", "Feb", "Mar", "Apr", "May", "Jun")
+        + ("Jul", "Aug", "Sep", "Oct", "Nov", "Dec"),
+        start=1,
+    )
+}
+_DATE_RE = re.compile(
+    r"(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)\s+"
+    rf"({'|'.join(_MONTHS)})\s+"
+    r"(\d{1,2})\s+(\d{1,2}):(\d{1,2}):(\d{1,2})\s+(\d{4})"
+)
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value: str) -> datetime:
+    """Parse a PBS date, e.g. 'Fri Feb 3 10:41:52 2023'."""
+    match = _DATE_RE.fullmatch(value)
+    if match:
+        month, day, hour, minute, second, year = match.groups()
+        try:
+            return datetime(
+                int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second)
+            )
+        except ValueError:
+            pass
+
+    # leave whatever is unusual to strptime, errors included
+    return datetime.strptime(value, _DATE_FORMAT)
+
+
 class JobTimeline(BaseModel):
     created_at: Optional[datetime] = Field(None, alias="ctime")
     updated_at: Optional[datetime] = Field(None, alias="mtime")
@@ -69,8 +106,10 @@ class JobTimeline(BaseModel):
     ready_at: Optional[datetime] = Field(None, alias="etime")
 
     @validator("*", pre=True)
-    def parse_date(cls, value):
-        return datetime.strptime(value, "%a %b %d %H:%M:%S %Y")
+    def parse_dates(cls, value):
+        if not isinstance(value, str):
+            return datetime.strptime(value, _DATE_FORMAT)
+        return parse_date(value)
 
 
 class JobPaths(JobBaseModel):
@@ -227,7 +266,7 @@ class JobStat(Job, JobExtra):
 
     @root_validator(pre=True)
     def extra_fields(cls, values: dict[str, Any]) -> dict[str, Any]:
-        values["extra"] = build_extra(cls, deepcopy(values))
+        values["extra"] = build_extra(cls, values)
         return values
 
 
@@ -252,3 +291,63 @@ class JobSubmit(Job):
     def to_qsub(self):
         args = self.parse_args()
         return " ".join((" " if len(arg) > 1 else "").join(arg) for arg in args)
+
+    def to_argv(self) -> list[str]:
+        """The qsub arguments, one token per option and value."""
+        argv = []
+        for arg in self.parse_args():
+            if arg[0] == "--":
+                # the job command line is split the way a shell would
+                argv += ["--", *shlex.split(arg[1])]
+            else:
+                argv += arg
+        return argv
+
+
+class JobAlter(JobBaseModel):
+    """The attributes of submitted jobs that can be changed."""
+
+    name: Optional[str] = Field(None, alias="Job_Name")
+    resources: Optional[JobResources] = None
+    priority: Optional[int] = Field(None, alias="Priority")
+    account: Optional[str] = Field(None, alias="Account_Name")
+    project: Optional[str] = None
+
+    def parse_args(self):
+        args = []
+        if self.name is not None:
+            args.append(("-N", self.name))
+        if self.resources is not None:
+            args += self.resources.parse_args()
+        if self.priority is not None:
+            args.append(("-p", str(self.priority)))
+        if self.account is not None:
+            args.append(("-A", self.account))
+        if self.project is not None:
+            args.append(("-P", self.project))
+        return args
+
+    def to_argv(self) -> list[str]:
+        """The qalter arguments, one token per option and value."""
+        return [token for arg in self.parse_args() for token in arg]
+
+
+class JobAlterBatch(BaseModel):
+    """The properties to change of many jobs at once."""
+
+    job_ids: list[str]
+    changes: JobAlter
+
+
+class JobArrayStat(BaseModel):
+    """The states of the subjobs of an array job, as ranges of their indices."""
+
+    job_id: str
+    status: Optional[JobStatus] = None
+    array_range: Optional[str] = None
+    total: int = 0
+    # per subjob state, e.g. 'X' for the expired ones
+    counts: dict[str, int] = {}
+    ranges: dict[str, str] = {}
+    # the subjobs asked for in full
+    subjobs: Optional[list[JobStat]] = None
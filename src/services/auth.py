@@ -1,7 +1,123 @@
-__all__ = ("AuthSvc",)
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from src.services.metrics import metrics
+
+__all__ = ("AuthSvc", "CredentialCache")
+
+_AUTH_SECONDS = metrics.histogram(
+    "auth_duration_seconds",
+    "Time taken to verify credentials, by whether the cache answered.",
+    labels=("cache",),
+)
+
+
+class CredentialCache:
+    """
+    Cache of credential verifications, keyed by a salted hash of the
+    username and password so that no password is kept around.
+    Successful and failed verifications expire after their own TTL and the
+    least recently used entries are dropped once the cache is full. Counts
+    of failures per user are kept and bounded the same way, expiring along
+    with the successful verifications they may void.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        negative_ttl: float = 30.0,
+        max_size: int = 10000,
+        max_failures: int = 3,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.max_failures = max_failures
+        self._salt = os.urandom(16)
+        self._entries: OrderedDict[bytes, tuple[str, bool, float]] = OrderedDict()
+        self._failures: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username: str, password: str) -> Optional[bool]:
+        """Get a cached verification, if any."""
+        key = self._key(username, password)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            _, valid, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return valid
+
+    def put(self, username: str, password: str, valid: bool):
+        ttl = self.ttl if valid else self.negative_ttl
+        with self._lock:
+            if valid:
+                self._failures.pop(username, None)
+            else:
+                # repeated failures may get the account locked by the
+                # directory, so stop vouching for any password of that user
+                now = time.monotonic()
+                failures, expires_at = self._failures.get(username, (0, now))
+                failures = 1 if expires_at <= now else failures + 1
+                self._failures[username] = (failures, now + self.ttl)
+                self._failures.move_to_end(username)
+                while len(self._failures) > self.max_size:
+                    self._failures.popitem(last=False)
+                if failures >= self.max_failures:
+                    self._invalidate(username)
+
+            if ttl > 0:
+                key = self._key(username, password)
+                self._entries[key] = (username, valid, time.monotonic() + ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        """Forget every successful verification of the given user."""
+        with self._lock:
+            self._invalidate(username)
+
+    def _invalidate(self, username: str):
+        for key, (name, valid, _) in list(self._entries.items()):
+            if name == username and valid:
+                del self._entries[key]
+
+    def _key(self, username: str, password: str) -> bytes:
+        data = b"\0".join((username.encode(), password.encode()))
+        return hashlib.blake2b(data, key=self._salt, digest_size=32).digest()
 
 
 class AuthSvc:
+    # cache of verifications, if any
+    cache: Optional[CredentialCache] = None
+
+    @classmethod
+    def authenticate(cls, username, password):
+        cache = cls.cache
+        with _AUTH_SECONDS.time(cache="miss") as labels:
+            if cache is not None:
+                valid = cache.get(username, password)
+                if valid is not None:
+                    labels["cache"] = "hit"
+                    return valid
+
+            valid = cls.verify(username=username, password=password)
+            if cache is not None:
+                cache.put(username, password, valid)
+            return valid
+
     @staticmethod
-    def authenticate(username, password):
+    def verify(username, password):
+        """Verify the credentials against the identity backend."""
         return True
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Optional
+
+from impersonation import utils as pw
+
+from src.services.executor import CommandTimeout, Executor
+
+__all__ = ("Broker", "UnknownUser")
+
+_CHUNK_SIZE = 1 << 16
+
+# extra time given to a helper to answer after its command timed out
+_GRACE = 5.0
+
+
+class UnknownUser(PermissionError):
+    """Thrown when a user has no account to run commands as."""
+
+
+def _serve(conn, username: str, uid: int, gid: int):
+    """Helper process loop, running commands on behalf of a single user."""
+    try:
+        if os.getuid() != uid:
+            os.initgroups(username, gid)
+            os.setgid(gid)
+            os.setuid(uid)
+    except PermissionError as ex:
+        message = f"running as '{username}' requires root or CAP_SETUID/CAP_SETGID"
+        conn.send(("error", PermissionError(f"{message}: {ex}")))
+        return
+    except Exception as ex:
+        conn.send(("error", ex))
+        return
+    conn.send(("ready", None))
+
+    # timeouts come along with each command
+    executor = Executor(max_procs=1, timeout=None)
+    while True:
+        try:
+            op, argv, cmd_timeout = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        try:
+            if op == "run":
+                conn.send(("ok", executor.run(argv, timeout=cmd_timeout)))
+            else:
+                with executor.stream(argv, timeout=cmd_timeout) as fp:
+                    while True:
+                        chunk = fp.read(_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        conn.send(("chunk", chunk))
+                conn.send(("end", None))
+        except Exception as ex:
+            conn.send(("error", ex))
+
+
+class _Helper:
+    def __init__(self, ctx, username: str):
+        try:
+            uid, gid = pw.pw_pair(username=username)
+        except KeyError:
+            raise UnknownUser(f"no account to run commands as '{username}'") from None
+        self.username = username
+        self.lock = threading.Lock()
+        self.used_at = time.monotonic()
+        self.busy = False
+        self.closed = False
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(
+            target=_serve,
+            args=(child_conn, username, uid, gid),
+            name=f"pbs-helper-{username}",
+            daemon=True,
+        )
+        self.proc.start()
+        child_conn.close()
+
+        status, err = self.recv(timeout=30)
+        if status != "ready":
+            self.close()
+            raise err
+
+    def send(self, op: str, argv: list[str], timeout: Optional[float]):
+        self.used_at = time.monotonic()
+        self.busy = True
+        self.conn.send((op, argv, timeout))
+
+    def recv(self, timeout: Optional[float]):
+        wait = None if timeout is None else timeout + _GRACE
+        if not self.conn.poll(wait):
+            raise CommandTimeout(f"helper for '{self.username}' stopped answering")
+        status, data = self.conn.recv()
+        if status != "chunk":
+            self.busy = False
+        return status, data
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+        self.proc.join(timeout=1)
+        if self.proc.is_alive():
+            self.proc.kill()
+            self.proc.join()
+
+
+class _Reader:
+    """File-like reader over the output chunks sent by a helper."""
+
+    def __init__(self, helper: _Helper, timeout: Optional[float]):
+        self.helper = helper
+        self.timeout = timeout
+        self.buf = ""
+        self.done = False
+
+    def read(self, size: int = -1) -> str:
+        while not self.done and (size < 0 or len(self.buf) < size):
+            status, data = self.helper.recv(timeout=self.timeout)
+            if status == "chunk":
+                self.buf += data
+            elif status == "end":
+                self.done = True
+            else:
+                self.done = True
+                raise data
+        if size < 0:
+            size = len(self.buf)
+        data, self.buf = self.buf[:size], self.buf[size:]
+        return data
+
+
+class Broker:
+    """
+    Pool of long-lived helper processes, a few per user, each running with
+    the credentials of its user. Commands are sent to them over a pipe, so
+    that resolving and switching to a user happens once per helper rather
+    than once per command. A helper runs one command at a time, and up to
+    ``helpers_per_user`` are started for the commands of a user to run in
+    parallel. Helpers of the least recently served users are stopped when
+    the pool is full, and idle ones after a while.
+
+    Switching users requires running as root, or with the CAP_SETUID and
+    CAP_SETGID capabilities.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        max_helpers: int = 32,
+        idle_timeout: Optional[float] = 300.0,
+        helpers_per_user: int = 4,
+    ):
+        self.executor = executor
+        self.max_helpers = max_helpers
+        self.idle_timeout = idle_timeout
+        self.helpers_per_user = helpers_per_user
+        self._ctx = multiprocessing.get_context("spawn")
+        self._helpers: OrderedDict[str, list[_Helper]] = OrderedDict()
+        self._lock = threading.Lock()
+        # helpers being started per user, waited on once a user has no room
+        self._starting: dict[str, int] = {}
+        self._started = threading.Condition(self._lock)
+
+    def run(
+        self, username: str, argv: list[str], timeout: Optional[float] = None
+    ) -> str:
+        """Run a command as the given user and return its output."""
+        timeout = self.executor.timeout if timeout is None else timeout
+        with self.executor.slot(), self._helper(str(username)) as helper:
+            helper.send("run", argv, timeout)
+            status, data = helper.recv(timeout=timeout)
+        if status == "error":
+            raise data
+        return data
+
+    @contextmanager
+    def stream(
+        self, username: str, argv: list[str], timeout: Optional[float] = None
+    ) -> Iterator[_Reader]:
+        """Run a command as the given user, streaming its output."""
+        timeout = self.executor.timeout if timeout is None else timeout
+        with self.executor.slot(), self._helper(str(username)) as helper:
+            helper.send("stream", argv, timeout)
+            reader = _Reader(helper, timeout=timeout)
+            yield reader
+
+            # drain whatever was left unread
+            while reader.read(_CHUNK_SIZE):
+                pass
+
+    def close(self):
+        with self._lock:
+            helpers, self._helpers = list(self._helpers.values()), OrderedDict()
+        for helper in itertools.chain.from_iterable(helpers):
+            helper.close()
+
+    @contextmanager
+    def _helper(self, username: str) -> Iterator[_Helper]:
+        while True:
+            helper = self._checkout(username)
+            if not helper.closed:
+                break
+            # evicted in the meantime
+            helper.lock.release()
+
+        try:
+            yield helper
+        except BaseException:
+            # a helper halfway through a reply can't take new requests
+            if helper.busy:
+                self._discard(helper)
+            raise
+        finally:
+            helper.lock.release()
+
+    def _checkout(self, username: str) -> _Helper:
+        """
+        A helper of the user, locked for a command: a free one if any, else
+        a new one if the user has room for more, else the next one in turn
+        once it is done.
+        """
+        stale, free, busy = [], None, None
+        with self._started:
+            while True:
+                helpers = self._helpers.get(username, [])
+                stale.extend(h for h in helpers if not h.proc.is_alive())
+                helpers = [h for h in helpers if h.proc.is_alive()]
+                if helpers:
+                    self._helpers[username] = helpers
+                    self._helpers.move_to_end(username)
+                else:
+                    self._helpers.pop(username, None)
+
+                free = next((h for h in helpers if h.lock.acquire(False)), None)
+                starting = self._starting.get(username, 0)
+                if free is not None:
+                    break
+                if len(helpers) + starting < self.helpers_per_user:
+                    self._starting[username] = starting + 1
+                    break
+                if helpers:
+                    # all busy, queue up on them in turn
+                    busy = helpers.pop(0)
+                    helpers.append(busy)
+                    break
+                # the helpers of the user are all being started
+                self._started.wait()
+        self._close(stale)
+        if free is not None:
+            return free
+        if busy is not None:
+            busy.lock.acquire()
+            return busy
+
+        # switching users is slow, do it without holding up everyone else
+        try:
+            helper = _Helper(self._ctx, username)
+            helper.lock.acquire()
+        finally:
+            with self._started:
+                self._starting[username] -= 1
+                if not self._starting[username]:
+                    del self._starting[username]
+                self._started.notify_all()
+
+        stale = []
+        with self._lock:
+            self._helpers.setdefault(username, []).append(helper)
+            self._helpers.move_to_end(username)
+
+            if self.idle_timeout is not None:
+                idle_since = time.monotonic() - self.idle_timeout
+                for name, others in list(self._helpers.items()):
+                    idle = [
+                        other
+                        for other in others
+                        if other is not helper and other.used_at < idle_since
+                    ]
+                    stale.extend(idle)
+                    self._remove(name, idle)
+            while sum(map(len, self._helpers.values())) > self.max_helpers:
+                name, others = next(iter(self._helpers.items()))
+                oldest = next((other for other in others if other is not helper), None)
+                if oldest is None:
+                    break
+                stale.append(oldest)
+                self._remove(name, [oldest])
+        self._close(stale)
+        return helper
+
+    def _remove(self, username: str, helpers: list[_Helper]):
+        """Take helpers of a user out of the pool, holding its lock."""
+        remaining = [
+            helper
+            for helper in self._helpers.get(username, [])
+            if helper not in helpers
+        ]
+        if remaining:
+            self._helpers[username] = remaining
+        else:
+            self._helpers.pop(username, None)
+
+    @staticmethod
+    def _close(helpers: list[_Helper]):
+        for helper in helpers:
+            with helper.lock:
+                helper.close()
+
+    def _discard(self, helper: _Helper):
+        with self._lock:
+            self._remove(helper.username, [helper])
+        helper.close()
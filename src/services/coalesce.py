@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from typing import Any, Optional, TypeVar
+
+from src.services.metrics import metrics
+
+__all__ = ("Coalescer",)
+
+T = TypeVar("T")
+
+_COALESCED = metrics.counter(
+    "sched_coalesced_total",
+    "Lookups answered by the one of a concurrent or recent caller, by scope.",
+    labels=("scope",),
+)
+
+# lock files shared by the keys across workers, bounding how many exist
+_STRIPES = 256
+
+# seconds between removals of the outdated results of the workers
+_SWEEP_INTERVAL = 60.0
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.finished_at: Optional[float] = None
+
+
+class Coalescer:
+    """
+    Single flight of identical lookups: concurrent callers of a key share
+    the one of the first, and its result is reused for ``window`` seconds
+    after it completes. With a directory, the workers of a host share the
+    lookups as well, through lock files and the results they write there;
+    without one, only the threads of a process do, which single threaded
+    workers never have at once.
+    """
+
+    def __init__(self, window: float = 0.0, directory: Optional[str] = None):
+        self.window = window
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._pruned_at = self._swept_at = time.monotonic()
+
+    def do(
+        self,
+        key: str,
+        fetch: Callable[[], Any],
+        build: Callable[[Any], T] = lambda value: value,
+    ) -> T:
+        """
+        Get the value of a key, built from what ``fetch`` returns. Across
+        workers only the fetched value is shared, which must be JSON
+        serializable, while threads of a worker share the built one too.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._pruned_at > max(self.window, 1.0):
+                self._prune(now)
+            call = self._calls.get(key)
+            if call is not None and call.finished_at is not None:
+                if now - call.finished_at > self.window:
+                    call = None
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            _COALESCED.inc(scope="worker")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            if self.directory is None:
+                call.value = build(fetch())
+            else:
+                call.value = build(self._shared(key, fetch))
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                if call.error is not None or self.window <= 0:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                else:
+                    call.finished_at = time.monotonic()
+            call.done.set()
+        return call.value
+
+    def _prune(self, now: float):
+        expired = [
+            key
+            for key, call in self._calls.items()
+            if call.finished_at is not None and now - call.finished_at > self.window
+        ]
+        for key in expired:
+            del self._calls[key]
+        self._pruned_at = now
+
+        if self.directory is not None and now - self._swept_at > _SWEEP_INTERVAL:
+            self._swept_at = now
+            threading.Thread(target=self._sweep, daemon=True).start()
+
+    def _sweep(self):
+        """Remove results too old to be reused by any worker."""
+        oldest = time.time() - self.window - _SWEEP_INTERVAL
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith(".json") and entry.stat().st_mtime < oldest:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _shared(self, key: str, fetch: Callable[[], Any]) -> Any:
+        """
+        Fetch a value under a lock shared by the workers, unless another
+        one fetched it while waiting for the lock or within the window.
+        """
+        digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+        stripe = int(digest[:8], 16) % _STRIPES
+        path = os.path.join(self.directory, f"{digest}.json")
+        arrived_at = time.time()
+        with open(os.path.join(self.directory, f"{stripe}.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path) as fp:
+                    written_at, value = json.load(fp)
+                if written_at >= arrived_at - self.window:
+                    _COALESCED.inc(scope="host")
+                    return value
+            except (OSError, ValueError):
+                pass
+
+            value = fetch()
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as fp:
+                json.dump([time.time(), value], fp)
+            os.replace(tmp, path)
+        return value
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import json
+import queue
+import threading
+from typing import Optional
+
+from src.models.job import JobStat
+from src.services.records import JobRecord
+
+__all__ = ("JobEvents", "Subscription", "TooManySubscriptions")
+
+# job attributes whose changes are pushed to subscribers
+_WATCHED = frozenset(("status", "comment", "timeline"))
+
+
+def job_changes(old: Optional[JobStat], new: JobStat) -> dict:
+    """The watched attributes of a job that differ between two stats of it."""
+    fields = [
+        name
+        for name in _WATCHED
+        if old is None or getattr(old, name) != getattr(new, name)
+    ]
+    if not fields:
+        return {}
+    return json.loads(new.json(include=set(fields)))
+
+
+class TooManySubscriptions(Exception):
+    """Raised when subscribing to events that have all the subscribers allowed."""
+
+
+class Subscription:
+    """Events of the jobs a client is subscribed to, waiting to be sent."""
+
+    def __init__(
+        self,
+        jobs: Optional[set[str]] = None,
+        owner: Optional[str] = None,
+        max_pending: int = 100,
+        owned_only: bool = False,
+    ):
+        self.jobs = jobs
+        self.owner = owner
+        # whether the jobs of other owners are hidden, even when asked for
+        self.owned_only = owned_only
+        self.overflow = False
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+
+    def matches(self, job_id: str, job: Optional[JobRecord]) -> bool:
+        if self.jobs is not None:
+            if job_id not in self.jobs:
+                return False
+            if not self.owned_only:
+                return True
+        return job is not None and job.owned_by(self.owner)
+
+    def put(self, event: str, data: dict):
+        try:
+            self._queue.put_nowait((event, data))
+        except queue.Full:
+            # a client this far behind is better off reconnecting
+            self.overflow = True
+
+    def get(self, timeout: Optional[float] = None) -> Optional[tuple[str, dict]]:
+        """Wait for the next event, ``None`` if none came in time."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class JobEvents:
+    """
+    Fan-out of the job state transitions seen between consecutive qstat
+    snapshots. A single poller feeds every subscriber, so clients waiting on
+    their jobs cost no scheduler commands of their own.
+    """
+
+    def __init__(self, max_pending: int = 100, max_subscriptions: Optional[int] = None):
+        self.max_pending = max_pending
+        # each subscriber holds on to a server thread while streaming
+        self.max_subscriptions = max_subscriptions
+        self._subscriptions: set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(
+        self,
+        jobs: Optional[set[str]] = None,
+        owner: Optional[str] = None,
+        owned_only: bool = False,
+    ) -> Subscription:
+        """
+        Subscribe to a set of jobs, or else to every job of an owner. With
+        ``owned_only``, jobs of other owners are left out of the set.
+        """
+        sub = Subscription(
+            jobs=jobs,
+            owner=owner,
+            max_pending=self.max_pending,
+            owned_only=owned_only,
+        )
+        with self._lock:
+            if (
+                self.max_subscriptions is not None
+                and len(self._subscriptions) >= self.max_subscriptions
+            ):
+                raise TooManySubscriptions(
+                    f"at most {self.max_subscriptions} subscribers at once"
+                )
+            self._subscriptions.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subscriptions.discard(sub)
+
+    def publish(self, old: dict[str, JobRecord], new: dict[str, JobRecord]):
+        """Push the differences between two snapshots to subscribers."""
+        with self._lock:
+            subs = list(self._subscriptions)
+        if not subs:
+            return
+
+        for job_id, job in new.items():
+            prev = old.get(job_id)
+            if prev is job or prev == job:
+                continue
+            # stats are only built for the jobs someone is waiting on
+            matching = [sub for sub in subs if sub.matches(job_id, job)]
+            if not matching:
+                continue
+            changes = job_changes(prev and prev.job(), job.job())
+            if not changes:
+                continue
+            for sub in matching:
+                sub.put("job", {"job_id": job_id, **changes})
+
+        for job_id in old.keys() - new.keys():
+            for sub in subs:
+                if sub.matches(job_id, old[job_id]):
+                    sub.put("removed", {"job_id": job_id})
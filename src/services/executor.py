@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import os
+import shlex
+import signal
+import subprocess
+import tempfile
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Optional, TextIO, Union
+
+from shell import CommandError
+
+from src.services.metrics import metrics
+from src.services.tracing import span
+
+__all__ = ("CommandTimeout", "Executor", "QueueTimeout")
+
+_SLOT_WAIT_SECONDS = metrics.histogram(
+    "sched_slot_wait_seconds", "Time commands waited for a free process slot."
+)
+_QUEUE_DEPTH = metrics.gauge(
+    "sched_queue_depth", "Commands waiting for a free process slot."
+)
+_RUNNING = metrics.gauge("sched_commands_running", "Commands currently running.")
+
+
+class CommandTimeout(TimeoutError):
+    """Thrown when a command does not complete in time."""
+
+
+class QueueTimeout(TimeoutError):
+    """Thrown when a command waits too long for a free process slot."""
+
+
+class Executor:
+    """
+    Run commands as child processes, capping how many of them run at once.
+    Commands exceeding their timeout are killed, along with their children.
+    """
+
+    def __init__(
+        self,
+        max_procs: int = 16,
+        timeout: Optional[float] = 30.0,
+        queue_timeout: Optional[float] = None,
+    ):
+        self.max_procs = max_procs
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_procs)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of commands waiting for a free process slot."""
+        return self._waiting
+
+    @property
+    def running(self) -> int:
+        """Number of commands currently running."""
+        return self._running
+
+    def run(self, cmd: Union[str, list[str]], timeout: Optional[float] = None) -> str:
+        """Run a command and return its output, raising on failure."""
+        argv = shlex.split(cmd) if isinstance(cmd, str) else cmd
+        timeout = self.timeout if timeout is None else timeout
+        with self.slot():
+            with span("exec.spawn"):
+                proc = subprocess.Popen(
+                    argv,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True,
+                    start_new_session=os.name == "posix",
+                )
+            try:
+                with span("exec.wait"):
+                    stdout, stderr = proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self._kill(proc)
+                raise CommandTimeout(f"'{argv[0]}' timed out after {timeout}s")
+            except BaseException:
+                self._kill(proc)
+                raise
+
+        if proc.returncode != 0:
+            raise CommandError(stderr)
+        return stdout.strip()
+
+    @contextmanager
+    def stream(
+        self, cmd: Union[str, list[str]], timeout: Optional[float] = None
+    ) -> Iterator[TextIO]:
+        """
+        Run a command, handing its output over as a stream to be read
+        incrementally. Failures are raised once the stream is done with.
+        """
+        argv = shlex.split(cmd) if isinstance(cmd, str) else cmd
+        timeout = self.timeout if timeout is None else timeout
+        with self.slot(), tempfile.TemporaryFile(mode="w+") as stderr:
+            # errors go to a file so that a chatty stderr can't fill its pipe
+            # and block the command while stdout is being read
+            with span("exec.spawn"):
+                proc = subprocess.Popen(
+                    argv,
+                    stdout=subprocess.PIPE,
+                    stderr=stderr,
+                    universal_newlines=True,
+                    start_new_session=os.name == "posix",
+                )
+            expired = threading.Event()
+
+            def expire():
+                expired.set()
+                self._signal(proc)
+
+            timer = threading.Timer(timeout, expire) if timeout else None
+            if timer:
+                timer.start()
+            try:
+                yield proc.stdout
+
+                # drain whatever was left unread
+                with span("exec.wait"):
+                    while proc.stdout.read(1 << 16):
+                        pass
+                    if timer:
+                        timer.cancel()
+                    proc.wait()
+            except BaseException as ex:
+                if timer:
+                    timer.cancel()
+                try:
+                    # a failing command closes its output right before exiting
+                    proc.wait(timeout=1 if isinstance(ex, Exception) else 0)
+                    exited = True
+                except subprocess.TimeoutExpired:
+                    exited = False
+                    self._signal(proc)
+                    proc.wait()
+                if isinstance(ex, Exception):
+                    # the output could not be read because the command failed
+                    if expired.is_set():
+                        raise CommandTimeout(
+                            f"'{argv[0]}' timed out after {timeout}s"
+                        ) from ex
+                    if exited and proc.returncode != 0:
+                        stderr.seek(0)
+                        raise CommandError(stderr.read()) from ex
+                raise
+            finally:
+                proc.stdout.close()
+
+            if expired.is_set():
+                raise CommandTimeout(f"'{argv[0]}' timed out after {timeout}s")
+            if proc.returncode != 0:
+                stderr.seek(0)
+                raise CommandError(stderr.read())
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the process slots, waiting for one to free up."""
+        with self._lock:
+            self._waiting += 1
+        _QUEUE_DEPTH.inc()
+        try:
+            with _SLOT_WAIT_SECONDS.time(), span("exec.slot_wait"):
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+            _QUEUE_DEPTH.dec()
+        if not acquired:
+            raise QueueTimeout(f"no process slot freed in {self.queue_timeout}s")
+
+        with self._lock:
+            self._running += 1
+        _RUNNING.inc()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running -= 1
+            _RUNNING.dec()
+            self._slots.release()
+
+    @classmethod
+    def _kill(cls, proc: subprocess.Popen):
+        cls._signal(proc)
+
+        # reap the child so it does not linger as a zombie
+        proc.communicate()
+
+    @staticmethod
+    def _signal(proc: subprocess.Popen):
+        try:
+            if os.name == "posix":
+                # the command runs in its own session, take its children along
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except ProcessLookupError:
+            pass
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable
+from typing import Optional
+
+from src.models.job import parse_date
+
+__all__ = ("JobHistory",)
+
+# states of jobs done with for good, as kept by the server history
+FINAL_STATES = frozenset(("F", "M"))
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    "job_id TEXT PRIMARY KEY, seq INTEGER, owner TEXT, queue TEXT, state TEXT, "
+    "ended_at REAL, record TEXT)",
+    "CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, ended_at)",
+    "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (queue, ended_at)",
+    "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, ended_at)",
+    "CREATE INDEX IF NOT EXISTS jobs_ended_at ON jobs (ended_at)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)",
+)
+
+
+class JobHistory:
+    """
+    Local store of the raw records of finished jobs, indexed by job id,
+    owner, queue, state and end time. Records are added as they are seen,
+    and outlive the history of the server. A store synced with a full
+    listing of the server within ``max_age`` seconds is deemed to know
+    every finished job, so that listings of those can be answered from it.
+    """
+
+    def __init__(self, path: str, max_age: float = 60.0):
+        self.path = path
+        self.max_age = max_age
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+
+    @property
+    def synced_at(self) -> Optional[float]:
+        row = (
+            self._db()
+            .execute("SELECT value FROM meta WHERE key = 'synced_at'")
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    @property
+    def fresh(self) -> bool:
+        synced_at = self.synced_at
+        return synced_at is not None and time.time() - synced_at <= self.max_age
+
+    def add(
+        self, records: Iterable[tuple[str, dict]], synced_at: Optional[float] = None
+    ) -> int:
+        """
+        Store the records of finished jobs among the given ones, returning
+        how many were new. Pass when a full listing of the server started,
+        if that is what the records are, to mark the store as synced.
+        """
+        rows = [
+            _row(job_id, record)
+            for job_id, record in records
+            if record.get("job_state") in FINAL_STATES
+        ]
+        db = self._db()
+        with db:
+            # records of finished jobs are final, stored ones are kept as is
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            added = db.total_changes - before
+            if synced_at is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('synced_at', ?)", (synced_at,)
+                )
+        return added
+
+    def get(self, job_id: str) -> Optional[tuple[str, dict]]:
+        """The record of a finished job, if stored."""
+        row = (
+            self._db()
+            .execute("SELECT job_id, record FROM jobs WHERE job_id = ?", (job_id,))
+            .fetchone()
+        )
+        return (row[0], json.loads(row[1])) if row else None
+
+    def find(
+        self,
+        states: Optional[Iterable[str]] = None,
+        owner: Optional[str] = None,
+        queue: Optional[str] = None,
+        ended_after: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> list[tuple[str, dict]]:
+        """The records of the finished jobs matching all of the criteria."""
+        clauses, params = [], []
+        if states is not None:
+            states = sorted(states)
+            clauses.append(f"state IN ({', '.join('?' * len(states))})")
+            params.extend(states)
+        if owner is not None:
+            # owners are reported as 'user@host'
+            clauses.append("owner = ?")
+            params.append(owner.split("@")[0])
+        if queue is not None:
+            clauses.append("queue = ?")
+            params.append(queue)
+        if ended_after is not None:
+            clauses.append("ended_at > ?")
+            params.append(ended_after)
+        sql = "SELECT job_id, record FROM jobs"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY seq, job_id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._db().execute(sql, params)
+        return [(job_id, json.loads(record)) for job_id, record in rows]
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                db.execute(statement)
+            db.commit()
+            self._local.db = db
+        return db
+
+
+def _row(job_id: str, record: dict) -> tuple:
+    seq, _, _ = job_id.partition(".")
+    owner = (record.get("Job_Owner") or "").split("@")[0]
+    ended = record.get("obittime") or record.get("mtime")
+    try:
+        ended_at = parse_date(ended).timestamp() if ended else None
+    except ValueError:
+        ended_at = None
+    return (
+        job_id,
+        int(seq) if seq.isdigit() else None,
+        owner,
+        record.get("queue"),
+        record.get("job_state"),
+        ended_at,
+        json.dumps(record),
+    )
@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import getpass
+import logging
+import socket
+import subprocess
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from enum import IntEnum
+from typing import BinaryIO, Optional
+
+from src.services.tracing import span
+
+__all__ = (
+    "BatchError",
+    "Connection",
+    "ConnectionPool",
+    "IFL",
+    "Reader",
+    "Reply",
+    "Request",
+    "Writer",
+    "munge_auth",
+)
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_TYPE = 2
+PROTOCOL_VERSION = 2
+
+# error codes of pbs_server
+UNKNOWN_JOB = 15001
+# for finished jobs, when not asking for the history
+FINISHED_JOB = 15139
+
+# (name, resource, value) of an attribute, as sent over the wire
+Attr = tuple[str, Optional[str], str]
+
+# attributes sent as seconds since the epoch, which qstat prints as dates
+TIME_ATTRS = frozenset(("ctime", "etime", "mtime", "obittime", "qtime", "stime"))
+
+
+class Request(IntEnum):
+    STATUS_JOB = 19
+    AUTHENTICATE = 95
+
+
+class Reply(IntEnum):
+    NULL = 1
+    STATUS = 6
+    TEXT = 7
+
+
+class BatchError(Exception):
+    """Thrown when pbs_server turns a batch request down."""
+
+    def __init__(self, code: int, auxcode: int = 0, text: str = ""):
+        super().__init__(text or f"pbs_server error {code}")
+        self.code = code
+        self.auxcode = auxcode
+
+
+class Writer:
+    """
+    Encoder of the DIS format of batch requests: integers as their digits
+    preceded by their sign, the count of digits being prepended recursively
+    as long as it is over one, and strings as their length then their bytes.
+    """
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+
+    def int(self, value: int) -> Writer:
+        digits = str(abs(value))
+        encoded = ("-" if value < 0 else "+") + digits
+        count = len(digits)
+        while count > 1:
+            prefix = str(count)
+            encoded = prefix + encoded
+            count = len(prefix)
+        self._parts.append(encoded.encode())
+        return self
+
+    def uint(self, value: int) -> Writer:
+        if value < 0:
+            raise ValueError(f"{value} is not unsigned")
+        return self.int(value)
+
+    def string(self, value: str) -> Writer:
+        data = value.encode()
+        self.uint(len(data))
+        self._parts.append(data)
+        return self
+
+    def attrs(self, attrs: list[Attr]) -> Writer:
+        self.uint(len(attrs))
+        for name, resource, value in attrs:
+            size = len(name) + len(resource or "") + len(value) + 3
+            self.uint(size).string(name)
+            if resource is None:
+                self.uint(0)
+            else:
+                self.uint(1).string(resource)
+            # the operation, always SET for what is sent here
+            self.string(value).uint(0)
+        return self
+
+    def getvalue(self) -> bytes:
+        return b"".join(self._parts)
+
+
+class Reader:
+    """Decoder of the DIS format, reading from a binary stream."""
+
+    def __init__(self, fp: BinaryIO):
+        self.fp = fp
+
+    def int(self) -> int:
+        count = 1
+        while True:
+            char = self._read(1)
+            if char in b"+-":
+                digits = self._read(count)
+                if not digits.isdigit():
+                    raise ValueError(f"malformed integer digits {digits!r}")
+                value = int(digits)
+                return -value if char == b"-" else value
+            if not char.isdigit():
+                raise ValueError(f"malformed integer prefix {char!r}")
+            count = int(char + self._read(count - 1))
+
+    def uint(self) -> int:
+        value = self.int()
+        if value < 0:
+            raise ValueError(f"{value} is not unsigned")
+        return value
+
+    def string(self) -> str:
+        return self._read(self.uint()).decode()
+
+    def attrs(self) -> list[Attr]:
+        attrs = []
+        for _ in range(self.uint()):
+            self.uint()  # size
+            name = self.string()
+            resource = self.string() if self.uint() else None
+            value = self.string()
+            self.uint()  # operation
+            attrs.append((name, resource, value))
+        return attrs
+
+    def _read(self, size: int) -> bytes:
+        data = self.fp.read(size)
+        if len(data) != size:
+            raise ConnectionError("connection closed by pbs_server")
+        return data
+
+
+class Connection:
+    """An open connection to pbs_server, sending one request at a time."""
+
+    def __init__(self, host: str, port: int, timeout: Optional[float], user: str):
+        self.user = user
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.fp = self.sock.makefile("rb")
+
+    def request(
+        self, kind: Request, body: bytes = b"", extend: Optional[str] = None
+    ) -> tuple[int, Reader]:
+        """
+        Send a request and read the header of its reply, raising if it was
+        turned down. The rest of the reply is left for the caller to read.
+        """
+        header = Writer().uint(PROTOCOL_TYPE).uint(PROTOCOL_VERSION)
+        header.uint(kind).string(self.user)
+        trailer = Writer()
+        if extend is None:
+            trailer.uint(0)
+        else:
+            trailer.uint(1).string(extend)
+        self.sock.sendall(header.getvalue() + body + trailer.getvalue())
+
+        reader = Reader(self.fp)
+        reader.uint()  # protocol type
+        reader.uint()  # protocol version
+        code, auxcode, choice = reader.int(), reader.int(), reader.uint()
+        text = reader.string() if choice == Reply.TEXT else ""
+        if code != 0:
+            raise BatchError(code, auxcode, text)
+        return choice, reader
+
+    def close(self):
+        try:
+            self.fp.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def munge_auth(conn: Connection):
+    """Authenticate a connection with a credential of the local munge daemon."""
+    credential = subprocess.run(
+        ["munge", "-n"], capture_output=True, check=True, text=True, timeout=10
+    ).stdout
+    body = Writer().string("munge").string("").string(credential.strip())
+    conn.request(Request.AUTHENTICATE, body.getvalue())
+
+
+class ConnectionPool:
+    """
+    Connections to pbs_server kept open between requests, authenticated
+    once when opened. At most ``size`` of them are open at once.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 15001,
+        size: int = 8,
+        timeout: Optional[float] = 30.0,
+        auth: Optional[Callable[[Connection], None]] = munge_auth,
+        user: Optional[str] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.auth = auth
+        self.user = user or getpass.getuser()
+        self._idle: list[Connection] = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self, fresh: bool = False) -> Iterator[Connection]:
+        """
+        Borrow a connection, opening one if none is idle or if ``fresh``.
+        Connections are dropped whenever a request fails other than by being
+        turned down, since their stream may be left half read.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"no connection to pbs_server freed in {self.timeout}s")
+        try:
+            conn = None
+            with self._lock:
+                if self._idle and not fresh:
+                    conn = self._idle.pop()
+            if conn is None:
+                conn = self._connect()
+            try:
+                yield conn
+            except BatchError:
+                self._release(conn)
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            self._release(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _connect(self) -> Connection:
+        with span("ifl.connect"):
+            conn = Connection(self.host, self.port, self.timeout, self.user)
+            try:
+                if self.auth is not None:
+                    self.auth(conn)
+            except BaseException:
+                conn.close()
+                raise
+        return conn
+
+    def _release(self, conn: Connection):
+        with self._lock:
+            self._idle.append(conn)
+
+
+class IFL:
+    """Batch requests to pbs_server, over a pool of connections."""
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+
+    def statjob(self, name: str = "", history: bool = False) -> list[tuple[str, dict]]:
+        """
+        The records of a job, of the jobs of a queue, or of every job if no
+        name is given, as ``qstat -f -F json`` reports them.
+        """
+        body = Writer().string(name).attrs([]).getvalue()
+        extend = "x" if history else None
+        statuses = self._request(Request.STATUS_JOB, body, extend, _statuses)
+        return [(job_id, _record(attrs)) for _, job_id, attrs in statuses]
+
+    def _request(self, kind: Request, body: bytes, extend, read):
+        with span("ifl.request", kind=kind.name.lower()):
+            try:
+                with self.pool.connection() as conn:
+                    return read(*conn.request(kind, body, extend))
+            except (ConnectionError, socket.timeout) as ex:
+                # an idle connection may have been closed by pbs_server
+                logger.debug("retrying batch request on a new connection: %s", ex)
+            with self.pool.connection(fresh=True) as conn:
+                return read(*conn.request(kind, body, extend))
+
+
+def _statuses(choice: int, reader: Reader) -> list[tuple[int, str, list[Attr]]]:
+    if choice != Reply.STATUS:
+        raise ValueError(f"expected a status reply, got choice {choice}")
+    statuses = []
+    for _ in range(reader.uint()):
+        kind, name = reader.uint(), reader.string()
+        statuses.append((kind, name, reader.attrs()))
+    return statuses
+
+
+def _record(attrs: list[Attr]) -> dict:
+    record = {}
+    for name, resource, value in attrs:
+        if resource is not None:
+            record.setdefault(name, {})[resource] = _value(value)
+        elif name == "Variable_List":
+            record[name] = dict(item.partition("=")[::2] for item in _split(value))
+        elif name in TIME_ATTRS and value.isdigit():
+            record[name] = _date(int(value))
+        else:
+            record[name] = _value(value)
+    return record
+
+
+def _date(epoch: int) -> str:
+    """A time the way qstat prints it, e.g. 'Fri Feb 3 10:41:52 2023'."""
+    value = datetime.fromtimestamp(epoch)
+    return f"{value:%a %b} {value.day} {value:%H:%M:%S %Y}"
+
+
+def _value(value: str):
+    return int(value) if value.isdigit() else value
+
+
+def _split(value: str) -> list[str]:
+    """Split a comma separated list, commas escaped by a backslash aside."""
+    items, current, chars = [], [], iter(value)
+    for char in chars:
+        if char == "\\":
+            current.append(next(chars, ""))
+        elif char == ",":
+            items.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    items.append("".join(current))
+    return items
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import base64
+import heapq
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from itertools import combinations, islice
+from typing import Optional
+
+from src.models.job import JobStatus
+from src.services.records import JobRecord
+
+__all__ = ("JobTable", "Page", "decode_cursor", "encode_cursor")
+
+# (created_at, sequence number, job id) of a job, the order of listings
+Key = tuple[float, int, str]
+
+# a page of jobs, with the key to resume after if there are more
+Page = tuple[list[JobRecord], Optional[Key]]
+
+_FIELDS = ("owner", "queue", "status")
+# one index per combination of fields filtered on, so that any filter is
+# answered by walking a single (or one per status) sorted list
+_COMBOS = [
+    combo
+    for count in range(1, len(_FIELDS) + 1)
+    for combo in combinations(_FIELDS, count)
+]
+
+
+class JobTable:
+    """
+    The jobs of a snapshot ordered by creation time, with sorted indexes by
+    owner, queue, status and any combination of those. A page of the jobs
+    matching a filter and a range of creation times is read off the matching
+    index in O(log n + page size). Pages resume after the key of the last
+    job seen, which keeps its meaning from one table to the next.
+    """
+
+    def __init__(self, jobs: dict[str, JobRecord]):
+        entries = sorted(
+            ((_key(job_id, job), job) for job_id, job in jobs.items()),
+            key=lambda entry: entry[0],
+        )
+        self._keys: list[Key] = [key for key, _ in entries]
+        self._jobs: list[JobRecord] = [job for _, job in entries]
+
+        # positions in the table of the jobs matching each filter, ascending,
+        # packed as machine integers rather than one object each
+        self._indexes: dict[tuple, array] = {}
+        for pos, job in enumerate(self._jobs):
+            values = {
+                "owner": _owner(job.owner),
+                "queue": job.queue,
+                "status": job.status,
+            }
+            for combo in _COMBOS:
+                filters = tuple((field, values[field]) for field in combo)
+                self._indexes.setdefault(filters, array("l")).append(pos)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def page(
+        self,
+        owner: Optional[str] = None,
+        queue: Optional[str] = None,
+        statuses: Optional[Iterable[JobStatus]] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+        after: Optional[Key] = None,
+        limit: int = 100,
+    ) -> Page:
+        """
+        The first ``limit`` jobs matching all of the criteria, oldest first,
+        from after the given key on. Jobs created at ``created_after`` are
+        included, those created at ``created_before`` are not.
+        """
+        start, end = 0, len(self._keys)
+        if created_after is not None:
+            start = bisect_left(self._keys, (created_after.timestamp(),))
+        if created_before is not None:
+            end = bisect_left(self._keys, (created_before.timestamp(),))
+        if after is not None:
+            start = max(start, bisect_right(self._keys, tuple(after)))
+
+        values = {"owner": _owner(owner), "queue": queue}
+        filters = tuple(
+            (field, values[field]) for field in _FIELDS[:2] if values[field]
+        )
+        if statuses is None:
+            positions = self._positions(filters, start, end)
+        else:
+            positions = heapq.merge(
+                *(
+                    self._positions(filters + (("status", status),), start, end)
+                    for status in set(statuses)
+                )
+            )
+
+        # one more than asked to tell whether another page follows
+        found = list(islice(positions, limit + 1))
+        jobs = [self._jobs[pos] for pos in found[:limit]]
+        return jobs, self._keys[found[limit - 1]] if len(found) > limit else None
+
+    def _positions(self, filters: tuple, start: int, end: int) -> Iterator[int]:
+        if not filters:
+            return iter(range(start, end))
+        positions = self._indexes.get(filters, array("l"))
+        first, last = bisect_left(positions, start), bisect_left(positions, end)
+        return (positions[idx] for idx in range(first, last))
+
+
+def encode_cursor(key: Key) -> str:
+    """An opaque cursor for clients to resume a listing after a job."""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Key:
+    """The key of a cursor, throwing ``ValueError`` if it is not one."""
+    try:
+        created_at, seq, job_id = json.loads(base64.urlsafe_b64decode(cursor))
+    except (TypeError, ValueError) as ex:
+        raise ValueError(f"invalid cursor '{cursor}'") from ex
+    if not (
+        isinstance(created_at, (int, float))
+        and isinstance(seq, int)
+        and isinstance(job_id, str)
+    ):
+        raise ValueError(f"invalid cursor '{cursor}'")
+    return float(created_at), seq, job_id
+
+
+def _key(job_id: str, job: JobRecord) -> Key:
+    seq, _, _ = job_id.partition(".")
+    return (
+        float(job.created_at or 0),
+        int(seq) if seq.isdigit() else -1,
+        job_id,
+    )
+
+
+def _owner(owner: Optional[str]) -> Optional[str]:
+    # owners are reported as 'user@host'
+    return owner.split("@")[0] if owner else owner
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from typing import Optional
+
+from src.services.metrics import metrics
+
+__all__ = ("Limiter", "RateLimited")
+
+_LIMITED = metrics.counter(
+    "sched_limited_total",
+    "Requests and commands turned down by admission control, by limit.",
+    labels=("limit",),
+)
+
+# how often a command waiting for a slot in flight checks for one
+_POLL_INTERVAL = 0.01
+
+
+class RateLimited(Exception):
+    """Thrown when a request or command goes over one of its limits."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """
+    Admission control of the requests of each user and of all of them, by
+    token buckets capping their rate, and by slots capping the scheduler
+    commands they have in flight. State lives under a directory, a sqlite
+    database for the buckets and lock files for the slots, so that every
+    worker of a host shares it. Limits left to None are not enforced.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        user_rate: Optional[float] = None,
+        user_burst: float = 1.0,
+        global_rate: Optional[float] = None,
+        global_burst: float = 1.0,
+        user_max_inflight: Optional[int] = None,
+        max_inflight: Optional[int] = None,
+        inflight_wait: float = 0.0,
+    ):
+        self.directory = directory
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.user_max_inflight = user_max_inflight
+        self.max_inflight = max_inflight
+        self.inflight_wait = inflight_wait
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+
+    def admit(self, username: str, cost: float = 1.0):
+        """Take tokens for a request of the user, raising if it must wait."""
+        buckets = []
+        if self.user_rate is not None:
+            buckets.append(("user", _digest(username), self.user_rate, self.user_burst))
+        if self.global_rate is not None:
+            buckets.append(("global", "", self.global_rate, self.global_burst))
+        if not buckets:
+            return
+
+        limit, retry_after = self._take(buckets, cost)
+        if limit is not None:
+            _LIMITED.inc(limit=f"{limit}_rate")
+            raise RateLimited(
+                f"too many requests, {limit} rate limit reached",
+                retry_after=retry_after,
+            )
+
+    @contextmanager
+    def inflight(self, username: str) -> Iterator[None]:
+        """Hold a slot of the user and an overall one for a command."""
+        with ExitStack() as stack:
+            if self.user_max_inflight is not None:
+                name = f"user-{_digest(username)}"
+                stack.enter_context(self._slot("user", name, self.user_max_inflight))
+            if self.max_inflight is not None:
+                stack.enter_context(self._slot("global", "global", self.max_inflight))
+            yield
+
+    def _take(self, buckets: list[tuple], cost: float) -> tuple[Optional[str], float]:
+        """
+        Take tokens from every bucket, or none of them if one is short of
+        tokens. Returns which one was and how long until it refills enough.
+        """
+        db = self._db()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            updates = []
+            for limit, key, rate, burst in buckets:
+                row = db.execute(
+                    "SELECT tokens, updated FROM buckets WHERE key = ?",
+                    (f"{limit}:{key}",),
+                ).fetchone()
+                tokens = burst
+                if row is not None:
+                    tokens = min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                if tokens < cost:
+                    return limit, (min(cost, burst) - tokens) / rate
+                updates.append((f"{limit}:{key}", tokens - cost, now))
+            db.executemany("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", updates)
+        finally:
+            db.execute("COMMIT")
+        return None, 0.0
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            path = os.path.join(self.directory, "buckets.db")
+            db = sqlite3.connect(path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _slot(self, limit: str, name: str, count: int) -> Iterator[None]:
+        """
+        Hold one of ``count`` slots, each a file locked while in use. Locks go
+        away with their process, so crashed workers can't leak slots.
+        """
+        deadline = time.monotonic() + self.inflight_wait
+        while True:
+            for idx in range(count):
+                path = os.path.join(self.directory, f"{name}.{idx}.lock")
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    continue
+                try:
+                    yield
+                finally:
+                    os.close(fd)
+                return
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(_POLL_INTERVAL)
+
+        _LIMITED.inc(limit=f"{limit}_inflight")
+        raise RateLimited(
+            f"too many scheduler commands in flight, {limit} limit of {count} "
+            "reached",
+            retry_after=1.0,
+        )
+
+
+def _digest(username: str) -> str:
+    """A file name safe key for the user."""
+    return hashlib.blake2b(username.encode(), digest_size=8).hexdigest()
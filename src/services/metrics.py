@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Optional
+
+__all__ = ("Counter", "Gauge", "Histogram", "Metrics", "metrics")
+
+# in seconds, from fast model parsing up to command timeouts
+DURATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+# in bytes, from a single job up to whole servers
+SIZE_BUCKETS = tuple(float(1 << n) for n in range(10, 31, 2))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, registry: Metrics, name: str, doc: str, labels: tuple):
+        self.registry = registry
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        self.registry._update(self, self._key(labels), amount)
+
+
+class Gauge(_Metric):
+    """A value going up and down, added up over processes."""
+
+    type = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels):
+        self.registry._update(self, self._key(labels), amount)
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.registry._update(self, self._key(labels), -amount)
+
+    def set(self, value: float, **labels):
+        self.registry._update(self, self._key(labels), value, replace=True)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, registry, name, doc, labels, buckets=DURATION_BUCKETS):
+        super().__init__(registry, name, doc, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        self.registry._update(self, self._key(labels), value)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[dict]:
+        """
+        Observe how long the block takes. Labels can still be set from within
+        it, through the dict it yields.
+        """
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class Metrics:
+    """
+    Registry of counters, gauges and histograms, rendered in the Prometheus
+    text format. With a directory, each process regularly dumps its values to
+    a file of its own there, and rendering adds up the files of every process,
+    so that any gunicorn worker can be scraped for the totals of all.
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics: dict[str, _Metric] = {}
+        self._values: dict[str, dict[tuple, list[float]]] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._flushed_at = time.monotonic()
+
+    def configure(self, directory: Optional[str] = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def counter(self, name: str, doc: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(self, name, doc, labels))
+
+    def gauge(self, name: str, doc: str, labels: tuple = ()) -> Gauge:
+        return self._register(Gauge(self, name, doc, labels))
+
+    def histogram(
+        self,
+        name: str,
+        doc: str,
+        labels: tuple = (),
+        buckets: tuple = DURATION_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(self, name, doc, labels, buckets=buckets))
+
+    def flush(self):
+        """Dump the values of this process to its file, if any."""
+        if self.directory is None:
+            return
+        with self._lock:
+            data = {
+                name: [[list(key), list(value)] for key, value in values.items()]
+                for name, values in self._values.items()
+            }
+            self._flushed_at = time.monotonic()
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as fp:
+            json.dump(data, fp)
+        os.replace(tmp, path)
+
+    def render(self) -> str:
+        """The values of every process, in the Prometheus text format."""
+        self.flush()
+        totals = self._collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.doc}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in sorted(totals.get(name, {}).items()):
+                labels = dict(zip(metric.labels, key))
+                if isinstance(metric, (Counter, Gauge)):
+                    lines.append(f"{name}{_labels(labels)} {_number(value[0])}")
+                    continue
+                for bound, count in zip(metric.buckets + (math.inf,), value[2:]):
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    le = _labels({**labels, "le": le})
+                    lines.append(f"{name}_bucket{le} {_number(count)}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[0])}")
+                lines.append(f"{name}_count{_labels(labels)} {_number(value[1])}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric '{metric.name}' already registered")
+            self._metrics[metric.name] = metric
+            self._values[metric.name] = {}
+        return metric
+
+    def _update(self, metric: _Metric, key: tuple, value: float, replace: bool = False):
+        with self._lock:
+            if os.getpid() != self._pid:
+                # forked, the values of the parent are its own to report
+                self._pid = os.getpid()
+                self._values = {name: {} for name in self._values}
+
+            values = self._values[metric.name]
+            if replace:
+                values[key] = [value]
+            elif isinstance(metric, (Counter, Gauge)):
+                values.setdefault(key, [0.0])[0] += value
+            else:
+                # sum, count, then cumulative bucket counts
+                state = values.get(key)
+                if state is None:
+                    state = values[key] = [0.0] * (len(metric.buckets) + 3)
+                state[0] += value
+                state[1] += 1
+                for idx, bound in enumerate(metric.buckets):
+                    if value <= bound:
+                        state[idx + 2] += 1
+                state[-1] += 1
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+
+        if due and self.directory is not None:
+            self.flush()
+
+    def _collect(self) -> dict[str, dict[tuple, list[float]]]:
+        if self.directory is None:
+            with self._lock:
+                return {
+                    name: {key: list(value) for key, value in values.items()}
+                    for name, values in self._values.items()
+                }
+
+        totals: dict[str, dict[tuple, list[float]]] = {}
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path) as fp:
+                    data = json.load(fp)
+            except (OSError, ValueError):
+                continue
+            for name, items in data.items():
+                metric_totals = totals.setdefault(name, {})
+                for key, value in items:
+                    total = metric_totals.setdefault(tuple(key), [0.0] * len(value))
+                    for idx, item in enumerate(value):
+                        total[idx] += item
+        return totals
+
+
+def _number(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for k, v in labels.items()
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+# registry shared by the whole process
+metrics = Metrics()
@@ -1,36 +1,504 @@
 from __future__ import annotations
 
-import json
+import itertools
+import logging
+import math
 import os
+import re
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, TextIO, Union
 
-from impersonation import impersonate
-from shell import CommandError, shell
+from shell import CommandError
 
-from src.models.job import JobStat, JobSubmit
+from src.models.job import JobAlter, JobArrayStat, JobStat, JobStatus, JobSubmit
+from src.services.executor import CommandTimeout
+from src.services.history import JobHistory
+from src.services.ifl import FINISHED_JOB, IFL, UNKNOWN_JOB, BatchError
+from src.services.metrics import SIZE_BUCKETS, metrics
 from src.services.sched import Sched
+from src.services.tracing import accumulate, span
+from src.utils.jsonstream import iter_items
+from src.utils.ranges import IndexRanges
+
+logger = logging.getLogger(__name__)
+
+# statuses only reported when asking for the job history
+_HISTORY_STATUSES = {JobStatus.FINISH.value, JobStatus.MOVED.value}
+
+# the index of a subjob in its id, e.g. '12[7].pbs00'
+_SUBJOB_RE = re.compile(r"\[(\d+)\]")
+
+# ids of jobs, arrays and subjobs, e.g. '12', '12[].pbs00' or '12[7].pbs00'
+JOB_ID_RE = re.compile(r"^\d+(\[\d*\])?(\.[\w.-]+)?$")
+
+# names of queues, at a server or not, e.g. 'workq' or 'workq@pbs00'
+QUEUE_RE = re.compile(r"^[A-Za-z][\w-]*(@[\w.-]+)?$")
+
+# bytes of job ids passed to a single command, well within argv limits
+_ARGV_MAX = 128 * 1024
+
+_COMMANDS = metrics.counter(
+    "sched_commands_total",
+    "Scheduler commands run, by action and outcome.",
+    labels=("action", "outcome"),
+)
+_COMMAND_SECONDS = metrics.histogram(
+    "sched_command_duration_seconds",
+    "Time taken by scheduler commands, output reading included.",
+    labels=("action",),
+)
+_QSTAT_BYTES = metrics.histogram(
+    "qstat_output_bytes", "Size of the qstat outputs read.", buckets=SIZE_BUCKETS
+)
+_PARSE_SECONDS = metrics.histogram(
+    "job_parse_duration_seconds", "Time taken to build a job from its record."
+)
+
+
+def build_job(job_id: str, job_data: dict) -> JobStat:
+    """Build the stats of a job from its raw record, as qstat reports it."""
+    start = time.perf_counter()
+    job = JobStat(job_id=job_id, **job_data)
+    elapsed = time.perf_counter() - start
+    _PARSE_SECONDS.observe(elapsed)
+    accumulate("job.build", elapsed)
+    return job
 
 
 class PBS(Sched):
-    def qstat(self, job_id=None, status=None) -> None | JobStat:
-        args = " ".join(("-xf", "-F json", job_id))
-        data = self._exec(action="qstat", args=args)
-        jobs = json.loads(data)["Jobs"]
-        if not jobs:
-            return None
-        job_data = next(iter(jobs.values()))
-        return JobStat(**job_data)
+    def __init__(
+        self,
+        *args,
+        ifl: Optional[IFL] = None,
+        history: Optional[JobHistory] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        # batch protocol client to look jobs up with, rather than qstat
+        self.ifl = ifl
+        # local store of finished jobs, sparing lookups in the server history
+        self.history = history
+
+    def qstat(
+        self,
+        job_id=None,
+        status=None,
+        owner=None,
+        queue=None,
+    ) -> Union[None, JobStat, list[JobStat]]:
+        if job_id is not None:
+            if self.coalescer is None:
+                return _build(self._record(job_id))
+            key = f"qstat:{job_id}"
+            if self._as_user:
+                # what a user may see of a job then depends on the user
+                key = f"qstat:{self.username}:{job_id}"
+            return self.coalescer.do(key, lambda: self._record(job_id), _build)
+
+        statuses = _statuses(status)
+        history = statuses is None or bool(statuses & _HISTORY_STATUSES)
+        if not history:
+            records = self._status(queue, history=False)
+        elif self.history is not None and self.history.fresh:
+            # live jobs from the server, finished ones from the store but for
+            # those the server history got since the store was synced
+            records = []
+            if statuses is None or statuses - _HISTORY_STATUSES:
+                records = self._status(queue, history=False)
+            ended = self._ended(self.history.synced_at, queue)
+            self.history.add(ended)
+            finished = self.history.find(states=statuses, owner=owner, queue=queue)
+            stored = {job_id for job_id, _ in finished}
+            records = itertools.chain(
+                records,
+                (record for record in finished if self._visible(record[1])),
+                (record for record in ended if record[0] not in stored),
+            )
+        else:
+            records = self._status(queue, history=True)
+            if self.history is not None:
+                # users may not be shown the finished jobs of others
+                synced = queue is None and not self._as_user
+                records = self._ingested(records, synced=synced)
+
+        return [
+            build_job(job_id, job_data)
+            for job_id, job_data in records
+            if _matches(job_data, statuses=statuses, owner=owner)
+        ]
+
+    def jobs(self) -> Iterator[tuple[str, JobStat]]:
+        """Stat every job known to the server, finished ones included."""
+        for job_id, job_data in self.records():
+            yield job_id, build_job(job_id, job_data)
+
+    def records(self) -> Iterator[tuple[str, dict]]:
+        """The raw records of every job known to the server, as ``jobs``."""
+        records = self._status()
+        if self.history is not None:
+            records = self._ingested(records, synced=not self._as_user)
+        return records
 
     def qsub(self, props: JobSubmit) -> str:
-        return self._exec(action="qsub", args=props.to_qsub())
-
-    def _exec(self, action, args, username=None):
-        @impersonate(username)
-        def exec_wrapper():
-            exe = os.path.join(self.env["EXEC_PATH"], "bin", action)
-            cmd = " ".join((exe, args))
-            sh = shell(command=cmd)
-            if sh.code > 0:
-                raise CommandError(sh.errors(raw=True))
-            return sh.output(raw=True).strip()
-
-        return exec_wrapper()
+        return self._exec(action="qsub", args=props.to_argv())
+
+    def qstat_array(
+        self, job_id: str, indices: Optional[set[int]] = None
+    ) -> Optional[JobArrayStat]:
+        """
+        Stream the subjobs of an array job, keeping only their state by
+        index, and the full stats of the ones asked for.
+        """
+        if "[" not in job_id:
+            # arrays are only known as such with brackets, e.g. '12[].pbs00'
+            seq, dot, server = job_id.partition(".")
+            job_id = f"{seq}[]{dot}{server}"
+
+        array, ranges, subjobs = None, {}, []
+        records = self._qstat("-x", "-t", "-f", "-F", "json", "--", job_id)
+        try:
+            for name, job_data in records:
+                match = _SUBJOB_RE.search(name)
+                if match is None:
+                    if str(job_data.get("array")) != "True":
+                        return None
+                    array = JobArrayStat(
+                        job_id=name,
+                        status=job_data.get("job_state"),
+                        array_range=job_data.get("array_indices_submitted"),
+                    )
+                    continue
+                idx = int(match.group(1))
+                state = job_data.get("job_state")
+                ranges.setdefault(state, IndexRanges()).add(idx)
+                if indices and idx in indices:
+                    subjobs.append(build_job(name, job_data))
+        except CommandError as ex:
+            if "Unknown Job Id" in str(ex):
+                return None
+            raise
+        finally:
+            records.close()
+        if array is None:
+            return None
+        array.total = sum(run.count for run in ranges.values())
+        array.counts = {state: run.count for state, run in ranges.items()}
+        array.ranges = {state: str(run) for state, run in ranges.items()}
+        if indices is not None:
+            array.subjobs = subjobs
+        return array
+
+    def qdel(self, job_ids: list[str], workers: int = 4) -> list[Optional[Exception]]:
+        return self._control("qdel", [], job_ids, workers)
+
+    def qhold(self, job_ids: list[str], workers: int = 4) -> list[Optional[Exception]]:
+        return self._control("qhold", [], job_ids, workers)
+
+    def qrls(self, job_ids: list[str], workers: int = 4) -> list[Optional[Exception]]:
+        return self._control("qrls", [], job_ids, workers)
+
+    def qalter(
+        self, job_ids: list[str], props: JobAlter, workers: int = 4
+    ) -> list[Optional[Exception]]:
+        return self._control("qalter", props.to_argv(), job_ids, workers)
+
+    def _control(
+        self, action: str, args: list[str], job_ids: list[str], workers: int
+    ) -> list[Optional[Exception]]:
+        """
+        Run a command over many jobs, as few times as there are workers to
+        run it in parallel, unless argv limits call for more. Jobs the
+        command failed for are told apart from the lines of its errors.
+        """
+        errors = {
+            job_id: ValueError(f"invalid job id '{job_id}'")
+            for job_id in job_ids
+            if not JOB_ID_RE.match(job_id)
+        }
+        if self.username and not self._as_user:
+            valid = [job_id for job_id in job_ids if job_id not in errors]
+            errors.update(self._not_owned(action, valid))
+        unique = [job_id for job_id in dict.fromkeys(job_ids) if job_id not in errors]
+        if not unique:
+            return [errors.get(job_id) for job_id in job_ids]
+        workers = self._workers(workers)
+        chunks = _chunks(unique, size=math.ceil(len(unique) / workers))
+
+        def run(chunk: list[str]) -> dict[str, Exception]:
+            try:
+                # ids are never to be taken for options
+                self._exec(action=action, args=[*args, "--", *chunk])
+            except CommandError as ex:
+                return _failures(chunk, str(ex))
+            except Exception as ex:
+                return dict.fromkeys(chunk, ex)
+            return {}
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            for failed in pool.map(run, chunks):
+                errors.update(failed)
+        return [errors.get(job_id) for job_id in job_ids]
+
+    def _ended(self, since: float, queue=None) -> list[tuple[str, dict]]:
+        """
+        The raw records of the jobs that finished or moved since the given
+        time, selected from the server history by their modification time.
+        """
+        stamp = datetime.fromtimestamp(since).strftime("%Y%m%d%H%M.%S")
+        args = ["-x", "-s", "FM", f"-tm.ge.{stamp}"]
+        if queue is not None:
+            args.extend(["-q", queue])
+        job_ids = self._exec(action="qselect", args=args).split()
+        if not job_ids:
+            return []
+        # a long while since the sync may leave too many ids for one argv
+        return [
+            record
+            for chunk in _chunks(job_ids, size=len(job_ids))
+            for record in self._qstat("-x", "-f", "-F", "json", "--", *chunk)
+        ]
+
+    def _not_owned(self, action: str, job_ids: list[str]) -> dict[str, Exception]:
+        """
+        The errors of the jobs the user does not own, or that are not live.
+        Commands run as the service rather than as the user may act on any
+        job, so the owner of each is checked beforehand.
+        """
+        owners = {
+            _base_id(job_id): job_data.get("Job_Owner")
+            for job_id, job_data in self._status(history=False)
+        }
+        errors = {}
+        for job_id in job_ids:
+            key = _base_id(job_id)
+            if key not in owners:
+                errors[job_id] = CommandError(f"{action}: Unknown Job Id {job_id}")
+            elif not _matches({"Job_Owner": owners[key]}, owner=self.username):
+                errors[job_id] = CommandError(
+                    f"{action}: Unauthorized Request {job_id}"
+                )
+        return errors
+
+    def _record(self, job_id) -> Optional[tuple[str, dict]]:
+        """
+        The raw record of a job, if the server knows about it. With a store
+        of finished jobs, the server history is only looked into for jobs
+        neither stored nor live, and the ones found there are stored.
+        """
+        if self.history is None:
+            return self._lookup(job_id, history=True)
+
+        record = self.history.get(job_id)
+        if record is not None and self._visible(record[1]):
+            return record
+        record = self._lookup(job_id, history=False)
+        if record is not None:
+            self.history.add([record])
+        return record
+
+    def _lookup(self, job_id, history: bool) -> Optional[tuple[str, dict]]:
+        try:
+            jobs = dict(self._status(job_id, history=history))
+        except CommandError as ex:
+            if "Unknown Job Id" in str(ex):
+                return None
+            if "Job has finished" in str(ex) and not history:
+                return self._lookup(job_id, history=True)
+            raise
+        except BatchError as ex:
+            if ex.code == UNKNOWN_JOB:
+                return None
+            if ex.code == FINISHED_JOB and not history:
+                return self._lookup(job_id, history=True)
+            raise
+        return next(iter(jobs.items()), None)
+
+    def _visible(self, record: dict) -> bool:
+        """
+        Whether a stored record may be handed out as is. Commands run on
+        behalf of users leave it to the server to tell what they may see,
+        so only their own jobs are taken from the store.
+        """
+        if not self._as_user:
+            return True
+        return _matches(record, owner=self.username)
+
+    def _ingested(
+        self, records: Iterator[tuple[str, dict]], synced: bool
+    ) -> Iterator[tuple[str, dict]]:
+        """
+        Pass records through, storing the finished ones once all went by.
+        A full listing of the server marks the store as synced as of when
+        it started.
+        """
+        started_at = time.time()
+        finished = []
+        for job_id, job_data in records:
+            if job_data.get("job_state") in _HISTORY_STATUSES:
+                finished.append((job_id, job_data))
+            yield job_id, job_data
+        self.history.add(finished, synced_at=started_at if synced else None)
+
+    def _status(
+        self, name: Optional[str] = None, history: bool = True
+    ) -> Iterator[tuple[str, dict]]:
+        """
+        The raw records of a job, of the jobs of a queue, or of every job.
+        They are asked to pbs_server over the batch protocol when possible,
+        falling back to qstat if it can't be reached.
+        """
+        # connections are authenticated as the service, not as users
+        if self.ifl is not None and not self._as_user:
+            try:
+                with self._inflight(), _command("qstat"):
+                    jobs = self.ifl.statjob(name or "", history=history)
+            except OSError as ex:
+                logger.warning("falling back to qstat, pbs_server unreachable: %s", ex)
+            else:
+                return iter(jobs)
+
+        args = ["-f", "-F", "json"]
+        if history:
+            args.insert(0, "-x")
+        if name is not None:
+            # names are never to be taken for options
+            args.extend(["--", name])
+        return self._qstat(*args)
+
+    def _qstat(self, *args) -> Iterator[tuple[str, dict]]:
+        """Stream the raw records of the jobs matching the qstat arguments."""
+        with self._stream(action="qstat", args=list(args)) as fp:
+            reader = _SizedReader(fp)
+            items = iter_items(reader, key="Jobs")
+            decoding = 0.0
+            while True:
+                start = time.perf_counter()
+                item = next(items, None)
+                decoding += time.perf_counter() - start
+                if item is None:
+                    break
+                yield item
+        _QSTAT_BYTES.observe(reader.size)
+        accumulate("qstat.read", reader.seconds, count=reader.reads)
+        accumulate("qstat.decode", decoding - reader.seconds)
+
+    def _exec(self, action, args):
+        argv = [os.path.join(self.env["EXEC_PATH"], "bin", action), *args]
+        with self._inflight(), _command(action):
+            if self._as_user:
+                return self.broker.run(self.username, argv)
+            return self.executor.run(argv)
+
+    @contextmanager
+    def _stream(self, action, args) -> Iterator[TextIO]:
+        argv = [os.path.join(self.env["EXEC_PATH"], "bin", action), *args]
+        if self._as_user:
+            stream = self.broker.stream(self.username, argv)
+        else:
+            stream = self.executor.stream(argv)
+        with self._inflight(), _command(action), stream as fp:
+            yield fp
+
+
+class _SizedReader:
+    """Reader keeping count of the characters read and time spent reading."""
+
+    def __init__(self, fp: TextIO):
+        self.fp = fp
+        self.size = 0
+        self.reads = 0
+        self.seconds = 0.0
+
+    def read(self, size: int = -1) -> str:
+        start = time.perf_counter()
+        data = self.fp.read(size)
+        self.seconds += time.perf_counter() - start
+        self.size += len(data)
+        self.reads += 1
+        return data
+
+
+@contextmanager
+def _command(action: str):
+    """Count and time a scheduler command."""
+    outcome = "error"
+    try:
+        with _COMMAND_SECONDS.time(action=action), span("sched.command", action=action):
+            yield
+        outcome = "ok"
+    except CommandTimeout:
+        outcome = "timeout"
+        raise
+    finally:
+        _COMMANDS.inc(action=action, outcome=outcome)
+
+
+def _chunks(job_ids: list[str], size: int) -> list[list[str]]:
+    """Split job ids in chunks of ``size``, or smaller to fit in an argv."""
+    chunks, chunk, length = [], [], 0
+    for job_id in job_ids:
+        if chunk and (len(chunk) >= size or length + len(job_id) + 1 > _ARGV_MAX):
+            chunks.append(chunk)
+            chunk, length = [], 0
+        chunk.append(job_id)
+        length += len(job_id) + 1
+    chunks.append(chunk)
+    return chunks
+
+
+def _failures(job_ids: list[str], stderr: str) -> dict[str, Exception]:
+    """
+    The errors of the jobs named in the lines of a command stderr, e.g.
+    'qdel: Unknown Job Id 12.pbs00'. Jobs are named by their full id, so
+    ids are told apart by their sequence number, e.g. '12' for the job
+    '12.pbs00'. All jobs failed if none is named.
+    """
+    chunk, errors = {}, {}
+    for job_id in job_ids:
+        chunk.setdefault(_seq(job_id), []).append(job_id)
+    for line in stderr.splitlines():
+        for token in line.split():
+            if JOB_ID_RE.match(token):
+                for job_id in chunk.get(_seq(token), ()):
+                    errors.setdefault(job_id, CommandError(line.strip()))
+    return errors or dict.fromkeys(job_ids, CommandError(stderr.strip()))
+
+
+def _seq(job_id: str) -> str:
+    """The id of a job without its server, e.g. '12[7]' for '12[7].pbs00'."""
+    return job_id.partition(".")[0]
+
+
+def _base_id(job_id: str) -> str:
+    """
+    The id a job is listed under, without its server, e.g. '12' for
+    '12.pbs00' and '12[]' for any of the subjobs of the array '12[].pbs00'.
+    """
+    return _SUBJOB_RE.sub("[]", _seq(job_id))
+
+
+def _build(record) -> Optional[JobStat]:
+    return build_job(*record) if record else None
+
+
+def _statuses(status) -> Optional[set[str]]:
+    if status is None:
+        return None
+    if isinstance(status, JobStatus):
+        status = [status]
+    return {JobStatus(s).value for s in status}
+
+
+def _matches(job_data: dict, statuses=None, owner=None) -> bool:
+    if statuses is not None and job_data.get("job_state") not in statuses:
+        return False
+    if owner is not None:
+        # owners are reported as 'user@host'
+        job_owner = job_data.get("Job_Owner") or ""
+        if owner not in (job_owner, job_owner.split("@")[0]):
+            return False
+    return True
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import json
+import sys
+import zlib
+from typing import Optional
+
+from src.models.job import JobStat, JobStatus, parse_date
+from src.services.pbs import build_job
+from src.utils.encoding import dumps
+
+__all__ = ("JobRecord",)
+
+_STATUSES = tuple(JobStatus)
+_CODES = {status.value: code for code, status in enumerate(_STATUSES)}
+
+# attribute names and values found in most records, primed into zlib so
+# that even a single small record compresses well
+_ZDICT = (
+    ",".join(
+        f'"{name}":'
+        for name in (
+            "Job_Name",
+            "Job_Owner",
+            "resources_used",
+            "cpupercent",
+            "cput",
+            "mem",
+            "ncpus",
+            "vmem",
+            "walltime",
+            "job_state",
+            "queue",
+            "server",
+            "Account_Name",
+            "Checkpoint",
+            "ctime",
+            "Error_Path",
+            "exec_host",
+            "exec_vnode",
+            "Hold_Types",
+            "Join_Path",
+            "Keep_Files",
+            "Mail_Points",
+            "mtime",
+            "Output_Path",
+            "Priority",
+            "qtime",
+            "Rerunable",
+            "Resource_List",
+            "nodect",
+            "place",
+            "select",
+            "stime",
+            "session_id",
+            "substate",
+            "Variable_List",
+            "PBS_O_HOME",
+            "PBS_O_LANG",
+            "PBS_O_LOGNAME",
+            "PBS_O_PATH",
+            "PBS_O_MAIL",
+            "PBS_O_SHELL",
+            "PBS_O_WORKDIR",
+            "PBS_O_SYSTEM",
+            "PBS_O_QUEUE",
+            "PBS_O_HOST",
+            "comment",
+            "etime",
+            "run_count",
+            "Exit_status",
+            "Submit_arguments",
+            "project",
+            "Submit_Host",
+            "obittime",
+            "eligible_time",
+            "array",
+            "array_id",
+            "array_index",
+            "array_indices_submitted",
+        )
+    )
+    + '"True","False","_pbs_project_default","/bin/bash",'
+    + '"/usr/local/bin:/usr/bin:/bin","free","pack","scatter","excl",'
+    + "Mon Tue Wed Thu Fri Sat Sun Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec"
+).encode()
+
+
+class JobRecord:
+    """
+    Compact stand-in for the ``JobStat`` of a job, for caches holding many
+    of them. The attributes jobs are looked up and sorted by are kept
+    as interned strings, a status code and epochs; the raw record is kept
+    compressed, to build the full ``JobStat`` from when one is needed.
+    """
+
+    __slots__ = (
+        "job_id",
+        "owner",
+        "queue",
+        "server",
+        "_status",
+        "created_at",
+        "updated_at",
+        "queued_at",
+        "ready_at",
+        "_raw",
+    )
+
+    def __init__(self, job_id: str, record: dict):
+        self.job_id = job_id
+        self.owner = _intern(record.get("Job_Owner"))
+        self.queue = _intern(record.get("queue"))
+        self.server = _intern(record.get("server"))
+        self._status = _CODES.get(record.get("job_state"))
+        self.created_at = _epoch(record.get("ctime"))
+        self.updated_at = _epoch(record.get("mtime"))
+        self.queued_at = _epoch(record.get("qtime"))
+        self.ready_at = _epoch(record.get("etime"))
+        compressor = zlib.compressobj(zdict=_ZDICT)
+        self._raw = compressor.compress(dumps(record)) + compressor.flush()
+
+    @property
+    def status(self) -> Optional[JobStatus]:
+        return None if self._status is None else _STATUSES[self._status]
+
+    def owned_by(self, username: Optional[str]) -> bool:
+        # owners are reported as 'user@host'
+        return self.owner is not None and self.owner.split("@", 1)[0] == username
+
+    def record(self) -> dict:
+        """The raw record of the job, as qstat reported it."""
+        decompressor = zlib.decompressobj(zdict=_ZDICT)
+        return json.loads(decompressor.decompress(self._raw))
+
+    def job(self) -> JobStat:
+        """Build the full stats of the job."""
+        return build_job(self.job_id, self.record())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, JobRecord):
+            return NotImplemented
+        return self.job_id == other.job_id and self._raw == other._raw
+
+    def __hash__(self) -> int:
+        return hash((self.job_id, self._raw))
+
+    def __repr__(self) -> str:
+        return f"JobRecord({self.job_id!r}, status={self.status})"
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _epoch(value) -> Optional[int]:
+    if not isinstance(value, str):
+        return None
+    try:
+        return int(parse_date(value).timestamp())
+    except ValueError:
+        return None
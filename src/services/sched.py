@@ -1,7 +1,13 @@
 import abc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from typing import Optional, Union
 
-from src.models.job import JobStat, JobSubmit, JobStatus
+from src.models.job import JobAlter, JobArrayStat, JobStat, JobSubmit, JobStatus
+from src.services.broker import Broker
+from src.services.coalesce import Coalescer
+from src.services.executor import Executor
+from src.services.limits import Limiter
 
 
 class Sched(abc.ABC):
@@ -9,20 +15,70 @@ class Sched(abc.ABC):
         self,
         server: Optional[str] = None,
         env: Optional[dict] = None,
+        executor: Optional[Executor] = None,
+        broker: Optional[Broker] = None,
+        username: Optional[str] = None,
+        limiter: Optional[Limiter] = None,
+        coalescer: Optional[Coalescer] = None,
     ):
         self.server = server
         self.env = env
+        self.executor = executor or Executor()
+        # commands run as the given user only when a broker is available
+        self.broker = broker
+        self.username = username
+        # caps the commands in flight of the given user, if any
+        self.limiter = limiter
+        # shares identical lookups among concurrent callers, if any
+        self.coalescer = coalescer
+
+    @property
+    def _as_user(self) -> bool:
+        """Whether commands run as the user rather than as the service."""
+        return bool(self.username) and self.broker is not None
+
+    def _inflight(self):
+        """Hold a slot in flight for a command of the user, if limited."""
+        if self.username and self.limiter is not None:
+            return self.limiter.inflight(self.username)
+        return nullcontext()
+
+    def _workers(self, workers: int) -> int:
+        """
+        Workers to run a batch of commands of the user with, no more than
+        the commands the user may have in flight, so that none of the
+        batch is turned down for going over that limit.
+        """
+        limit = self.limiter.user_max_inflight if self.limiter is not None else None
+        if self.username and limit is not None:
+            return max(1, min(workers, limit))
+        return workers
 
     @abc.abstractmethod
     def qstat(
         self,
         job_id: str = None,
         status: Union[None, JobStatus, list[JobStatus]] = None,
-    ) -> Union[JobStat, list[JobStat]]:
+        owner: Optional[str] = None,
+        queue: Optional[str] = None,
+    ) -> Union[None, JobStat, list[JobStat]]:
         """
         Check for a job given job properties.
         job_id: the id of the job; if provided, a single job is returned
         status: the status of the job
+        owner: the user owning the job
+        queue: the queue the job is in
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def qstat_array(
+        self, job_id: str, indices: Optional[set[int]] = None
+    ) -> Optional[JobArrayStat]:
+        """
+        Summarize the states of the subjobs of an array job as ranges of
+        their indices, with the full stats of the subjobs of the given
+        indices, if any.
         """
         raise NotImplementedError
 
@@ -30,3 +86,54 @@ class Sched(abc.ABC):
     def qsub(self, props: JobSubmit) -> str:
         """Submit a job to the scheduler based on given job properties."""
         raise NotImplementedError
+
+    @abc.abstractmethod
+    def qdel(self, job_ids: list[str], workers: int = 4) -> list[Optional[Exception]]:
+        """
+        Delete many jobs at once. The error raised for each job, or None if
+        it was deleted, is returned in the same order as given.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def qhold(self, job_ids: list[str], workers: int = 4) -> list[Optional[Exception]]:
+        """Hold many jobs at once, returning the error per job as ``qdel``."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def qrls(self, job_ids: list[str], workers: int = 4) -> list[Optional[Exception]]:
+        """Release many held jobs, returning the error per job as ``qdel``."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def qalter(
+        self, job_ids: list[str], props: JobAlter, workers: int = 4
+    ) -> list[Optional[Exception]]:
+        """
+        Change the given properties of many jobs at once, returning the
+        error per job as ``qdel``.
+        """
+        raise NotImplementedError
+
+    def qsub_many(
+        self,
+        jobs: list[JobSubmit],
+        workers: int = 8,
+    ) -> list[Union[str, Exception]]:
+        """
+        Submit many jobs through a bounded pool of workers.
+        The job id, or the error raised on submission, is returned per job,
+        in the same order as given.
+        """
+
+        def submit(props):
+            try:
+                return self.qsub(props)
+            except Exception as ex:
+                return ex
+
+        if not jobs:
+            return []
+        workers = self._workers(workers)
+        with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            return list(pool.map(submit, jobs))
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Optional
+
+from werkzeug.http import generate_etag
+
+from src.models.job import JobStat
+from src.services.jobtable import JobTable
+from src.services.records import JobRecord
+from src.utils.encoding import dumps_model
+
+__all__ = ("QstatSnapshot",)
+
+logger = logging.getLogger(__name__)
+
+
+class QstatSnapshot:
+    """
+    In-memory index of the jobs known to the scheduler, keyed by job id.
+    A background thread stats the whole server once per interval, so that
+    single job lookups are answered without spawning a ``qstat`` each.
+    Jobs are held as compact records, their stats being built when asked
+    for; the JSON bodies of the last ``cache_size`` jobs asked for are kept.
+    """
+
+    def __init__(
+        self,
+        sched,
+        interval: float = 10.0,
+        max_age: float = 30.0,
+        cache_size: int = 10000,
+    ):
+        self.sched = sched
+        self.interval = interval
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self._jobs: dict[str, JobRecord] = {}
+        self._table = JobTable({})
+        self._encoded: OrderedDict[str, tuple[JobRecord, str, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._updated_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # called with the previous and the new index after each refresh
+        self.listeners: list[Callable[[dict, dict], None]] = []
+
+    @property
+    def age(self) -> Optional[float]:
+        """Seconds elapsed since the last successful refresh."""
+        if self._updated_at is None:
+            return None
+        return time.monotonic() - self._updated_at
+
+    @property
+    def fresh(self) -> bool:
+        age = self.age
+        return age is not None and age <= self.max_age
+
+    def get(self, job_id: str) -> Optional[JobStat]:
+        """Get a job from the snapshot, if the snapshot is still fresh."""
+        record = self.record(job_id)
+        return None if record is None else record.job()
+
+    def record(self, job_id: str) -> Optional[JobRecord]:
+        """Get the record of a job, if the snapshot is still fresh."""
+        if not self.fresh:
+            return None
+        return self._jobs.get(job_id)
+
+    def encoded(
+        self, job_id: str, owner: Optional[str] = None
+    ) -> Optional[tuple[str, bytes]]:
+        """
+        Get the ETag and JSON body of a job from the snapshot, if owned by
+        the given owner, if any. Both are computed once per change of the
+        job, however many times it is asked.
+        """
+        record = self.record(job_id)
+        if record is None or (owner is not None and not record.owned_by(owner)):
+            return None
+        with self._lock:
+            cached = self._encoded.get(job_id)
+            if cached is not None and cached[0] is record:
+                self._encoded.move_to_end(job_id)
+                return cached[1], cached[2]
+        body = dumps_model(record.job())
+        cached = (record, generate_etag(body), body)
+        with self._lock:
+            self._encoded[job_id] = cached
+            self._encoded.move_to_end(job_id)
+            while len(self._encoded) > self.cache_size:
+                self._encoded.popitem(last=False)
+        return cached[1], cached[2]
+
+    def jobs(self) -> dict[str, JobRecord]:
+        """The jobs of the snapshot, empty if the snapshot is not fresh."""
+        return self._jobs if self.fresh else {}
+
+    def table(self) -> Optional[JobTable]:
+        """The jobs of the snapshot in sorted order, if it is still fresh."""
+        return self._table if self.fresh else None
+
+    def refresh(self):
+        old = self._jobs
+        jobs = {}
+        for job_id, job_data in self.sched.records():
+            record = JobRecord(job_id, job_data)
+            # unchanged jobs keep their record, and what is cached of it
+            prev = old.get(job_id)
+            jobs[job_id] = prev if prev == record else record
+        table = JobTable(jobs)
+
+        # swap the whole index at once so readers never see a partial one
+        self._jobs, self._table, self._updated_at = jobs, table, time.monotonic()
+
+        for listener in self.listeners:
+            try:
+                listener(old, jobs)
+            except Exception:
+                logger.exception("qstat snapshot listener failed")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="qstat-snapshot", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("failed to refresh qstat snapshot")
+            self._stop.wait(self.interval)
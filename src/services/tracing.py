@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import cProfile
+import contextvars
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Optional
+
+__all__ = ("Trace", "Tracer", "accumulate", "span")
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar(
+    "trace", default=None
+)
+
+# functions kept from a profile, by cumulative time
+_PROFILE_TOP = 30
+
+
+class Trace:
+    """Timed spans of a single request."""
+
+    def __init__(self, name: str, profile: bool = False):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.profile = profile
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans: list[dict] = []
+        self.totals: dict[str, list[float]] = {}
+        self.depth = 0
+        self.authorized = False
+        self.profiler: Optional[cProfile.Profile] = None
+
+    def record(self) -> dict:
+        record = {
+            "trace_id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": time.perf_counter() - self.start,
+            "spans": self.spans,
+            "totals": {
+                name: {"duration": total, "count": int(count)}
+                for name, (total, count) in self.totals.items()
+            },
+        }
+        if self.profiler is not None:
+            record["profile"] = _top_functions(self.profiler)
+        return record
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[dict]:
+    """
+    Time a block as a span of the current trace, if any. Attributes can be
+    added from within the block through the dict it yields.
+    """
+    trace = _current.get()
+    if trace is None:
+        yield attrs
+        return
+
+    start = time.perf_counter()
+    trace.depth += 1
+    try:
+        yield attrs
+    finally:
+        trace.depth -= 1
+        trace.spans.append(
+            {
+                "name": name,
+                "start": start - trace.start,
+                "duration": time.perf_counter() - start,
+                "depth": trace.depth,
+                **attrs,
+            }
+        )
+
+
+def accumulate(name: str, seconds: float, count: int = 1):
+    """
+    Add up time spent in many small steps of the current trace, if any, e.g.
+    building each job of a listing, rather than a span for each.
+    """
+    trace = _current.get()
+    if trace is not None:
+        totals = trace.totals.setdefault(name, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += count
+
+
+class Tracer:
+    """
+    Traces requests asking for it, as long as they come from one of the
+    allowed users, appending them as JSON lines to a file. A share of the
+    traced requests, or those asking for it, are profiled as well.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        users: tuple[str, ...] = (),
+        profile_rate: float = 0.0,
+    ):
+        self.path = path
+        self.users = frozenset(users)
+        self.profile_rate = profile_rate
+        self._lock = threading.Lock()
+
+        # a single profiler may run at once
+        self._profiling = threading.Lock()
+
+    def start(self, name: str, profile: bool = False) -> contextvars.Token:
+        profile = profile or random.random() < self.profile_rate
+        return _current.set(Trace(name, profile=profile))
+
+    def authorize(self, username: Optional[str]):
+        """
+        Keep tracing the current request only if its user is allowed to.
+        Profiling starts from there, unauthorized callers can't trigger it.
+        """
+        trace = _current.get()
+        if trace is None:
+            return
+        if username not in self.users:
+            _current.set(None)
+            return
+        trace.authorized = True
+        if trace.profile and self._profiling.acquire(blocking=False):
+            trace.profiler = cProfile.Profile()
+            try:
+                trace.profiler.enable()
+            except ValueError:
+                # some other profiler is active in this process
+                trace.profiler = None
+                self._profiling.release()
+
+    def finish(self, token: contextvars.Token, **attrs) -> Optional[Trace]:
+        """End the current trace, writing it if it was authorized."""
+        trace = _current.get()
+        _current.reset(token)
+        if trace is None or not trace.authorized:
+            return None
+        if trace.profiler is not None:
+            trace.profiler.disable()
+            self._profiling.release()
+
+        line = json.dumps({**trace.record(), **attrs}, default=str)
+        with self._lock, open(self.path, "a") as fp:
+            fp.write(line + os.linesep)
+        return trace
+
+
+def _top_functions(profiler: cProfile.Profile) -> list[dict]:
+    stats = pstats.Stats(profiler).stats
+    entries = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+    return [
+        {
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "tottime": tottime,
+            "cumtime": cumtime,
+        }
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in entries[
+            :_PROFILE_TOP
+        ]
+    ]
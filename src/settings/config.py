@@ -1,6 +1,6 @@
 import sys
 from enum import Enum
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic import BaseSettings, Field, validator
 
@@ -47,9 +47,127 @@ class _Settings(BaseSettings):
     # OPENAPI supported version
     OPENAPI: str = "3.0.3"
 
+    # build the OpenAPI spec on first use rather than on startup, or load
+    # it from a file written by `flask spec`
+    OPENAPI_LAZY: bool = True
+    OPENAPI_SPEC_FILE: Optional[str] = None
+
+    # expose metrics at /metrics, adding up the ones of every worker
+    # dumping them into the given directory
+    METRICS: bool = False
+    METRICS_DIR: Optional[str] = None
+    METRICS_FLUSH_INTERVAL: float = 5.0
+
+    # trace requests sent with the tracing header by the given users, into
+    # a JSON lines file; the header set to "profile" profiles them as well
+    TRACING: bool = False
+    TRACING_HEADER: str = "X-Trace"
+    TRACING_FILE: str = "traces.jsonl"
+    TRACING_USERS: list[str] = []
+    TRACING_PROFILE_RATE: float = 0.0
+
+    # cache of credential verifications, a TTL of 0 disables caching
+    AUTH_CACHE: bool = True
+    AUTH_CACHE_TTL: float = 300.0
+    AUTH_CACHE_NEGATIVE_TTL: float = 30.0
+    AUTH_CACHE_MAX_SIZE: int = 10000
+    AUTH_CACHE_MAX_FAILURES: int = 3
+
     # scheduler props
     SCHED_ENV: _SchedEnv = _SchedEnv().sched()
 
+    # scheduler commands execution
+    SCHED_EXEC_MAX_PROCS: int = 16
+    SCHED_EXEC_TIMEOUT: Optional[float] = 30.0
+    SCHED_EXEC_QUEUE_TIMEOUT: Optional[float] = 10.0
+
+    # look jobs up over the batch protocol of pbs_server ("ifl") rather than
+    # through qstat ("cli"), keeping up to the given connections open; the
+    # host defaults to the PBS server, the auth is either "munge" or "none"
+    # for servers trusting their clients; submissions and commands run on
+    # behalf of users still go through the CLI
+    SCHED_TRANSPORT: Literal["cli", "ifl"] = "cli"
+    SCHED_IFL_HOST: Optional[str] = None
+    SCHED_IFL_PORT: int = 15001
+    SCHED_IFL_POOL_SIZE: int = 8
+    SCHED_IFL_TIMEOUT: Optional[float] = 30.0
+    SCHED_IFL_AUTH: Literal["munge", "none"] = "munge"
+
+    # admission control shared by the workers of a host through a directory
+    # (a temporary one by default): requests per second per user and overall,
+    # with bursts, and scheduler commands in flight per user and overall,
+    # waited for up to the given seconds; None lifts a limit
+    SCHED_LIMITS: bool = False
+    SCHED_LIMITS_DIR: Optional[str] = None
+    SCHED_LIMITS_USER_RATE: Optional[float] = 5.0
+    SCHED_LIMITS_USER_BURST: float = 20.0
+    SCHED_LIMITS_GLOBAL_RATE: Optional[float] = 50.0
+    SCHED_LIMITS_GLOBAL_BURST: float = 100.0
+    SCHED_LIMITS_USER_MAX_INFLIGHT: Optional[int] = 4
+    SCHED_LIMITS_MAX_INFLIGHT: Optional[int] = 32
+    SCHED_LIMITS_INFLIGHT_WAIT: float = 2.0
+
+    # run commands as the requesting user, through long-lived helpers, a
+    # few per user to run their commands in parallel; requires running as
+    # root, or with the CAP_SETUID and CAP_SETGID capabilities
+    SCHED_BROKER: bool = False
+    SCHED_BROKER_MAX_HELPERS: int = 32
+    SCHED_BROKER_HELPERS_PER_USER: int = 4
+    SCHED_BROKER_IDLE_TIMEOUT: Optional[float] = 300.0
+
+    # serve qstat lookups from a periodically refreshed snapshot
+    QSTAT_SNAPSHOT: bool = False
+    QSTAT_SNAPSHOT_INTERVAL: float = 10.0
+    QSTAT_SNAPSHOT_MAX_AGE: float = 30.0
+    # JSON bodies of snapshot jobs kept, the last asked for
+    QSTAT_SNAPSHOT_CACHE_SIZE: int = 10000
+
+    # keep finished jobs in a local store, looked into before asking the
+    # server history for a job; listings of finished jobs are answered from
+    # it for as long as a full listing, e.g. of the snapshot, synced it
+    # within the given seconds, along with the jobs qselect finds that
+    # finished since
+    QSTAT_HISTORY: bool = False
+    QSTAT_HISTORY_FILE: str = "history.db"
+    QSTAT_HISTORY_MAX_AGE: float = 60.0
+
+    # share a qstat lookup of a job among the concurrent ones of a user, and
+    # reuse its result for the given seconds; with a directory, among the
+    # workers of a host too. Without one, lookups are only shared by the
+    # threads of a worker: sync gunicorn workers serve a request at a time,
+    # so that a directory is required for coalescing to happen at all
+    QSTAT_COALESCE: bool = True
+    QSTAT_COALESCE_WINDOW: float = 0.0
+    QSTAT_COALESCE_DIR: Optional[str] = None
+
+    # gzip JSON bodies of at least this many bytes, if clients accept it
+    JSON_GZIP_MIN_SIZE: Optional[int] = 1024
+
+    # seconds clients may reuse a qstat response before revalidating it
+    QSTAT_CACHE_MAX_AGE: int = 0
+
+    # subjobs of an array job that can be asked for in full at once
+    QSTAT_ARRAY_MAX_SUBJOBS: int = 1000
+
+    # pages of the job listing of the snapshot, by default and at most
+    JOBS_PAGE_SIZE: int = 100
+    JOBS_PAGE_MAX_SIZE: int = 1000
+
+    # job events pushed to clients, fed by the qstat snapshot; each stream
+    # holds a server thread, so they are capped per process
+    EVENTS_KEEPALIVE: float = 15.0
+    EVENTS_MAX_PENDING: int = 100
+    EVENTS_MAX_STREAMS: Optional[int] = 32
+
+    # batch submissions, run by no more workers than the commands a user
+    # may have in flight
+    QSUB_BATCH_MAX_SIZE: int = 1000
+    QSUB_BATCH_WORKERS: int = 8
+
+    # bulk job control, run by commands in parallel over chunks of the ids
+    JOB_CONTROL_MAX_SIZE: int = 10000
+    JOB_CONTROL_WORKERS: int = 4
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
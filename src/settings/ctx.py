@@ -1,7 +1,12 @@
+import math
+
 from werkzeug.exceptions import HTTPException
 
 from flask import redirect, url_for
 
+from src.services.broker import UnknownUser
+from src.services.executor import CommandTimeout, QueueTimeout
+from src.services.limits import RateLimited
 from src.utils import http_response
 
 
@@ -14,3 +19,20 @@ def ctx_settings(app):
     def handle_http_errors(ex):
         description = "" if ex.code in (405,) else ex.description
         return http_response(code=ex.code, description=description), ex.code
+
+    @app.errorhandler(CommandTimeout)
+    def handle_command_timeout(ex):
+        return http_response(code=504, description=str(ex)), 504
+
+    @app.errorhandler(QueueTimeout)
+    def handle_queue_timeout(ex):
+        return http_response(code=503, description=str(ex)), 503
+
+    @app.errorhandler(UnknownUser)
+    def handle_unknown_user(ex):
+        return http_response(code=403, description=str(ex)), 403
+
+    @app.errorhandler(RateLimited)
+    def handle_rate_limited(ex):
+        headers = {"Retry-After": str(math.ceil(ex.retry_after))}
+        return http_response(code=429, description=str(ex)), 429, headers
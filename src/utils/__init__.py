@@ -1,5 +1,6 @@
-from copy import deepcopy
 from dataclasses import asdict
+from functools import lru_cache
+from typing import NamedTuple
 
 from apispec_plugins.base.types import HTTPResponse
 from pydantic import BaseModel
@@ -7,35 +8,69 @@ from pydantic.utils import lenient_issubclass
 from werkzeug.http import HTTP_STATUS_CODES
 
 
-def build_extra(model: type[BaseModel], values: dict[str, dict]):
+class FieldPlan(NamedTuple):
+    """How the flat attributes of a model spread across its nested models."""
+
+    # keys a model may be populated from, i.e. field aliases and names
+    keys: tuple[str, ...]
+    # aliases of the fields holding plain values
+    scalars: tuple[str, ...]
+    # aliases of the fields holding nested models, in declaration order
+    models: tuple[tuple[str, "FieldPlan"], ...]
+    # aliases of every field in the model tree
+    aliases: frozenset[str]
+
+
+@lru_cache(maxsize=None)
+def field_plan(model: type[BaseModel]) -> FieldPlan:
+    keys, scalars, models, aliases = [], [], [], set()
     for field in model.__fields__.values():
+        keys.extend(dict.fromkeys((field.alias, field.name)))
+        aliases.add(field.alias)
         if lenient_issubclass(field.type_, BaseModel):
-            build_extra(field.type_, values)
+            plan = field_plan(field.type_)
+            models.append((field.alias, plan))
+            aliases.update(plan.aliases)
+        else:
+            scalars.append(field.alias)
+    return FieldPlan(
+        keys=tuple(keys),
+        scalars=tuple(scalars),
+        models=tuple(models),
+        aliases=frozenset(aliases),
+    )
 
-        if field.alias in values:
-            values.pop(field.alias)
 
-    return values
+def build_extra(model: type[BaseModel], values: dict[str, dict]):
+    """Get the values not matching any field of the model or its nested models."""
+    aliases = field_plan(model).aliases
+    return {k: v for k, v in values.items() if k not in aliases}
 
 
 def unflatten(model: type[BaseModel], values: dict[str, dict]):
-    parsed, objs = deepcopy(values), []
+    """
+    Nest the flat values of a record under the fields of the nested models
+    they belong to. Values are consumed in field order, so a value taken by
+    a nested model is not seen by the ones after it.
+    """
+    parsed = dict(values)
+    _unflatten(field_plan(model), values, parsed)
+    return parsed
 
-    for field in model.__fields__.values():
-        if lenient_issubclass(field.type_, BaseModel):
-            objs.append(field)
-        else:
-            if field.alias in values:
-                values.pop(field.alias)
 
-    for field in objs:
-        if field.alias in values:
-            values.update(values[field.alias])
-            values.pop(field.alias)
+def _unflatten(plan: FieldPlan, values: dict, parsed: dict):
+    for alias in plan.scalars:
+        values.pop(alias, None)
 
-        parsed[field.alias] = unflatten(field.type_, values)
+    for alias, sub_plan in plan.models:
+        if alias in values:
+            values.update(values[alias])
+            values.pop(alias)
 
-    return parsed
+        # nested models ignore unknown keys, hand over just what they use
+        sub_parsed = {k: values[k] for k in sub_plan.keys if k in values}
+        _unflatten(sub_plan, values, sub_parsed)
+        parsed[alias] = sub_parsed
 
 
 def http_response(code: int, description=""):
@@ -0,0 +1,40 @@
+import gzip
+import json
+from collections.abc import Iterable
+from typing import Any
+
+from pydantic import BaseModel
+from pydantic.json import pydantic_encoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+__all__ = ("dumps", "dumps_model", "join_array", "compress")
+
+# fast enough to stay well below the cost of building the payload
+_GZIP_LEVEL = 5
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode an object to JSON, with ``orjson`` when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(
+            obj, default=pydantic_encoder, option=orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(obj, default=pydantic_encoder, separators=(",", ":")).encode()
+
+
+def dumps_model(model: BaseModel) -> bytes:
+    """Encode a model to JSON in one go, the way ``model.json()`` would."""
+    return dumps(model.dict())
+
+
+def join_array(items: Iterable[bytes]) -> bytes:
+    """Join already encoded JSON values into a JSON array."""
+    return b"[" + b",".join(items) + b"]"
+
+
+def compress(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=_GZIP_LEVEL, mtime=0)
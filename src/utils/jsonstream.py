@@ -0,0 +1,96 @@
+import json
+from collections.abc import Iterator
+from typing import Any, TextIO
+
+__all__ = ("iter_items",)
+
+_WHITESPACE = " \t\n\r"
+
+
+class _Reader:
+    """Buffered reader decoding a JSON document one value at a time."""
+
+    def __init__(self, fp: TextIO, chunk_size: int):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        # drop what was consumed already so the buffer stays small
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character, if any."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos : self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            found = repr(char) if char else "end of input"
+            raise ValueError(f"expected one of {chars!r} but found {found}")
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+
+            # a value running up to the end of the buffer (e.g. a number)
+            # might continue in the next chunk
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def members(self) -> Iterator[str]:
+        """Iterate over the keys of the object about to be read."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError(f"expected an object key but found {key!r}")
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+
+def iter_items(fp: TextIO, key: str, chunk_size: int = 1 << 16) -> Iterator:
+    """
+    Iterate over the ``(name, value)`` items of the object found under ``key``
+    at the top level of the JSON document read from ``fp``. Items are decoded
+    one at a time, so memory is bound by the size of the largest item rather
+    than the size of the whole document.
+    """
+    reader = _Reader(fp, chunk_size=chunk_size)
+    if not reader.peek():
+        raise ValueError("expected a JSON document but found end of input")
+    for name in reader.members():
+        if name != key:
+            reader.value()
+            continue
+        for item in reader.members():
+            yield item, reader.value()
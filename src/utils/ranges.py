@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+
+__all__ = ("IndexRanges", "parse_ranges")
+
+
+class IndexRanges:
+    """
+    A set of indices kept as runs of consecutive ones, the way PBS writes
+    array ranges, e.g. '1-5,8,10-20'. Adding indices in order, as qstat
+    lists subjobs, extends the last run in constant time and space.
+    """
+
+    def __init__(self):
+        self._runs: list[list[int]] = []
+        self.count = 0
+
+    def add(self, idx: int):
+        self.count += 1
+        if self._runs:
+            last = self._runs[-1]
+            if idx == last[1] + 1:
+                last[1] = idx
+                return
+            if idx > last[1]:
+                self._runs.append([idx, idx])
+                return
+        self._runs.append([idx, idx])
+        self._runs.sort()
+        # merge runs touching each other again
+        merged = [self._runs[0]]
+        for run in self._runs[1:]:
+            if run[0] <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], run[1])
+            else:
+                merged.append(run)
+        self._runs = merged
+
+    def __str__(self) -> str:
+        return ",".join(
+            str(start) if start == end else f"{start}-{end}"
+            for start, end in self._runs
+        )
+
+
+def parse_ranges(value: str) -> Iterator[int]:
+    """
+    The indices of PBS array ranges, e.g. '1-10:2,15' for 1, 3, 5, 7, 9
+    and 15. Throws ``ValueError`` for malformed ones.
+    """
+    for part in value.split(","):
+        bounds, _, step = part.partition(":")
+        start, _, end = bounds.partition("-")
+        start = int(start)
+        end = int(end) if end else start
+        step = int(step) if step else 1
+        if start < 0 or end < start or step < 1:
+            raise ValueError(f"invalid array range '{part}'")
+        yield from range(start, end + 1, step)
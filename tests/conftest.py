@@ -1,3 +1,4 @@
+import io
 import json
 
 import pytest
@@ -125,11 +126,43 @@ def qstat_data():
 
 @pytest.fixture(scope="class")
 def qstat_job(qstat_data):
-    return JobStat.parse_obj(json.loads(qstat_data)["Jobs"]["1000.pbs00"])
+    job_data = json.loads(qstat_data)["Jobs"]["1000.pbs00"]
+    return JobStat.parse_obj({"job_id": "1000.pbs00", **job_data})
+
+
+class FakeProcess:
+    """Stand-in for a child process that completed with the given output."""
+
+    def __init__(self, stdout="", stderr="", returncode=0, stderr_file=None):
+        self.pid = 0
+        self.stdout = io.StringIO(stdout)
+        self.stderr = stderr
+        self.returncode = returncode
+        if stderr_file is not None:
+            stderr_file.write(stderr)
+
+    def communicate(self, input=None, timeout=None):
+        return self.stdout.read(), self.stderr
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def poll(self):
+        return self.returncode
 
 
 @pytest.fixture(autouse=True)
 def mock_shell(mocker):
     mock = mocker.Mock()
-    mock.configure_mock(**{"code": 0, "output.return_value": ""})
-    return mocker.patch("src.services.pbs.shell", return_value=mock).return_value
+    mock.configure_mock(
+        **{"code": 0, "output.return_value": "", "errors.return_value": ""}
+    )
+
+    def popen(args, stderr=None, **kwargs):
+        mock.run(args)
+        stderr_file = stderr if hasattr(stderr, "write") else None
+        return FakeProcess(mock.output(), mock.errors(), mock.code, stderr_file)
+
+    mocker.patch("src.services.executor.subprocess.Popen", side_effect=popen)
+    mocker.patch("src.services.executor.os.killpg")
+    return mock
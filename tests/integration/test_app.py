@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 from src.app import create_app
@@ -48,3 +50,43 @@ class TestApp:
         assert response.status_code == 404
         assert response.json["code"] == 404
         assert "Not Found" in response.json["description"]
+
+
+class TestMetrics:
+    def test_metrics_endpoint(self):
+        app = create_app(environ="testing", configs={"METRICS": True})
+        client = app.test_client()
+        client.get("/404")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+        text = response.get_data(as_text=True)
+        assert "# TYPE http_request_duration_seconds histogram" in text
+        assert 'status="404"' in text
+        assert "# TYPE sched_commands_total counter" in text
+
+    def test_metrics_disabled(self, client):
+        assert client.get("/metrics").status_code == 404
+
+
+class TestSpec:
+    def test_lazy_spec_matches_eager_one(self, client):
+        app = create_app(environ="testing", configs={"OPENAPI_LAZY": False})
+        spec = app.extensions["openapi_spec"].to_dict()
+        response = client.get("/specs.json")
+        assert response.json == json.loads(app.json.dumps(spec))
+
+    def test_spec_command(self, app, client):
+        result = app.test_cli_runner().invoke(args=["spec"])
+        assert result.exit_code == 0
+        assert json.loads(result.output) == client.get("/specs.json").json
+
+    def test_spec_from_file(self, app, tmp_path):
+        path = tmp_path / "openapi.json"
+        app.test_cli_runner().invoke(args=["spec", "-o", str(path)])
+        local_app = create_app(
+            environ="testing", configs={"OPENAPI_SPEC_FILE": str(path)}
+        )
+        response = local_app.test_client().get("/specs.json")
+        assert response.status_code == 200
+        assert response.json == json.loads(path.read_text())
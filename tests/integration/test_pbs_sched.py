@@ -1,9 +1,18 @@
+import getpass
+import gzip
 import json
 from base64 import b64encode
 
 import pytest
 
+from benchmarks.fakepbs import install
+from benchmarks.generator import qstat_array_json
+from src.app import create_app
+from src.services.broker import UnknownUser
+from src.services.events import JobEvents
+from src.services.executor import CommandTimeout
 from src.services.pbs import PBS
+from src.services.snapshot import QstatSnapshot
 
 
 @pytest.fixture(scope="class", autouse=True)
@@ -27,6 +36,72 @@ def auth(app, mocker):
     return {"Authorization": f"Basic {b64encode(b'user:pass').decode()}"}
 
 
+@pytest.fixture()
+def snapshot(app, qstat_data, mock_shell):
+    mock_shell.configure_mock(**{"output.return_value": qstat_data})
+    snapshot = QstatSnapshot(sched=PBS(env={"EXEC_PATH": "/opt/pbs"}))
+    snapshot.refresh()
+    mock_shell.reset_mock()
+    app.extensions["qstat_snapshot"] = snapshot
+    yield snapshot
+    app.extensions.pop("qstat_snapshot")
+
+
+@pytest.fixture()
+def events(app, snapshot):
+    events = JobEvents()
+    snapshot.listeners.append(events.publish)
+    app.extensions["job_events"] = events
+    yield events
+    app.extensions.pop("job_events")
+
+
+@pytest.fixture()
+def broker(app, mocker):
+    """Commands run as users, who may only see their own jobs."""
+    app.extensions["sched_broker"] = mocker.Mock()
+    yield
+    app.extensions.pop("sched_broker")
+
+
+class TestPBSEventsGET:
+    def test_stream_job_changes(
+        self, client, auth, events, snapshot, qstat_data, mock_shell
+    ):
+        response = client.get("/pbs/events?jobs=1000.pbs00", headers=auth)
+        assert response.status_code == 200
+        assert response.mimetype == "text/event-stream"
+        stream = iter(response.response)
+        assert next(stream).startswith(b'event: job\ndata: {"job_id": "1000.pbs00"')
+
+        data = json.loads(qstat_data)
+        data["Jobs"]["1000.pbs00"]["job_state"] = "F"
+        mock_shell.configure_mock(**{"output.return_value": json.dumps(data)})
+        snapshot.refresh()
+        event = b'event: job\ndata: {"job_id": "1000.pbs00", "status": "F"}\n\n'
+        assert next(stream) == event
+
+        mock_shell.configure_mock(**{"output.return_value": json.dumps({})})
+        snapshot.refresh()
+        assert next(stream) == b'event: removed\ndata: {"job_id": "1000.pbs00"}\n\n'
+        response.close()
+        assert not events._subscriptions
+
+    def test_other_users_jobs_hidden(self, app, client, auth, events, broker, mocker):
+        mocker.patch.dict(app.config, {"EVENTS_KEEPALIVE": 0.01})
+        response = client.get("/pbs/events?jobs=1000.pbs00", headers=auth)
+        assert next(iter(response.response)) == b": keepalive\n\n"
+        response.close()
+
+    def test_without_snapshot_throws_503(self, client, auth):
+        response = client.get("/pbs/events", headers=auth)
+        assert response.status_code == 503
+
+    def test_unauthorized_request_throws_401(self, client):
+        response = client.get("/pbs/events", headers={})
+        assert response.status_code == 401
+
+
 class TestPBSQstatGET:
     def test_valid_job_id_returns_200(
         self, client, auth, qstat_data, qstat_job, mock_shell
@@ -36,6 +111,55 @@ class TestPBSQstatGET:
         assert response.status_code == 200
         assert response.json == json.loads(qstat_job.json())
 
+    def test_snapshot_job_returns_200(
+        self, client, auth, snapshot, qstat_job, mock_shell
+    ):
+        response = client.get("/pbs/qstat/1000.pbs00", headers=auth)
+        assert response.status_code == 200
+        assert response.json == json.loads(qstat_job.json())
+        mock_shell.run.assert_not_called()
+
+    def test_snapshot_other_users_job_falls_through(
+        self, client, auth, snapshot, broker, mock_shell, mocker
+    ):
+        mocker.patch("src.api.auth.load_user", return_value="user")
+        output = json.dumps({"Jobs": {}})
+        mock_shell.configure_mock(**{"output.return_value": output})
+        response = client.get("/pbs/qstat/1000.pbs00", headers=auth)
+        assert response.status_code == 404
+        mock_shell.output.assert_called_once()
+
+    def test_snapshot_miss_falls_through(self, client, auth, snapshot, mock_shell):
+        output = json.dumps({"Jobs": {}})
+        mock_shell.configure_mock(**{"output.return_value": output})
+        response = client.get("/pbs/qstat/1001.pbs00", headers=auth)
+        assert response.status_code == 404
+        mock_shell.output.assert_called_once()
+
+    def test_matching_etag_returns_304(self, client, auth, qstat_data, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        response = client.get("/pbs/qstat/100.pbs00", headers=auth)
+        assert response.headers["ETag"]
+        assert "private" in response.headers["Cache-Control"]
+
+        headers = {**auth, "If-None-Match": response.headers["ETag"]}
+        response = client.get("/pbs/qstat/100.pbs00", headers=headers)
+        assert response.status_code == 304
+        assert response.data == b""
+
+    def test_snapshot_etag_returns_304(self, client, auth, snapshot, mock_shell):
+        response = client.get("/pbs/qstat/1000.pbs00", headers=auth)
+        headers = {**auth, "If-None-Match": response.headers["ETag"]}
+        response = client.get("/pbs/qstat/1000.pbs00", headers=headers)
+        assert response.status_code == 304
+        mock_shell.run.assert_not_called()
+
+    def test_stale_etag_returns_200(self, client, auth, snapshot, mock_shell):
+        headers = {**auth, "If-None-Match": '"stale"'}
+        response = client.get("/pbs/qstat/1000.pbs00", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["ETag"] != '"stale"'
+
     def test_unauthorized_request_throws_401(self, client):
         response = client.get("/pbs/qstat/100.pbs00", headers={})
         assert response.status_code == 401
@@ -49,12 +173,180 @@ class TestPBSQstatGET:
         assert response.json["code"] == 404
         assert response.json["description"] == "Not Found: job '00.pbs00' not found"
 
+    @pytest.mark.parametrize("job_id", ["-B", "-Q", "1.pbs00 -f"])
+    def test_invalid_job_id_throws_404(self, client, auth, mock_shell, job_id):
+        response = client.get(f"/pbs/qstat/{job_id}", headers=auth)
+        assert response.status_code == 404
+        mock_shell.run.assert_not_called()
+
+    def test_timed_out_command_throws_504(self, client, auth, mocker):
+        error = CommandTimeout("'qstat' timed out after 30s")
+        mocker.patch("src.services.executor.Executor.stream", side_effect=error)
+        response = client.get("/pbs/qstat/100.pbs00", headers=auth)
+        assert response.status_code == 504
+        assert response.json["code"] == 504
+
+    def test_user_without_account_throws_403(self, client, auth, mocker):
+        error = UnknownUser("no account to run commands as 'user'")
+        mocker.patch("src.services.executor.Executor.stream", side_effect=error)
+        response = client.get("/pbs/qstat/100.pbs00", headers=auth)
+        assert response.status_code == 403
+        assert response.json["code"] == 403
+
     def test_disallowed_method_throws_405(self, client):
         response = client.post("/pbs/qstat/100.pbs00")
         assert response.status_code == 405
         assert response.json == {"code": 405, "description": "Method Not Allowed"}
 
 
+class TestPBSQstatArrayGET:
+    def test_valid_array_returns_200(self, client, auth, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": qstat_array_json(20)})
+        response = client.get("/pbs/qstat/0[].pbs00/array?indices=1-3", headers=auth)
+        assert response.status_code == 200
+        assert response.json["total"] == 20
+        assert response.json["ranges"] == {"X": "1-10", "R": "11-12", "Q": "13-20"}
+        assert len(response.json["subjobs"]) == 3
+
+    def test_not_found_throws_404(self, client, auth, qstat_data, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        response = client.get("/pbs/qstat/1000.pbs00/array", headers=auth)
+        assert response.status_code == 404
+
+    def test_invalid_job_id_throws_404(self, client, auth, mock_shell):
+        response = client.get("/pbs/qstat/-B/array", headers=auth)
+        assert response.status_code == 404
+        mock_shell.run.assert_not_called()
+
+    @pytest.mark.parametrize("indices", ["1-x", "1-2000"])
+    def test_invalid_indices_throws_400(self, client, auth, mock_shell, indices):
+        url = f"/pbs/qstat/0[].pbs00/array?indices={indices}"
+        response = client.get(url, headers=auth)
+        assert response.status_code == 400
+        mock_shell.run.assert_not_called()
+
+    def test_unauthorized_request_throws_401(self, client):
+        response = client.get("/pbs/qstat/0[].pbs00/array", headers={})
+        assert response.status_code == 401
+
+
+class TestPBSQstatListGET:
+    def test_list_jobs_returns_200(
+        self, client, auth, qstat_data, qstat_job, mock_shell
+    ):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        response = client.get("/pbs/qstat?status=R,Q&owner=testu", headers=auth)
+        assert response.status_code == 200
+        assert response.json == [json.loads(qstat_job.json())]
+
+    def test_matching_etag_returns_304(self, client, auth, qstat_data, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        response = client.get("/pbs/qstat", headers=auth)
+        headers = {**auth, "If-None-Match": response.headers["ETag"]}
+        response = client.get("/pbs/qstat", headers=headers)
+        assert response.status_code == 304
+
+    def test_large_list_is_gzipped(self, client, auth, qstat_data, mock_shell):
+        data = json.loads(qstat_data)
+        job = data["Jobs"]["1000.pbs00"]
+        data["Jobs"] = {f"{idx}.pbs00": job for idx in range(10)}
+        mock_shell.configure_mock(**{"output.return_value": json.dumps(data)})
+        headers = {**auth, "Accept-Encoding": "gzip"}
+        response = client.get("/pbs/qstat", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["ETag"].startswith("W/")
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert len(json.loads(gzip.decompress(response.data))) == 10
+
+        response = client.get("/pbs/qstat", headers=auth)
+        assert "Content-Encoding" not in response.headers
+        assert len(response.json) == 10
+
+    def test_no_matching_jobs_returns_empty_list(self, client, auth, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": json.dumps({})})
+        response = client.get("/pbs/qstat?queue=workq", headers=auth)
+        assert response.status_code == 200
+        assert response.json == []
+
+    @pytest.mark.parametrize("queue", ["-Q", "-Bf", "workq -x"])
+    def test_invalid_queue_throws_400(self, client, auth, mock_shell, queue):
+        response = client.get("/pbs/qstat", query_string={"queue": queue}, headers=auth)
+        assert response.status_code == 400
+        mock_shell.run.assert_not_called()
+
+    def test_invalid_status_throws_400(self, client, auth):
+        response = client.get("/pbs/qstat?status=R,Z", headers=auth)
+        assert response.status_code == 400
+        assert response.json["code"] == 400
+
+    def test_unauthorized_request_throws_401(self, client):
+        response = client.get("/pbs/qstat", headers={})
+        assert response.status_code == 401
+
+
+class TestPBSJobsGET:
+    def test_list_jobs_returns_200(self, client, auth, snapshot, qstat_job):
+        response = client.get("/pbs/jobs?status=R,Q&owner=testu", headers=auth)
+        assert response.status_code == 200
+        assert response.json == {"jobs": [json.loads(qstat_job.json())], "next": None}
+
+    def test_only_own_jobs_with_broker(self, client, auth, snapshot, broker, mocker):
+        mocker.patch("src.api.auth.load_user", return_value="user")
+        response = client.get("/pbs/jobs", headers=auth)
+        assert response.status_code == 200
+        assert response.json == {"jobs": [], "next": None}
+        response = client.get("/pbs/jobs?owner=testu", headers=auth)
+        assert response.status_code == 403
+
+    def test_pages(self, client, auth, snapshot, qstat_data, mock_shell):
+        data = json.loads(qstat_data)
+        job = data["Jobs"]["1000.pbs00"]
+        data["Jobs"] = {f"{idx}.pbs00": job for idx in range(5)}
+        mock_shell.configure_mock(**{"output.return_value": json.dumps(data)})
+        snapshot.refresh()
+
+        pages, url = [], "/pbs/jobs?limit=2"
+        while url:
+            response = client.get(url, headers=auth)
+            assert response.status_code == 200
+            pages.append([job["job_id"] for job in response.json["jobs"]])
+            cursor = response.json["next"]
+            url = f"/pbs/jobs?limit=2&cursor={cursor}" if cursor else None
+        assert pages == [
+            ["0.pbs00", "1.pbs00"],
+            ["2.pbs00", "3.pbs00"],
+            ["4.pbs00"],
+        ]
+        assert not mock_shell.called
+
+    def test_created_range(self, client, auth, snapshot):
+        response = client.get(
+            "/pbs/jobs?created_after=2023-02-03T10:41:52", headers=auth
+        )
+        assert len(response.json["jobs"]) == 1
+        response = client.get(
+            "/pbs/jobs?created_before=2023-02-03T10:41:52", headers=auth
+        )
+        assert response.json["jobs"] == []
+
+    @pytest.mark.parametrize(
+        "query",
+        ["status=R,Z", "cursor=abc", "limit=0", "limit=x", "created_after=yesterday"],
+    )
+    def test_invalid_query_throws_400(self, client, auth, snapshot, query):
+        response = client.get(f"/pbs/jobs?{query}", headers=auth)
+        assert response.status_code == 400
+
+    def test_without_snapshot_throws_503(self, client, auth):
+        response = client.get("/pbs/jobs", headers=auth)
+        assert response.status_code == 503
+
+    def test_unauthorized_request_throws_401(self, client):
+        response = client.get("/pbs/jobs", headers={})
+        assert response.status_code == 401
+
+
 class TestPBSQsubPOST:
     def test_valid_job_returns_200(self, client, auth, qsub_job, mock_shell):
         job_id = "100.pbs00"
@@ -78,3 +370,251 @@ class TestPBSQsubPOST:
         response = client.get("/pbs/qsub")
         assert response.status_code == 405
         assert response.json == {"code": 405, "description": "Method Not Allowed"}
+
+
+class TestPBSQsubBatchPOST:
+    def test_valid_jobs_returns_200(self, client, auth, qsub_job, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": "100.pbs00"})
+        jobs = [qsub_job.dict()] * 3
+        response = client.post("/pbs/qsub/batch", headers=auth, json=jobs)
+        assert response.status_code == 200
+        assert response.json == [{"job_id": "100.pbs00"}] * 3
+        assert mock_shell.output.call_count == 3
+
+    def test_failed_jobs_are_reported(self, client, auth, qsub_job, mock_shell):
+        mock_shell.configure_mock(
+            **{"code": 1, "errors.return_value": "qsub: Unknown queue"}
+        )
+        response = client.post("/pbs/qsub/batch", headers=auth, json=[qsub_job.dict()])
+        assert response.status_code == 200
+        assert response.json == [{"error": "qsub: Unknown queue"}]
+
+    def test_invalid_job_throws_400(self, client, auth, qsub_job, mock_shell):
+        jobs = [qsub_job.dict(), {"resources": "?"}]
+        response = client.post("/pbs/qsub/batch", headers=auth, json=jobs)
+        assert response.status_code == 400
+        assert "index': 1" in response.json["description"]
+        mock_shell.output.assert_not_called()
+
+    def test_not_a_list_throws_400(self, client, auth, qsub_job):
+        response = client.post("/pbs/qsub/batch", headers=auth, json=qsub_job.dict())
+        assert response.status_code == 400
+
+    def test_unauthorized_request_throws_401(self, client):
+        response = client.post("/pbs/qsub/batch", headers={})
+        assert response.status_code == 401
+
+
+class TestPBSJobControlPOST:
+    @pytest.fixture(autouse=True)
+    def one_command(self, app, mocker):
+        """Every id goes to a single command, sharing the mocked output."""
+        mocker.patch.dict(app.config, {"JOB_CONTROL_WORKERS": 1})
+
+    @pytest.mark.parametrize("action", ["qdel", "qhold", "qrls"])
+    def test_valid_jobs_return_200(self, client, auth, mock_shell, action):
+        job_ids = ["1.pbs00", "2.pbs00"]
+        response = client.post(
+            f"/pbs/{action}", headers=auth, json={"job_ids": job_ids}
+        )
+        assert response.status_code == 200
+        assert response.json == [{"job_id": "1.pbs00"}, {"job_id": "2.pbs00"}]
+        argv = mock_shell.run.call_args.args[0]
+        assert argv == [f"/opt/pbs/bin/{action}", "--", *job_ids]
+
+    def test_errors_per_job(self, client, auth, mock_shell):
+        mock_shell.configure_mock(
+            code=153, **{"errors.return_value": "qdel: Unknown Job Id 2.pbs00\n"}
+        )
+        json = {"job_ids": ["1.pbs00", "2.pbs00"]}
+        response = client.post("/pbs/qdel", headers=auth, json=json)
+        assert response.status_code == 200
+        assert response.json == [
+            {"job_id": "1.pbs00"},
+            {"job_id": "2.pbs00", "error": "qdel: Unknown Job Id 2.pbs00"},
+        ]
+
+    def test_qalter(self, client, auth, mock_shell):
+        json = {"job_ids": ["1.pbs00"], "changes": {"name": "renamed"}}
+        response = client.post("/pbs/qalter", headers=auth, json=json)
+        assert response.status_code == 200
+        argv = mock_shell.run.call_args.args[0]
+        assert argv == ["/opt/pbs/bin/qalter", "-N", "renamed", "--", "1.pbs00"]
+
+    @pytest.mark.parametrize(
+        "url, json",
+        [
+            ("/pbs/qdel", ["1.pbs00"]),
+            ("/pbs/qdel", {"job_ids": [1]}),
+            ("/pbs/qdel", {"job_ids": ["1.pbs00", "-Wforce"]}),
+            ("/pbs/qhold", {"job_ids": ["1.pbs00 2.pbs00"]}),
+            ("/pbs/qalter", {"job_ids": ["1.pbs00"]}),
+            ("/pbs/qalter", {"job_ids": ["1.pbs00"], "changes": {}}),
+            ("/pbs/qalter", {"job_ids": ["1.pbs00"], "changes": {"priority": "x"}}),
+        ],
+    )
+    def test_invalid_request_throws_400(self, client, auth, mock_shell, url, json):
+        response = client.post(url, headers=auth, json=json)
+        assert response.status_code == 400
+        mock_shell.run.assert_not_called()
+
+    def test_too_many_jobs_throws_400(self, app, client, auth, mocker):
+        mocker.patch.dict(app.config, {"JOB_CONTROL_MAX_SIZE": 1})
+        json = {"job_ids": ["1.pbs00", "2.pbs00"]}
+        response = client.post("/pbs/qdel", headers=auth, json=json)
+        assert response.status_code == 400
+
+    def test_unauthorized_request_throws_401(self, client):
+        response = client.post("/pbs/qdel", headers={}, json={"job_ids": []})
+        assert response.status_code == 401
+
+
+class TestTracing:
+    @pytest.fixture()
+    def traces(self, tmp_path):
+        return tmp_path / "traces.jsonl"
+
+    @pytest.fixture()
+    def traced(self, traces):
+        app = create_app(
+            environ="testing",
+            configs={
+                "TRACING": True,
+                "TRACING_FILE": str(traces),
+                "TRACING_USERS": ["user"],
+            },
+        )
+        return app.test_client()
+
+    def test_traced_request_is_written(
+        self, traced, traces, auth, qstat_data, mock_shell
+    ):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        response = traced.get("/pbs/qstat/100.pbs00", headers={**auth, "X-Trace": "1"})
+        assert response.status_code == 200
+
+        (line,) = traces.read_text().splitlines()
+        trace = json.loads(line)
+        assert trace["trace_id"] == response.headers["X-Trace-Id"]
+        assert trace["username"] == "user" and trace["status"] == 200
+        names = {span["name"] for span in trace["spans"]}
+        assert {"auth", "sched.command", "exec.spawn", "response.encode"} <= names
+        assert trace["totals"]["job.build"]["count"] == 1
+        assert "profile" not in trace
+
+    def test_untraced_request_is_not_written(
+        self, traced, traces, auth, qstat_data, mock_shell
+    ):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        response = traced.get("/pbs/qstat/100.pbs00", headers=auth)
+        assert response.status_code == 200
+        assert "X-Trace-Id" not in response.headers
+        assert not traces.exists()
+
+    def test_unauthorized_user_is_not_traced(self, traced, traces, auth, mocker):
+        mocker.patch("src.services.auth.AuthSvc.authenticate", return_value=False)
+        response = traced.get("/pbs/qstat/100.pbs00", headers={**auth, "X-Trace": "1"})
+        assert response.status_code == 401
+        assert "X-Trace-Id" not in response.headers
+        assert not traces.exists()
+
+
+class TestLimits:
+    @pytest.fixture(autouse=True)
+    def user(self, auth, mocker):
+        mocker.patch("src.api.auth.load_user", return_value="user")
+
+    @pytest.fixture()
+    def limited(self, tmp_path):
+        app = create_app(
+            environ="testing",
+            configs={
+                "SCHED_LIMITS": True,
+                "SCHED_LIMITS_DIR": str(tmp_path),
+                "SCHED_LIMITS_USER_RATE": 0.5,
+                "SCHED_LIMITS_USER_BURST": 1,
+            },
+        )
+        return app.test_client()
+
+    def test_over_rate_throws_429(self, limited, auth, qstat_data, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        response = limited.get("/pbs/qstat/100.pbs00", headers=auth)
+        assert response.status_code == 200
+
+        response = limited.get("/pbs/qstat", headers=auth)
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "2"
+        mock_shell.output.assert_called_once()
+
+
+class TestPBSWiring:
+    """Requests through the scheduler the way the app builds it, features on."""
+
+    @pytest.fixture(autouse=True)
+    def pbs(self):
+        """The scheduler is left as the app builds it."""
+
+    @pytest.fixture()
+    def mock_shell(self):
+        """Commands run for real against the fake toolchain."""
+
+    @pytest.fixture()
+    def app(self, tmp_path):
+        pbs_exec = str(tmp_path / "pbs")
+        install(pbs_exec, jobs=10)
+        app = create_app(
+            environ="testing",
+            configs={
+                "SCHED_ENV": {"EXEC_PATH": pbs_exec, "SERVER": "pbs00"},
+                "SCHED_BROKER": True,
+                "SCHED_BROKER_HELPERS_PER_USER": 2,
+                "SCHED_LIMITS": True,
+                "SCHED_LIMITS_DIR": str(tmp_path / "limits"),
+                "SCHED_LIMITS_USER_MAX_INFLIGHT": 2,
+                # batches over the limit would have commands turned down
+                "SCHED_LIMITS_INFLIGHT_WAIT": 0.0,
+                "QSTAT_COALESCE": True,
+                "QSTAT_COALESCE_WINDOW": 60.0,
+                "QSTAT_HISTORY": True,
+                "QSTAT_HISTORY_FILE": str(tmp_path / "history.db"),
+            },
+        )
+        with app.app_context():
+            yield app
+        app.extensions["sched_broker"].close()
+
+    @pytest.fixture()
+    def client(self, app):
+        return app.test_client()
+
+    @pytest.fixture()
+    def auth(self, mocker):
+        mocker.patch("src.services.auth.AuthSvc.authenticate", return_value=True)
+        credentials = f"{getpass.getuser()}:pass".encode()
+        return {"Authorization": f"Basic {b64encode(credentials).decode()}"}
+
+    def test_commands_run_as_user(self, app, client, auth):
+        username = getpass.getuser()
+        jobs = [{"name": f"job{idx}", "submit_args": "-- /bin/true"} for idx in "abcd"]
+        response = client.post("/pbs/qsub/batch", headers=auth, json=jobs)
+        assert response.status_code == 200
+        job_ids = [result["job_id"] for result in response.json]
+        assert list(app.extensions["sched_broker"]._helpers) == [username]
+
+        for _ in range(2):
+            response = client.get(f"/pbs/qstat/{job_ids[0]}", headers=auth)
+            assert response.status_code == 200
+            assert response.json["name"] == "joba"
+        coalescer = app.extensions["qstat_coalescer"]
+        assert list(coalescer._calls) == [f"qstat:{username}:{job_ids[0]}"]
+
+        response = client.post("/pbs/qdel", headers=auth, json={"job_ids": job_ids})
+        assert response.json == [{"job_id": job_id} for job_id in job_ids]
+
+        response = client.get("/pbs/qstat?status=F", headers=auth)
+        assert set(job_ids) <= {job["job_id"] for job in response.json}
+        history = app.extensions["qstat_history"]
+        assert all(history.get(job_id) for job_id in job_ids)
+        # run as the user, the listing may leave out the jobs of others
+        assert history.synced_at is None
@@ -0,0 +1,91 @@
+import pytest
+
+from src.services.auth import AuthSvc, CredentialCache
+
+
+@pytest.fixture()
+def cache():
+    return CredentialCache(ttl=60, negative_ttl=60, max_size=3, max_failures=2)
+
+
+@pytest.fixture()
+def verify(mocker, cache):
+    mocker.patch.object(AuthSvc, "cache", cache)
+    return mocker.patch.object(AuthSvc, "verify", return_value=True)
+
+
+class TestCredentialCache:
+    def test_hit_and_miss(self, cache):
+        assert cache.get("user", "secret") is None
+        cache.put("user", "secret", True)
+        cache.put("user", "wrong", False)
+        assert cache.get("user", "secret") is True
+        assert cache.get("user", "wrong") is False
+        assert cache.get("other", "secret") is None
+
+    def test_no_plain_credentials(self, cache):
+        cache.put("user", "secret", True)
+        key = next(iter(cache._entries))
+        assert b"secret" not in key
+        assert key != CredentialCache()._key("user", "secret")
+
+    def test_expiry(self, cache):
+        cache.negative_ttl = 0
+        cache.put("user", "wrong", False)
+        assert cache.get("user", "wrong") is None
+        cache.ttl = -1
+        cache.put("user", "secret", True)
+        assert cache.get("user", "secret") is None
+
+    def test_lru_eviction(self, cache):
+        for name in ("a", "b", "c"):
+            cache.put(name, "secret", True)
+        assert cache.get("a", "secret") is True
+        cache.put("d", "secret", True)
+        assert cache.get("b", "secret") is None
+        assert cache.get("a", "secret") is True
+        assert len(cache._entries) == 3
+
+    def test_failures_invalidate_user(self, cache):
+        cache.put("user", "secret", True)
+        cache.put("user", "wrong", False)
+        assert cache.get("user", "secret") is True
+        cache.put("user", "again", False)
+        assert cache.get("user", "secret") is None
+        assert cache.get("user", "again") is False
+
+    def test_success_resets_failures(self, cache):
+        cache.put("user", "wrong", False)
+        cache.put("user", "secret", True)
+        cache.put("user", "wrong", False)
+        assert cache.get("user", "secret") is True
+
+    def test_failures_bounded(self, cache):
+        for idx in range(10):
+            cache.put(f"user{idx}", "wrong", False)
+        assert list(cache._failures) == ["user7", "user8", "user9"]
+
+        # failures expire along with successful verifications
+        cache.ttl = -1
+        cache.put("user", "wrong", False)
+        cache.put("user", "again", False)
+        assert cache._failures["user"][0] == 1
+
+
+class TestAuthSvc:
+    def test_authenticate_cached(self, verify):
+        assert AuthSvc.authenticate(username="user", password="secret") is True
+        assert AuthSvc.authenticate(username="user", password="secret") is True
+        assert verify.call_count == 1
+
+    def test_authenticate_negative_cached(self, verify):
+        verify.return_value = False
+        assert AuthSvc.authenticate(username="user", password="wrong") is False
+        assert AuthSvc.authenticate(username="user", password="wrong") is False
+        assert verify.call_count == 1
+
+    def test_authenticate_without_cache(self, verify, mocker):
+        mocker.patch.object(AuthSvc, "cache", None)
+        AuthSvc.authenticate(username="user", password="secret")
+        AuthSvc.authenticate(username="user", password="secret")
+        assert verify.call_count == 2
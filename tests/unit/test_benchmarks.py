@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from benchmarks.__main__ import main
+from benchmarks.generator import qstat_json
+from benchmarks.memory import measure
+from benchmarks.suite import BENCHMARKS, compare, report, run
+from src.models.job import JobStat
+
+
+@pytest.fixture()
+def mock_shell():
+    """Benchmarks patch the executor themselves."""
+
+
+def test_generator():
+    data = json.loads(qstat_json(10))
+    assert len(data["Jobs"]) == 10
+    assert qstat_json(10) == qstat_json(10)
+    for job_id, record in data["Jobs"].items():
+        job = JobStat(job_id=job_id, **record)
+        assert job.owner.startswith("user")
+        assert job.timeline.created_at is not None
+
+
+@pytest.mark.parametrize("name", sorted(BENCHMARKS))
+def test_run(name):
+    result = run(name, count=2, repeat=1)
+    assert result.name == f"{name}[2]"
+    assert result.min <= result.median
+
+
+def test_compare():
+    baseline = {"results": {"a[1]": {"median": 1.0}, "b[1]": {"median": 1.0}}}
+    current = {"results": {"a[1]": {"median": 1.1}, "b[1]": {"median": 1.5}}}
+    assert compare(current, baseline, threshold=0.2) == [("b[1]", 0.5)]
+    assert compare(current, {"results": {}}) == []
+
+
+def test_main(tmp_path):
+    output = tmp_path / "results.json"
+    assert main(["-b", "to_argv", "-n", "1", "-r", "1", "-o", str(output)]) == 0
+    results = json.loads(output.read_text())
+    assert list(results["results"]) == ["to_argv[1]"]
+
+    baseline = report([run("to_argv", count=1, repeat=1)._replace(median=1e-9)])
+    output.write_text(json.dumps(baseline))
+    assert main(["-b", "to_argv", "-n", "1", "-r", "1", "--baseline", str(output)])
+
+    assert main(["-b", "to_argv", "-n", "1", "-r", "1", "--budget", "0"])
+
+
+def test_memory():
+    # the absolute bound is checked at scale, see ``--target``; this few
+    # jobs still bear most of the fixed cost of the snapshot indexes
+    snapshot = measure("snapshot", count=100)
+    assert snapshot < measure("jobstat", count=100) / 3
@@ -0,0 +1,83 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from impersonation import utils as pw
+from shell import CommandError
+
+from src.services.broker import Broker, UnknownUser
+from src.services.executor import Executor
+from src.utils.jsonstream import iter_items
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="requires POSIX users")
+
+
+@pytest.fixture()
+def mock_shell():
+    """Run real child processes."""
+
+
+@pytest.fixture()
+def broker():
+    broker = Broker(executor=Executor(timeout=10), max_helpers=1)
+    yield broker
+    broker.close()
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+class TestBroker:
+    def test_run_reuses_helper(self, broker):
+        username = pw.pw_username()
+        assert broker.run(username, python("print('100.pbs00')")) == "100.pbs00"
+        pid = broker.run(username, python("import os; print(os.getppid())"))
+        assert broker.run(username, python("import os; print(os.getppid())")) == pid
+        assert int(pid) != os.getpid()
+
+    def test_failed_command_raises(self, broker):
+        username = pw.pw_username()
+        with pytest.raises(CommandError, match="qsub: error"):
+            broker.run(username, python("import sys; sys.exit('qsub: error')"))
+        assert broker.run(username, python("print('ok')")) == "ok"
+
+    def test_stream(self, broker):
+        username = pw.pw_username()
+        jobs = {f"{idx}.pbs00": {"job_state": "R"} for idx in range(1000)}
+        code = f"print({json.dumps(json.dumps({'Jobs': jobs}))})"
+        with broker.stream(username, python(code)) as fp:
+            assert dict(iter_items(fp, key="Jobs")) == jobs
+        assert broker.run(username, python("print('ok')")) == "ok"
+
+    def test_unknown_user(self, broker):
+        with pytest.raises(UnknownUser):
+            broker.run("no-such-user", python("print('ok')"))
+        assert not broker._helpers
+        assert not broker._starting
+
+    def test_commands_of_a_user_run_in_parallel(self):
+        broker = Broker(executor=Executor(timeout=10), helpers_per_user=2)
+        username = pw.pw_username()
+        try:
+            sleep = python("import time; time.sleep(0.5)")
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                # the first commands start the helpers
+                list(pool.map(lambda _: broker.run(username, sleep), range(4)))
+                assert len(broker._helpers[username]) == 2
+
+                start = time.monotonic()
+                list(pool.map(lambda _: broker.run(username, sleep), range(4)))
+            # two at a time, rather than one after the other
+            assert 1.0 <= time.monotonic() - start < 1.8
+        finally:
+            broker.close()
+
+    @pytest.mark.skipif(os.name == "posix" and os.getuid() != 0, reason="root only")
+    def test_run_as_user(self, broker):
+        assert broker.run("nobody", ["id", "-un"]) == "nobody"
+        assert broker.run(pw.pw_username(), ["id", "-un"]) == pw.pw_username()
+        assert list(broker._helpers) == [pw.pw_username()]
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from src.services.coalesce import Coalescer
+
+
+class _Fetch:
+    """A fetch blocking until released, counting its calls."""
+
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(10)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def _concurrently(coalescers, key, fetch, build=None, count=8):
+    results = [None] * count
+    kwargs = {"build": build} if build else {}
+
+    def call(idx):
+        try:
+            results[idx] = coalescers[idx % len(coalescers)].do(key, fetch, **kwargs)
+        except Exception as ex:
+            results[idx] = ex
+
+    threads = [threading.Thread(target=call, args=(idx,)) for idx in range(count)]
+    threads[0].start()
+    assert fetch.started.wait(10)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    fetch.release.set()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+class TestCoalescer:
+    def test_concurrent_calls_share_one(self):
+        fetch = _Fetch(value={"state": "F"})
+        results = _concurrently([Coalescer()], "1.pbs00", fetch, build=dict)
+        assert fetch.calls == 1
+        assert all(result is results[0] for result in results)
+
+    def test_errors_are_shared_not_kept(self):
+        coalescer = Coalescer(window=60)
+        fetch = _Fetch(error=ValueError("boom"))
+        results = _concurrently([coalescer], "1.pbs00", fetch)
+        assert fetch.calls == 1
+        assert all(isinstance(result, ValueError) for result in results)
+        assert coalescer.do("1.pbs00", lambda: "ok") == "ok"
+
+    def test_keys_are_separate(self):
+        coalescer = Coalescer(window=60)
+        assert coalescer.do("1.pbs00", lambda: 1) == 1
+        assert coalescer.do("2.pbs00", lambda: 2) == 2
+
+    def test_window(self):
+        coalescer = Coalescer(window=60)
+        assert coalescer.do("1.pbs00", lambda: 1) == 1
+        assert coalescer.do("1.pbs00", lambda: 2) == 1
+        coalescer.window = 0
+        assert coalescer.do("1.pbs00", lambda: 3) == 3
+        assert coalescer.do("1.pbs00", lambda: 4) == 4
+        assert not coalescer._calls
+
+    def test_prune(self):
+        coalescer = Coalescer(window=0.01)
+        coalescer.do("1.pbs00", lambda: 1)
+        coalescer._prune(time.monotonic() + 1)
+        assert not coalescer._calls
+
+    def test_workers_share_concurrent_calls(self, tmp_path):
+        workers = [Coalescer(directory=str(tmp_path)) for _ in range(4)]
+        fetch = _Fetch(value=["1.pbs00", {"job_state": "F"}])
+        results = _concurrently(workers, "1.pbs00", fetch, build=tuple)
+        assert fetch.calls == 1
+        assert all(result == ("1.pbs00", {"job_state": "F"}) for result in results)
+
+    def test_workers_share_within_window(self, tmp_path):
+        worker = Coalescer(window=60, directory=str(tmp_path))
+        other = Coalescer(window=60, directory=str(tmp_path))
+        assert worker.do("1.pbs00", lambda: 1) == 1
+        assert other.do("1.pbs00", lambda: 2) == 1
+
+        other.window = 0
+        assert other.do("1.pbs00", lambda: 3) == 3
+
+    @pytest.mark.parametrize("window", [0, 60])
+    def test_sweep(self, tmp_path, window):
+        worker = Coalescer(window=window, directory=str(tmp_path))
+        worker.do("1.pbs00", lambda: 1)
+        worker._sweep()
+        assert list(tmp_path.glob("*.json"))
+        worker.window = -120
+        worker._sweep()
+        assert not list(tmp_path.glob("*.json"))
@@ -0,0 +1,31 @@
+import gzip
+import json
+
+import pytest
+
+from src.utils import encoding
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, mocker):
+    if request.param == "json":
+        mocker.patch.object(encoding, "orjson", None)
+    return request.param
+
+
+def test_dumps_model(backend, qstat_job):
+    data = encoding.dumps_model(qstat_job)
+    assert isinstance(data, bytes)
+    assert json.loads(data) == json.loads(qstat_job.json())
+
+
+def test_join_array(backend, qstat_job):
+    data = encoding.join_array(encoding.dumps_model(job) for job in [qstat_job] * 2)
+    assert json.loads(data) == [json.loads(qstat_job.json())] * 2
+    assert json.loads(encoding.join_array([])) == []
+
+
+def test_compress():
+    data = b'{"key":"value"}' * 100
+    assert gzip.decompress(encoding.compress(data)) == data
+    assert encoding.compress(data) == encoding.compress(data)
@@ -0,0 +1,71 @@
+import pytest
+
+from src.services.events import JobEvents, TooManySubscriptions
+from src.services.records import JobRecord
+
+
+@pytest.fixture()
+def jobs():
+    return {
+        "1.pbs00": JobRecord("1.pbs00", {"Job_Owner": "testu@ln01", "job_state": "Q"}),
+        "2.pbs00": JobRecord("2.pbs00", {"Job_Owner": "other@ln01", "job_state": "R"}),
+    }
+
+
+class TestJobEvents:
+    def test_publish_changes_only(self, jobs):
+        events = JobEvents()
+        sub = events.subscribe(jobs={"1.pbs00", "2.pbs00"})
+        new = dict(jobs)
+        new["1.pbs00"] = JobRecord(
+            "1.pbs00", {"Job_Owner": "testu@ln01", "job_state": "R", "comment": "run"}
+        )
+        events.publish(jobs, new)
+        assert sub.get(timeout=0) == (
+            "job",
+            {"job_id": "1.pbs00", "status": "R", "comment": "run"},
+        )
+        assert sub.get(timeout=0) is None
+
+    def test_subscribe_by_owner(self, jobs):
+        events = JobEvents()
+        sub = events.subscribe(owner="testu")
+        events.publish({}, jobs)
+        event, data = sub.get(timeout=0)
+        assert event == "job"
+        assert data["job_id"] == "1.pbs00"
+        assert sub.get(timeout=0) is None
+
+        events.publish(jobs, {})
+        assert sub.get(timeout=0) == ("removed", {"job_id": "1.pbs00"})
+
+    def test_subscribe_owned_only(self, jobs):
+        events = JobEvents()
+        sub = events.subscribe(
+            jobs={"1.pbs00", "2.pbs00"}, owner="testu", owned_only=True
+        )
+        events.publish({}, jobs)
+        event, data = sub.get(timeout=0)
+        assert data["job_id"] == "1.pbs00"
+        assert sub.get(timeout=0) is None
+
+    def test_unsubscribe(self, jobs):
+        events = JobEvents()
+        sub = events.subscribe(jobs={"1.pbs00"})
+        events.unsubscribe(sub)
+        events.publish({}, jobs)
+        assert sub.get(timeout=0) is None
+
+    def test_overflow(self, jobs):
+        events = JobEvents(max_pending=1)
+        sub = events.subscribe(jobs={"1.pbs00", "2.pbs00"})
+        events.publish({}, jobs)
+        assert sub.overflow is True
+
+    def test_max_subscriptions(self):
+        events = JobEvents(max_subscriptions=1)
+        sub = events.subscribe(jobs={"1.pbs00"})
+        with pytest.raises(TooManySubscriptions):
+            events.subscribe(jobs={"2.pbs00"})
+        events.unsubscribe(sub)
+        assert events.subscribe(jobs={"2.pbs00"})
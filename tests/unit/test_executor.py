@@ -0,0 +1,97 @@
+import sys
+import threading
+import time
+
+import pytest
+from shell import CommandError
+
+from src.services.executor import CommandTimeout, Executor, QueueTimeout
+from src.services.metrics import metrics
+from src.utils.jsonstream import iter_items
+
+
+@pytest.fixture()
+def mock_shell():
+    """Run real child processes."""
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+class TestExecutor:
+    def test_run_returns_output(self):
+        executor = Executor()
+        assert executor.run(python("print(' 100.pbs00 ')")) == "100.pbs00"
+
+    def test_failed_command_raises(self):
+        executor = Executor()
+        with pytest.raises(CommandError, match="qsub: error"):
+            executor.run(python("import sys; sys.exit('qsub: error')"))
+        assert executor.running == 0
+
+    def test_runaway_command_is_killed(self):
+        executor = Executor(timeout=0.2)
+        start = time.monotonic()
+        with pytest.raises(CommandTimeout):
+            executor.run(python("import time; time.sleep(10)"))
+        assert time.monotonic() - start < 5
+        assert executor.running == 0
+
+    def test_concurrency_is_capped(self):
+        executor = Executor(max_procs=1, queue_timeout=0.1)
+        thread = threading.Thread(
+            target=executor.run, args=(python("import time; time.sleep(1)"),)
+        )
+        thread.start()
+        while executor.running == 0:
+            time.sleep(0.01)
+
+        with pytest.raises(QueueTimeout):
+            executor.run(python("pass"))
+        assert executor.queue_depth == 0
+        thread.join()
+        assert executor.run(python("print('done')")) == "done"
+
+    def test_queue_depth_published(self):
+        executor = Executor(max_procs=1)
+        sleep = python("import time; time.sleep(0.5)")
+        threads = [threading.Thread(target=executor.run, args=(sleep,)) for _ in "ab"]
+        for thread in threads:
+            thread.start()
+        while executor.queue_depth == 0 or executor.running == 0:
+            time.sleep(0.01)
+        text = metrics.render()
+        assert "# TYPE sched_queue_depth gauge" in text
+        assert "sched_queue_depth 1" in text
+        assert "sched_commands_running 1" in text
+        for thread in threads:
+            thread.join()
+        text = metrics.render()
+        assert "sched_queue_depth 0" in text
+        assert "sched_commands_running 0" in text
+
+    def test_stream_output(self):
+        executor = Executor()
+        with executor.stream(python("print('a'); print('b')")) as fp:
+            assert fp.readline() == "a\n"
+        assert executor.running == 0
+
+    def test_stream_failed_command_raises(self):
+        executor = Executor()
+        with pytest.raises(CommandError, match="qstat: error"):
+            with executor.stream(python("import sys; sys.exit('qstat: error')")) as fp:
+                assert fp.read() == ""
+
+    def test_stream_runaway_command_is_killed(self):
+        executor = Executor(timeout=0.2)
+        with pytest.raises(CommandTimeout):
+            with executor.stream(python("import time; time.sleep(10)")) as fp:
+                fp.read()
+
+    def test_stream_unreadable_output_of_failed_command(self):
+        executor = Executor()
+        cmd = python("import sys; sys.exit('qstat: Unknown Job Id 1.pbs00')")
+        with pytest.raises(CommandError, match="Unknown Job Id"):
+            with executor.stream(cmd) as fp:
+                list(iter_items(fp, key="Jobs"))
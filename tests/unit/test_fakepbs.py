@@ -0,0 +1,112 @@
+import subprocess
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from benchmarks import load
+from benchmarks.fakepbs import install
+from src.app import create_app
+from src.models.job import JobAlter, JobStatus, JobSubmit
+from src.services.pbs import PBS
+
+
+@pytest.fixture()
+def mock_shell():
+    """Commands run for real against the fake toolchain."""
+
+
+@pytest.fixture()
+def pbs_exec(tmp_path):
+    install(str(tmp_path), jobs=5)
+    return str(tmp_path)
+
+
+@pytest.fixture()
+def pbs(pbs_exec):
+    return PBS(env={"EXEC_PATH": pbs_exec})
+
+
+class TestFakePBS:
+    def test_seeded_jobs(self, pbs):
+        assert len(list(pbs.jobs())) == 5
+
+    def test_qsub_qstat_qdel(self, pbs, pbs_exec):
+        job_id = pbs.qsub(JobSubmit(name="test", submit_args="-- /bin/true"))
+        assert job_id == "6.pbs00"
+        job = pbs.qstat(job_id)
+        assert job.name == "test"
+        assert job.status is JobStatus.QUEUE
+
+        qdel = f"{pbs_exec}/bin/qdel"
+        assert subprocess.run([qdel, job_id]).returncode == 0
+        assert pbs.qstat(job_id).status is JobStatus.FINISH
+        result = subprocess.run([qdel, job_id, "99.pbs00"], capture_output=True)
+        assert result.returncode != 0
+        assert b"Unknown Job Id 99.pbs00" in result.stderr
+
+    def test_job_control(self, pbs):
+        job_ids = [pbs.qsub(JobSubmit(submit_args="-- /bin/true")) for _ in range(3)]
+        results = pbs.qhold([*job_ids, "99.pbs00"], workers=2)
+        assert results[:3] == [None] * 3
+        assert "Unknown Job Id 99.pbs00" in str(results[3])
+        assert {job.status for job in map(pbs.qstat, job_ids)} == {JobStatus.HOLD}
+
+        assert pbs.qalter(job_ids[:2], JobAlter(name="renamed")) == [None] * 2
+        assert [pbs.qstat(job_id).name for job_id in job_ids] == [
+            "renamed",
+            "renamed",
+            "STDIN",
+        ]
+
+        # short ids are reported by their full id
+        seqs = [job_id.split(".")[0] for job_id in job_ids]
+        results = pbs.qrls([*seqs, "99"], workers=1)
+        assert results[:3] == [None] * 3
+        assert "Unknown Job Id 99.pbs00" in str(results[3])
+        assert pbs.qdel(job_ids[:1]) == [None]
+        results = pbs.qhold(job_ids)
+        assert "Job has finished" in str(results[0])
+        assert results[1:] == [None] * 2
+
+    def test_unknown_job(self, pbs):
+        assert pbs.qstat("99.pbs00") is None
+
+    def test_failures(self, tmp_path):
+        install(str(tmp_path), failure_rate=1)
+        result = subprocess.run([f"{tmp_path}/bin/qstat"], capture_output=True)
+        assert result.returncode != 0
+        assert b"cannot connect to server" in result.stderr
+
+    def test_job_lifecycle(self, tmp_path):
+        install(str(tmp_path), queue_time=0, run_time=0)
+        pbs = PBS(env={"EXEC_PATH": str(tmp_path)})
+        job_id = pbs.qsub(JobSubmit(submit_args="-- /bin/true"))
+        assert pbs.qstat(job_id).status is JobStatus.FINISH
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert load.percentile(values, 50) == 50
+    assert load.percentile(values, 99) == 99
+    assert load.percentile([], 99) == 0
+
+
+def test_load(pbs_exec):
+    app = create_app(environ="testing", configs={"SCHED_ENV": {"EXEC_PATH": pbs_exec}})
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        results = load.run(
+            f"http://127.0.0.1:{server.port}",
+            "user",
+            "pass",
+            concurrency=2,
+            duration=0.5,
+            mix={"qsub": 1, "qstat": 1},
+        )
+    finally:
+        server.shutdown()
+    assert results["total"].requests > 0
+    assert results["total"].errors == 0
+    assert results["total"].p50 <= results["total"].p99
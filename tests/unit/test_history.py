@@ -0,0 +1,172 @@
+import time
+
+import pytest
+
+from benchmarks.fakepbs import install
+from src.models.job import JobStatus
+from src.services.history import JobHistory
+from src.services.pbs import PBS
+
+
+@pytest.fixture()
+def mock_shell():
+    """Commands run for real against the fake toolchain."""
+
+
+@pytest.fixture()
+def history(tmp_path):
+    return JobHistory(str(tmp_path / "history.db"))
+
+
+def _record(state, owner="alice", queue="workq", mtime="Fri Feb  3 10:42:28 2023"):
+    return {
+        "job_state": state,
+        "Job_Owner": f"{owner}@ln01",
+        "queue": queue,
+        "mtime": mtime,
+    }
+
+
+class TestJobHistory:
+    def test_only_finished_jobs_kept(self, history):
+        added = history.add(
+            [
+                ("1.pbs00", _record("F")),
+                ("2.pbs00", _record("R")),
+                ("3.pbs00", _record("M")),
+            ]
+        )
+        assert added == 2
+        assert history.get("1.pbs00") == ("1.pbs00", _record("F"))
+        assert history.get("2.pbs00") is None
+        assert history.add([("1.pbs00", _record("F"))]) == 0
+
+    def test_find(self, history):
+        history.add(
+            [
+                ("10.pbs00", _record("F", owner="bob")),
+                ("9.pbs00", _record("F", queue="gpu")),
+                ("2.pbs00", _record("M", mtime="Sat Feb  4 10:00:00 2023")),
+            ]
+        )
+        ids = lambda records: [job_id for job_id, _ in records]  # noqa: E731
+        assert ids(history.find()) == ["2.pbs00", "9.pbs00", "10.pbs00"]
+        assert ids(history.find(states=["F"])) == ["9.pbs00", "10.pbs00"]
+        assert ids(history.find(owner="alice@ln01")) == ["2.pbs00", "9.pbs00"]
+        assert ids(history.find(owner="bob", queue="workq")) == ["10.pbs00"]
+        assert ids(history.find(queue="gpu")) == ["9.pbs00"]
+        feb_4 = time.mktime((2023, 2, 4, 0, 0, 0, 0, 0, -1))
+        assert ids(history.find(ended_after=feb_4)) == ["2.pbs00"]
+        assert ids(history.find(limit=1)) == ["2.pbs00"]
+
+    def test_shared_by_instances(self, history):
+        history.add([("1.pbs00", _record("F"))], synced_at=time.time())
+        other = JobHistory(history.path)
+        assert other.get("1.pbs00")
+        assert other.fresh
+
+    def test_fresh(self, history):
+        assert not history.fresh
+        history.add([], synced_at=time.time() - 120)
+        assert not history.fresh
+        history.add([], synced_at=time.time())
+        assert history.fresh
+
+
+class TestPBSHistory:
+    @pytest.fixture()
+    def pbs_exec(self, tmp_path):
+        install(str(tmp_path), jobs=20)
+        return str(tmp_path)
+
+    @pytest.fixture()
+    def pbs(self, pbs_exec, history, mocker):
+        pbs = PBS(env={"EXEC_PATH": pbs_exec}, history=history)
+        pbs.calls = mocker.spy(pbs.executor, "stream")
+        return pbs
+
+    @staticmethod
+    def _argv(pbs):
+        return [call.args[0][1:] for call in pbs.calls.call_args_list]
+
+    def test_finished_job_stored_on_miss(self, pbs):
+        job_id = next(
+            job_id for job_id, job in pbs.jobs() if job.status is JobStatus.FINISH
+        )
+        pbs.history = JobHistory(pbs.history.path + "2")
+        pbs.calls.reset_mock()
+
+        assert pbs.qstat(job_id).status is JobStatus.FINISH
+        assert self._argv(pbs) == [
+            ["-f", "-F", "json", "--", job_id],
+            ["-x", "-f", "-F", "json", "--", job_id],
+        ]
+        assert pbs.qstat(job_id).status is JobStatus.FINISH
+        assert pbs.calls.call_count == 2
+
+    def test_live_job_looked_up_without_history(self, pbs):
+        job_id = next(
+            job_id for job_id, job in pbs.jobs() if job.status is JobStatus.RUNNING
+        )
+        pbs.calls.reset_mock()
+        assert pbs.qstat(job_id).status is JobStatus.RUNNING
+        assert self._argv(pbs) == [["-f", "-F", "json", "--", job_id]]
+        assert pbs.history.get(job_id) is None
+
+    def test_unknown_job(self, pbs):
+        assert pbs.qstat("100.pbs00") is None
+        assert pbs.calls.call_count == 1
+
+    def test_listing_from_synced_store(self, pbs, pbs_exec):
+        cli = PBS(env={"EXEC_PATH": pbs_exec})
+        expected = cli.qstat()
+        assert pbs.qstat() == expected
+        assert self._argv(pbs) == [["-x", "-f", "-F", "json"]]
+        assert pbs.history.fresh
+
+        pbs.calls.reset_mock()
+        assert {job.job_id for job in pbs.qstat()} == {job.job_id for job in expected}
+        assert self._argv(pbs) == [["-f", "-F", "json"]]
+
+        pbs.calls.reset_mock()
+        owner = next(job.owner for job in expected if job.status is JobStatus.FINISH)
+        finished = pbs.qstat(status=JobStatus.FINISH, owner=owner)
+        assert finished
+        assert finished == cli.qstat(status=JobStatus.FINISH, owner=owner)
+        assert pbs.calls.call_count == 0
+
+    def test_job_finished_since_sync(self, pbs):
+        assert pbs.qstat()
+        assert pbs.history.fresh
+        job_id = pbs.qstat(status=JobStatus.RUNNING)[0].job_id
+        assert pbs.qdel([job_id]) == [None]
+
+        # neither live nor stored yet, the server history still has it
+        jobs = {job.job_id: job for job in pbs.qstat()}
+        assert jobs[job_id].status is JobStatus.FINISH
+        finished = pbs.qstat(status=JobStatus.FINISH)
+        assert [job.job_id for job in finished].count(job_id) == 1
+        assert pbs.history.get(job_id) is not None
+
+    def test_listing_as_user_not_synced(self, pbs, mocker):
+        # the server may only show users their own finished jobs
+        pbs.username = "alice"
+        pbs.broker = mocker.Mock()
+        pbs.broker.stream.side_effect = lambda user, argv: pbs.executor.stream(argv)
+        assert pbs.qstat()
+        assert pbs.history.find()
+        assert pbs.history.synced_at is None
+
+    def test_jobs_finished_since_sync_in_chunks(self, pbs, mocker):
+        assert pbs.qstat()
+        running = [job.job_id for job in pbs.qstat(status=JobStatus.RUNNING)]
+        assert len(running) > 1
+        assert pbs.qdel(running) == [None] * len(running)
+
+        mocker.patch("src.services.pbs._ARGV_MAX", len(running[0]) + 1)
+        pbs.calls.reset_mock()
+        finished = {job.job_id for job in pbs.qstat(status=JobStatus.FINISH)}
+        assert set(running) <= finished
+        assert self._argv(pbs) == [
+            ["-x", "-f", "-F", "json", "--", job_id] for job_id in running
+        ]
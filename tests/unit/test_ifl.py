@@ -0,0 +1,193 @@
+import io
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+from benchmarks.fakepbs import install, serve
+from src.models.job import JobStatus
+from src.services.ifl import (
+    IFL,
+    UNKNOWN_JOB,
+    BatchError,
+    ConnectionPool,
+    Reader,
+    Reply,
+    Request,
+    Writer,
+)
+from src.services.pbs import PBS, build_job
+
+
+@pytest.fixture()
+def mock_shell():
+    """Commands run for real against the fake toolchain."""
+
+
+@pytest.fixture()
+def pbs_exec(tmp_path):
+    install(str(tmp_path), jobs=5)
+    return str(tmp_path)
+
+
+@pytest.fixture()
+def server(pbs_exec):
+    server = serve(pbs_exec)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture()
+def pool(server):
+    host, port = server.server_address
+    pool = ConnectionPool(host, port=port, size=2, timeout=5, auth=None)
+    yield pool
+    pool.close()
+
+
+def _munge(method):
+    def auth(conn):
+        body = Writer().string(method).string("").string("MUNGE:cred")
+        conn.request(Request.AUTHENTICATE, body.getvalue())
+
+    return auth
+
+
+class TestDIS:
+    @pytest.mark.parametrize(
+        "value, encoded",
+        [
+            (0, b"+0"),
+            (5, b"+5"),
+            (-5, b"-5"),
+            (12, b"2+12"),
+            (123456789012, b"212+123456789012"),
+        ],
+    )
+    def test_int(self, value, encoded):
+        assert Writer().int(value).getvalue() == encoded
+        assert Reader(io.BytesIO(encoded)).int() == value
+
+    def test_string(self):
+        encoded = Writer().string("abc").string("").string("é" * 6).getvalue()
+        assert encoded.startswith(b"+3abc+0")
+        reader = Reader(io.BytesIO(encoded))
+        assert [reader.string() for _ in range(3)] == ["abc", "", "é" * 6]
+
+    def test_attrs(self):
+        attrs = [("Job_Name", None, "test"), ("Resource_List", "ncpus", "4")]
+        encoded = Writer().attrs(attrs).getvalue()
+        assert Reader(io.BytesIO(encoded)).attrs() == attrs
+
+    def test_unsigned(self):
+        with pytest.raises(ValueError):
+            Writer().uint(-1)
+        with pytest.raises(ValueError):
+            Reader(io.BytesIO(b"-1")).uint()
+
+    @pytest.mark.parametrize("encoded", [b"", b"3+12", b"x"])
+    def test_malformed(self, encoded):
+        with pytest.raises((ConnectionError, ValueError)):
+            Reader(io.BytesIO(encoded)).int()
+
+
+class TestIFL:
+    def test_statjob_matches_qstat(self, pool, pbs_exec):
+        records = IFL(pool).statjob(history=True)
+        assert [job_id for job_id, _ in records] == [f"{n}.pbs00" for n in range(1, 6)]
+        jobs = PBS(env={"EXEC_PATH": pbs_exec}).jobs()
+        assert [build_job(*record) for record in records] == [job for _, job in jobs]
+
+    def test_statjob_times_as_epochs(self, mocker):
+        # pbs_server sends times as seconds since the epoch, not as qstat dates
+        created = datetime(2023, 2, 3, 10, 41, 52)
+        epoch = str(int(created.timestamp()))
+        attrs = [
+            ("Job_Name", None, "test"),
+            ("Job_Owner", None, "user@pbs00"),
+            ("job_state", None, "F"),
+            ("queue", None, "workq"),
+            ("ctime", None, epoch),
+            ("mtime", None, epoch),
+            ("qtime", None, epoch),
+            ("etime", None, epoch),
+            ("stime", None, epoch),
+            ("obittime", None, epoch),
+            ("Resource_List", "ncpus", "4"),
+            ("Exit_status", None, "0"),
+        ]
+        body = Writer().uint(1).uint(2).string("1.pbs00").attrs(attrs).getvalue()
+        conn = mocker.Mock()
+        conn.request.return_value = (Reply.STATUS, Reader(io.BytesIO(body)))
+        pool = mocker.Mock()
+        pool.connection = contextmanager(lambda fresh=False: iter([conn]))
+
+        ((job_id, record),) = IFL(pool).statjob("1.pbs00", history=True)
+        assert record["ctime"] == "Fri Feb 3 10:41:52 2023"
+        job = build_job(job_id, record)
+        assert job.timeline.created_at == created
+        assert job.timeline.updated_at == created
+
+    def test_statjob_by_id(self, pool):
+        ((job_id, record),) = IFL(pool).statjob("3.pbs00", history=True)
+        assert job_id == "3.pbs00"
+        assert isinstance(record["Resource_List"], dict)
+        assert isinstance(record["Variable_List"], dict)
+
+    def test_unknown_job(self, pool):
+        with pytest.raises(BatchError) as ex:
+            IFL(pool).statjob("100.pbs00", history=True)
+        assert ex.value.code == UNKNOWN_JOB
+        assert "Unknown Job Id" in str(ex.value)
+
+    def test_connections_reused(self, pool, server):
+        ifl = IFL(pool)
+        for _ in range(5):
+            ifl.statjob("1.pbs00", history=True)
+        with pytest.raises(BatchError):
+            ifl.statjob("100.pbs00", history=True)
+        ifl.statjob("1.pbs00", history=True)
+        assert server.connections == 1
+        assert server.requests == 7
+
+    def test_reconnect(self, pool, server):
+        ifl = IFL(pool)
+        ifl.statjob("1.pbs00", history=True)
+        pool._idle[0].sock.shutdown(socket.SHUT_RDWR)
+        ifl.statjob("1.pbs00", history=True)
+        assert server.connections == 2
+
+    def test_auth(self, server):
+        host, port = server.server_address
+        pool = ConnectionPool(host, port=port, auth=_munge("munge"))
+        IFL(pool).statjob("1.pbs00", history=True)
+        pool.close()
+
+        pool = ConnectionPool(host, port=port, auth=_munge("none"))
+        with pytest.raises(BatchError):
+            IFL(pool).statjob("1.pbs00", history=True)
+        assert not pool._idle
+
+
+class TestPBSTransport:
+    def test_qstat(self, pool, pbs_exec, server):
+        pbs = PBS(env={"EXEC_PATH": pbs_exec}, ifl=IFL(pool))
+        assert pbs.qstat("2.pbs00").job_id == "2.pbs00"
+        assert pbs.qstat("100.pbs00") is None
+        cli = PBS(env={"EXEC_PATH": pbs_exec})
+        assert pbs.qstat(queue="workq") == cli.qstat(queue="workq")
+        assert pbs.qstat(status=JobStatus.QUEUE) == cli.qstat(status=JobStatus.QUEUE)
+        assert server.requests == 4
+
+    def test_fallback_to_cli(self, pbs_exec):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        pool = ConnectionPool("127.0.0.1", port=port, timeout=5, auth=None)
+        pbs = PBS(env={"EXEC_PATH": pbs_exec}, ifl=IFL(pool))
+        assert pbs.qstat("2.pbs00").job_id == "2.pbs00"
@@ -1,6 +1,13 @@
+import json
+from copy import deepcopy
 from datetime import datetime
+from typing import Optional
 
-from src.models.job import JobStatus
+import pytest
+from pydantic import BaseModel, Field, ValidationError, root_validator, validator
+from pydantic.utils import lenient_issubclass
+
+from src.models.job import JobStat, JobStatus
 
 
 def test_qsub_deserializer(qsub_job):
@@ -79,3 +86,102 @@ def test_job_qsub_clause(qsub_job):
         "-- /bin/sleep 1000"
     )
     assert qsub_job.to_qsub() == qsub
+
+
+def test_job_qsub_argv(qsub_job):
+    job = qsub_job.copy(deep=True)
+    job.extra.env["PS1"] = "\\u@\\h $ "
+    job.extra.notify_on.to.append("other@email.com")
+    argv = job.to_argv()
+    assert argv[:6] == ["-I", "-r", "y", "-V", "-X", "-N"]
+    assert argv[argv.index("-M") + 1] == "testu@email.com, other@email.com"
+    assert argv[argv.index("-v") + 1] == (
+        "HOME=/home/user, SHELL=/bin/bash, PS1=\\u@\\h $ "
+    )
+    assert argv[argv.index("-W") + 1] == "block=True, umask=33"
+    assert argv[-3:] == ["--", "/bin/sleep", "1000"]
+
+
+class LegacyJobTimeline(BaseModel):
+    created_at: Optional[datetime] = Field(None, alias="ctime")
+    updated_at: Optional[datetime] = Field(None, alias="mtime")
+    queued_at: Optional[datetime] = Field(None, alias="qtime")
+    ready_at: Optional[datetime] = Field(None, alias="etime")
+
+    @validator("*", pre=True)
+    def parse_date(cls, value):
+        return datetime.strptime(value, "%a %b %d %H:%M:%S %Y")
+
+
+class LegacyJobStat(JobStat):
+    """JobStat as built before the precompiled field plans."""
+
+    timeline: Optional[LegacyJobTimeline] = None
+
+    @root_validator(pre=True)
+    def unflatten(cls, values):
+        return legacy_unflatten(model=cls, values=values)
+
+    @root_validator(pre=True)
+    def extra_fields(cls, values):
+        values["extra"] = legacy_build_extra(cls, deepcopy(values))
+        return values
+
+
+def legacy_build_extra(model, values):
+    for field in model.__fields__.values():
+        if lenient_issubclass(field.type_, BaseModel):
+            legacy_build_extra(field.type_, values)
+        if field.alias in values:
+            values.pop(field.alias)
+    return values
+
+
+def legacy_unflatten(model, values):
+    parsed, objs = deepcopy(values), []
+    for field in model.__fields__.values():
+        if lenient_issubclass(field.type_, BaseModel):
+            objs.append(field)
+        else:
+            if field.alias in values:
+                values.pop(field.alias)
+    for field in objs:
+        if field.alias in values:
+            values.update(values[field.alias])
+            values.pop(field.alias)
+        parsed[field.alias] = legacy_unflatten(field.type_, values)
+    return parsed
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {},
+        {"Resource_List": None, "resources_used": None, "ctime": None},
+        {"ctime": "Fri Feb  3 09:05:02 2023", "mtime": "Mon Jan 30 23:59:59 2023"},
+        {"ctime": "fri feb 3 10:41:52 2023"},
+        {"paths": {"stdout": "/tmp/o", "Error_Path": "/tmp/e"}, "Output_Path": None},
+        {"resources": {"Resource_List": {"ncpus": 2}}, "Resource_List": None},
+        {"walltime": "01:00:00", "mem": "1gb", "stdout": "/tmp/o", "hold": True},
+        {"Mail_Points": "abe", "Mail_Users": "a@email.com,b@email.com"},
+        {"array": True, "array_indices_submitted": "0-99:2", "extra": {"a": 1}},
+    ],
+)
+def test_qstat_deserializer_matches_legacy(qstat_data, changes):
+    job_data = json.loads(qstat_data)["Jobs"]["1000.pbs00"]
+    job_data.update(changes)
+    job_data = {k: v for k, v in job_data.items() if v is not None}
+
+    job = JobStat(job_id="1000.pbs00", **deepcopy(job_data))
+    legacy = LegacyJobStat(job_id="1000.pbs00", **deepcopy(job_data))
+    assert job.dict() == legacy.dict()
+    assert job.json() == legacy.json()
+
+
+def test_qstat_deserializer_invalid_date(qstat_data):
+    job_data = json.loads(qstat_data)["Jobs"]["1000.pbs00"]
+    for value in ("Fri Feb 30 10:41:52 2023", "Xyz Feb 3 10:41:52 2023", 1675417312):
+        with pytest.raises(ValidationError):
+            JobStat(**{**job_data, "ctime": value})
+        with pytest.raises(ValidationError):
+            LegacyJobStat(**{**job_data, "ctime": value})
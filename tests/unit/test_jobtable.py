@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import pytest
+
+from src.models.job import JobStatus
+from src.services.jobtable import JobTable, decode_cursor, encode_cursor
+from src.services.records import JobRecord
+
+
+def _job(seq, owner="alice", queue="workq", state="R", day=1):
+    record = {
+        "Job_Owner": f"{owner}@ln01",
+        "queue": queue,
+        "job_state": state,
+        "ctime": f"Wed Feb  {day} 10:00:00 2023",
+    }
+    return JobRecord(f"{seq}.pbs00", record)
+
+
+@pytest.fixture()
+def table():
+    jobs = [
+        _job(1, day=3),
+        _job(2, owner="bob", day=1),
+        _job(3, queue="gpu", state="Q", day=2),
+        _job(4, state="F", day=2),
+        _job(5, owner="bob", queue="gpu", state="Q", day=4),
+        _job(6, day=4),
+    ]
+    return JobTable({job.job_id: job for job in jobs})
+
+
+def _ids(page):
+    jobs, _ = page
+    return [job.job_id.split(".")[0] for job in jobs]
+
+
+def _pages(table, limit, **kwargs):
+    pages, after = [], None
+    while True:
+        page = table.page(after=after, limit=limit, **kwargs)
+        pages.append(_ids(page))
+        _, after = page
+        if after is None:
+            return pages
+
+
+class TestJobTable:
+    def test_ordered_by_creation(self, table):
+        assert len(table) == 6
+        assert _ids(table.page()) == ["2", "3", "4", "1", "5", "6"]
+
+    @pytest.mark.parametrize(
+        "kwargs, expected",
+        [
+            ({"owner": "bob"}, ["2", "5"]),
+            ({"owner": "bob@ln01", "queue": "gpu"}, ["5"]),
+            ({"queue": "workq"}, ["2", "4", "1", "6"]),
+            ({"statuses": [JobStatus.QUEUE]}, ["3", "5"]),
+            ({"statuses": [JobStatus.RUNNING, JobStatus.FINISH]}, ["2", "4", "1", "6"]),
+            ({"owner": "alice", "queue": "gpu", "statuses": [JobStatus.RUNNING]}, []),
+            ({"owner": "carol"}, []),
+        ],
+    )
+    def test_filters(self, table, kwargs, expected):
+        assert _ids(table.page(**kwargs)) == expected
+
+    def test_created_range(self, table):
+        page = table.page(
+            created_after=datetime(2023, 2, 2, 10), created_before=datetime(2023, 2, 4)
+        )
+        assert _ids(page) == ["3", "4", "1"]
+
+    def test_pages(self, table):
+        assert _pages(table, limit=2) == [["2", "3"], ["4", "1"], ["5", "6"]]
+        assert _pages(table, limit=4, queue="workq") == [["2", "4", "1", "6"]]
+        statuses = [JobStatus.RUNNING, JobStatus.QUEUE]
+        assert _pages(table, limit=2, statuses=statuses) == [
+            ["2", "3"],
+            ["1", "5"],
+            ["6"],
+        ]
+
+    def test_cursor_outlives_table(self, table):
+        page = table.page(limit=3)
+        assert _ids(page) == ["2", "3", "4"]
+        _, after = page
+
+        # jobs gone or added before the cursor do not shift the next page
+        jobs = [_job(1, day=3), _job(5, day=4), _job(6, day=4), _job(7, day=1)]
+        table = JobTable({job.job_id: job for job in jobs})
+        assert _ids(table.page(after=after)) == ["1", "5", "6"]
+
+    def test_cursor(self):
+        key = (1675414912.0, 12, "12.pbs00")
+        assert decode_cursor(encode_cursor(key)) == key
+        for cursor in ("", "abc", encode_cursor(("1", 2, "3.pbs00"))):
+            with pytest.raises(ValueError):
+                decode_cursor(cursor)
@@ -0,0 +1,40 @@
+import io
+import json
+
+import pytest
+
+from src.utils.jsonstream import iter_items
+
+
+@pytest.fixture(scope="module")
+def document():
+    jobs = {
+        f"{idx}.pbs00": {"job_state": "R", "session_id": idx, "comment": "x" * idx}
+        for idx in range(100)
+    }
+    return {"timestamp": 1675419712, "pbs_version": "22.05", "Jobs": jobs}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_iter_items(document, chunk_size):
+    fp = io.StringIO(json.dumps(document, indent=4))
+    items = iter_items(fp, key="Jobs", chunk_size=chunk_size)
+    assert list(items) == list(document["Jobs"].items())
+
+
+def test_iter_items_missing_key():
+    assert list(iter_items(io.StringIO('{"timestamp": 1}'), key="Jobs")) == []
+    assert list(iter_items(io.StringIO('{"Jobs": {}}'), key="Jobs")) == []
+
+
+def test_iter_items_is_lazy(document):
+    fp = io.StringIO(json.dumps(document))
+    items = iter_items(fp, key="Jobs", chunk_size=64)
+    assert next(items) == ("0.pbs00", document["Jobs"]["0.pbs00"])
+    assert fp.tell() < len(fp.getvalue())
+
+
+@pytest.mark.parametrize("data", ["", '{"Jobs": {"1.pbs00": {}', "[]"])
+def test_iter_items_invalid_document(data):
+    with pytest.raises(ValueError):
+        list(iter_items(io.StringIO(data), key="Jobs"))
@@ -0,0 +1,117 @@
+import multiprocessing
+import time
+
+import pytest
+
+from src.services.limits import Limiter, RateLimited
+
+
+@pytest.fixture()
+def limiter(tmp_path):
+    return Limiter(
+        directory=str(tmp_path),
+        user_rate=1.0,
+        user_burst=2,
+        global_rate=1.0,
+        global_burst=3,
+        user_max_inflight=1,
+        max_inflight=2,
+    )
+
+
+def _hold_slot(directory, held, release):
+    limiter = Limiter(directory=directory, max_inflight=1)
+    with limiter.inflight("bob"):
+        held.set()
+        release.wait(10)
+
+
+class TestLimiter:
+    def test_user_rate(self, limiter):
+        limiter.admit("alice")
+        limiter.admit("alice")
+        with pytest.raises(RateLimited) as ex:
+            limiter.admit("alice")
+        assert 0 < ex.value.retry_after <= 1
+        assert "user" in str(ex.value)
+
+    def test_global_rate(self, limiter):
+        limiter.admit("alice")
+        limiter.admit("bob")
+        limiter.admit("carol")
+        with pytest.raises(RateLimited, match="global"):
+            limiter.admit("dave")
+
+    def test_turned_down_requests_take_no_tokens(self, limiter):
+        limiter.admit("alice")
+        limiter.admit("alice")
+        for _ in range(5):
+            with pytest.raises(RateLimited):
+                limiter.admit("alice")
+        limiter.admit("bob")
+
+    def test_refill(self, tmp_path):
+        limiter = Limiter(directory=str(tmp_path), user_rate=100.0, user_burst=1)
+        limiter.admit("alice")
+        with pytest.raises(RateLimited):
+            limiter.admit("alice")
+        time.sleep(0.02)
+        limiter.admit("alice")
+
+    def test_shared_by_instances(self, limiter):
+        limiter.admit("alice")
+        limiter.admit("alice")
+        other = Limiter(directory=limiter.directory, user_rate=1.0, user_burst=2)
+        with pytest.raises(RateLimited):
+            other.admit("alice")
+
+    def test_no_limits(self, tmp_path):
+        limiter = Limiter(directory=str(tmp_path))
+        for _ in range(10):
+            limiter.admit("alice")
+            with limiter.inflight("alice"):
+                pass
+
+    def test_user_inflight(self, limiter):
+        with limiter.inflight("alice"):
+            with pytest.raises(RateLimited, match="user limit of 1"):
+                with limiter.inflight("alice"):
+                    pass
+            with limiter.inflight("bob"):
+                pass
+        with limiter.inflight("alice"):
+            pass
+
+    def test_global_inflight(self, limiter):
+        with limiter.inflight("alice"), limiter.inflight("bob"):
+            with pytest.raises(RateLimited, match="global limit of 2") as ex:
+                with limiter.inflight("carol"):
+                    pass
+        assert ex.value.retry_after > 0
+        with limiter.inflight("carol"):
+            pass
+
+    def test_slot_released_on_error(self, limiter):
+        with pytest.raises(ValueError):
+            with limiter.inflight("alice"):
+                raise ValueError
+        with limiter.inflight("alice"):
+            pass
+
+    def test_inflight_wait(self, tmp_path):
+        limiter = Limiter(directory=str(tmp_path), max_inflight=1, inflight_wait=5)
+        ctx = multiprocessing.get_context("spawn")
+        held, release = ctx.Event(), ctx.Event()
+        proc = ctx.Process(target=_hold_slot, args=(str(tmp_path), held, release))
+        proc.start()
+        try:
+            assert held.wait(10)
+            with pytest.raises(RateLimited):
+                with Limiter(directory=str(tmp_path), max_inflight=1).inflight("a"):
+                    pass
+            release.set()
+            with limiter.inflight("alice"):
+                pass
+        finally:
+            release.set()
+            proc.join(10)
@@ -0,0 +1,80 @@
+import multiprocessing
+
+import pytest
+
+from src.services.metrics import Metrics
+
+
+@pytest.fixture()
+def registry():
+    return Metrics()
+
+
+def _worker(directory):
+    registry = Metrics(directory=directory)
+    counter = registry.counter("jobs_total", "Jobs.", labels=("action",))
+    counter.inc(action="qsub")
+    registry.flush()
+
+
+class TestMetrics:
+    def test_counter(self, registry):
+        counter = registry.counter("jobs_total", "Jobs.", labels=("action",))
+        counter.inc(action="qsub")
+        counter.inc(2, action="qsub")
+        counter.inc(action="qstat")
+        text = registry.render()
+        assert "# TYPE jobs_total counter" in text
+        assert 'jobs_total{action="qsub"} 3' in text
+        assert 'jobs_total{action="qstat"} 1' in text
+
+    def test_gauge(self, registry):
+        gauge = registry.gauge("queue_depth", "Queued.", labels=("pool",))
+        gauge.inc(pool="a")
+        gauge.inc(2, pool="a")
+        gauge.dec(pool="a")
+        gauge.set(5, pool="b")
+        text = registry.render()
+        assert "# TYPE queue_depth gauge" in text
+        assert 'queue_depth{pool="a"} 2' in text
+        assert 'queue_depth{pool="b"} 5' in text
+
+    def test_histogram(self, registry):
+        histogram = registry.histogram("wait_seconds", "Wait.", buckets=(0.1, 1.0))
+        histogram.observe(0.0625)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        text = registry.render()
+        assert 'wait_seconds_bucket{le="0.1"} 1' in text
+        assert 'wait_seconds_bucket{le="1.0"} 2' in text
+        assert 'wait_seconds_bucket{le="+Inf"} 3' in text
+        assert "wait_seconds_sum 5.5625" in text
+        assert "wait_seconds_count 3" in text
+
+    def test_histogram_timer_labels(self, registry):
+        histogram = registry.histogram("auth_seconds", "Auth.", labels=("cache",))
+        with histogram.time(cache="miss") as labels:
+            labels["cache"] = "hit"
+        assert 'auth_seconds_count{cache="hit"} 1' in registry.render()
+
+    def test_duplicate_metric(self, registry):
+        registry.counter("jobs_total", "Jobs.")
+        with pytest.raises(ValueError):
+            registry.counter("jobs_total", "Jobs.")
+
+    def test_label_escaping(self, registry):
+        counter = registry.counter("jobs_total", "Jobs.", labels=("name",))
+        counter.inc(name='a"b')
+        assert 'jobs_total{name="a\\"b"} 1' in registry.render()
+
+    def test_aggregates_processes(self, tmp_path):
+        ctx = multiprocessing.get_context("spawn")
+        for _ in range(2):
+            proc = ctx.Process(target=_worker, args=(str(tmp_path),))
+            proc.start()
+            proc.join()
+
+        registry = Metrics(directory=str(tmp_path))
+        counter = registry.counter("jobs_total", "Jobs.", labels=("action",))
+        counter.inc(action="qsub")
+        assert 'jobs_total{action="qsub"} 3' in registry.render()
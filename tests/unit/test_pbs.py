@@ -1,7 +1,14 @@
+import json
+import time
+
 import pytest
 
+from benchmarks.generator import qstat_array_json
+from src.services.coalesce import Coalescer
+from src.services.limits import Limiter, RateLimited
+from src.services import pbs as pbs_module
 from src.services.pbs import PBS
-from src.models.job import JobStat, JobSubmit
+from src.models.job import JobAlter, JobStat, JobStatus, JobSubmit
 
 
 @pytest.fixture(scope="class")
@@ -39,5 +46,222 @@ class TestPBSService:
         assert job.account == "pbs_account"
         assert job.project == "_pbs_project_default"
 
-    def test_qsub(self, pbs, job_submit):
-        pbs.qsub(props=job_submit)
+    def test_qstat_job_id(self, pbs, qstat_data, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        job = pbs.qstat(job_id="1000.pbs00")
+        assert job.job_id == "1000.pbs00"
+
+    def test_qstat_list(self, pbs, qstat_data, mock_shell):
+        data = json.loads(qstat_data)
+        job_data = data["Jobs"]["1000.pbs00"]
+        data["Jobs"]["1001.pbs00"] = {**job_data, "job_state": "Q"}
+        data["Jobs"]["1002.pbs00"] = {**job_data, "Job_Owner": "otheru@ln01"}
+        mock_shell.configure_mock(**{"output.return_value": json.dumps(data)})
+
+        jobs = pbs.qstat()
+        assert [job.job_id for job in jobs] == [
+            "1000.pbs00",
+            "1001.pbs00",
+            "1002.pbs00",
+        ]
+        assert (
+            mock_shell.run.call_args.args[0]
+            == "/opt/pbs/bin/qstat -x -f -F json".split()
+        )
+
+        jobs = pbs.qstat(status=[JobStatus.RUNNING], owner="testu", queue="workq")
+        assert [job.job_id for job in jobs] == ["1000.pbs00"]
+        assert (
+            mock_shell.run.call_args.args[0]
+            == "/opt/pbs/bin/qstat -f -F json -- workq".split()
+        )
+
+        jobs = pbs.qstat(status=JobStatus.FINISH)
+        assert jobs == []
+        assert (
+            mock_shell.run.call_args.args[0]
+            == "/opt/pbs/bin/qstat -x -f -F json".split()
+        )
+
+    def test_qsub(self, pbs, job_submit, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": "100.pbs00\n"})
+        assert pbs.qsub(props=job_submit) == "100.pbs00"
+        argv = mock_shell.run.call_args.args[0]
+        assert argv == ["/opt/pbs/bin/qsub", *job_submit.to_argv()]
+
+    def test_qdel_chunked(self, pbs, mock_shell):
+        job_ids = [f"{seq}.pbs00" for seq in range(10)]
+        assert pbs.qdel(job_ids + ["0.pbs00"], workers=3) == [None] * 11
+        chunks = sorted(call.args[0][2:] for call in mock_shell.run.call_args_list)
+        assert chunks == [job_ids[:4], job_ids[4:8], job_ids[8:]]
+        assert all(
+            call.args[0][:2] == ["/opt/pbs/bin/qdel", "--"]
+            for call in mock_shell.run.call_args_list
+        )
+
+    def test_chunks_fit_argv(self, monkeypatch):
+        monkeypatch.setattr(pbs_module, "_ARGV_MAX", 20)
+        job_ids = [f"{seq}.pbs00" for seq in range(100, 105)]
+        assert pbs_module._chunks(job_ids, size=4) == [
+            job_ids[:2],
+            job_ids[2:4],
+            job_ids[4:],
+        ]
+
+    def test_qhold_errors_per_job(self, pbs, mock_shell):
+        mock_shell.configure_mock(
+            code=168,
+            **{
+                "errors.return_value": "qhold: Unknown Job Id 2.pbs00\n"
+                "qhold: Request invalid for state of job 3.pbs00\n"
+            },
+        )
+        results = pbs.qhold(["1.pbs00", "2.pbs00", "3.pbs00"], workers=1)
+        assert [str(ex) if ex else None for ex in results] == [
+            None,
+            "qhold: Unknown Job Id 2.pbs00",
+            "qhold: Request invalid for state of job 3.pbs00",
+        ]
+
+        # errors name jobs by their full id, whatever they were given as
+        results = pbs.qhold(["1", "2", "3.pbs00.example.com"], workers=1)
+        assert [str(ex) if ex else None for ex in results] == [
+            None,
+            "qhold: Unknown Job Id 2.pbs00",
+            "qhold: Request invalid for state of job 3.pbs00",
+        ]
+
+        mock_shell.configure_mock(**{"errors.return_value": "cannot connect"})
+        results = pbs.qrls(["1.pbs00", "2.pbs00"], workers=1)
+        assert [str(ex) for ex in results] == ["cannot connect"] * 2
+
+    def test_qalter(self, pbs, mock_shell):
+        props = JobAlter(
+            name="renamed", priority=10, resources={"walltime": "01:00:00"}
+        )
+        assert pbs.qalter(["1.pbs00"], props) == [None]
+        argv = mock_shell.run.call_args.args[0]
+        assert argv == [
+            "/opt/pbs/bin/qalter",
+            "-N",
+            "renamed",
+            "-l",
+            "walltime=01:00:00",
+            "-p",
+            "10",
+            "--",
+            "1.pbs00",
+        ]
+
+    def test_control_checks_ids(self, pbs, mock_shell):
+        results = pbs.qdel(["-Wforce", "1.pbs00"], workers=1)
+        assert isinstance(results[0], ValueError)
+        assert results[1] is None
+        assert mock_shell.run.call_args.args[0] == [
+            "/opt/pbs/bin/qdel",
+            "--",
+            "1.pbs00",
+        ]
+
+    def test_control_checks_owners(self, qstat_data, mock_shell):
+        data = json.loads(qstat_data)
+        job_data = data["Jobs"]["1000.pbs00"]
+        data["Jobs"]["1001.pbs00"] = {**job_data, "Job_Owner": "otheru@ln01"}
+        data["Jobs"]["1003[].pbs00"] = {**job_data, "Job_Owner": "testu@ln01"}
+        mock_shell.configure_mock(**{"output.return_value": json.dumps(data)})
+
+        # without a broker, commands run as the service on any job
+        pbs = PBS(env={"EXEC_PATH": "/opt/pbs"}, username="testu")
+        job_ids = ["1000", "1001.pbs00", "1002.pbs00", "1003[2].pbs00"]
+        results = pbs.qdel(job_ids, workers=1)
+        assert [str(ex) if ex else None for ex in results] == [
+            None,
+            "qdel: Unauthorized Request 1001.pbs00",
+            "qdel: Unknown Job Id 1002.pbs00",
+            None,
+        ]
+        assert mock_shell.run.call_args.args[0] == [
+            "/opt/pbs/bin/qdel",
+            "--",
+            "1000",
+            "1003[2].pbs00",
+        ]
+
+    def test_qstat_array(self, pbs, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": qstat_array_json(20)})
+        array = pbs.qstat_array("0.pbs00", indices={2, 15, 30})
+        argv = mock_shell.run.call_args.args[0]
+        assert argv == [
+            "/opt/pbs/bin/qstat",
+            "-x",
+            "-t",
+            "-f",
+            "-F",
+            "json",
+            "--",
+            "0[].pbs00",
+        ]
+        assert array.status is JobStatus.ARRAY_JOB
+        assert array.array_range == "1-20"
+        assert array.total == 20
+        assert array.counts == {"X": 10, "R": 2, "Q": 8}
+        assert array.ranges == {"X": "1-10", "R": "11-12", "Q": "13-20"}
+        assert [job.job_id for job in array.subjobs] == ["0[2].pbs00", "0[15].pbs00"]
+        assert pbs.qstat_array("0[].pbs00").subjobs is None
+
+    def test_qstat_array_not_found(self, pbs, qstat_data, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        assert pbs.qstat_array("1000.pbs00") is None
+        mock_shell.configure_mock(
+            code=153, **{"errors.return_value": "qstat: Unknown Job Id 1[].pbs00"}
+        )
+        assert pbs.qstat_array("1[].pbs00") is None
+
+    def test_commands_inflight_limited(self, job_submit, mock_shell, tmp_path):
+        limiter = Limiter(directory=str(tmp_path), user_max_inflight=1)
+        pbs = PBS(env={"EXEC_PATH": "/opt/pbs"}, username="user", limiter=limiter)
+        mock_shell.configure_mock(**{"output.return_value": "100.pbs00\n"})
+        with limiter.inflight("user"):
+            with pytest.raises(RateLimited):
+                pbs.qsub(props=job_submit)
+            with pytest.raises(RateLimited):
+                pbs.qstat()
+        mock_shell.run.assert_not_called()
+        assert pbs.qsub(props=job_submit) == "100.pbs00"
+
+    def test_batch_within_inflight_limit(self, job_submit, mock_shell, tmp_path):
+        limiter = Limiter(directory=str(tmp_path), user_max_inflight=2)
+        pbs = PBS(env={"EXEC_PATH": "/opt/pbs"}, username="user", limiter=limiter)
+        mock_shell.configure_mock(**{"output.return_value": "100.pbs00\n"})
+        mock_shell.run.side_effect = lambda argv: time.sleep(0.02)
+        results = pbs.qsub_many([job_submit] * 8, workers=8)
+        assert results == ["100.pbs00"] * 8
+
+    def test_qstat_coalesced(self, qstat_data, mock_shell):
+        pbs = PBS(env={"EXEC_PATH": "/opt/pbs"}, coalescer=Coalescer(window=60))
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        job = pbs.qstat(job_id="1000.pbs00")
+        assert pbs.qstat(job_id="1000.pbs00") is job
+        mock_shell.run.assert_called_once()
+
+        mock_shell.configure_mock(**{"output.return_value": '{"Jobs": {}}'})
+        assert pbs.qstat(job_id="1001.pbs00") is None
+        assert pbs.qstat(job_id="1001.pbs00") is None
+        assert mock_shell.run.call_count == 2
+
+    def test_qstat_coalesced_across_users(self, qstat_data, mock_shell, mocker):
+        coalescer = Coalescer(window=60)
+        env = {"EXEC_PATH": "/opt/pbs"}
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        # run as the service, what is seen of a job is the same for all
+        for username in ("alice", "bob"):
+            pbs = PBS(env=env, coalescer=coalescer, username=username)
+            assert pbs.qstat(job_id="1000.pbs00").job_id == "1000.pbs00"
+        mock_shell.run.assert_called_once()
+
+        broker = mocker.Mock()
+        broker.stream.side_effect = lambda user, argv: pbs.executor.stream(argv)
+        for username in ("alice", "bob"):
+            pbs = PBS(env=env, coalescer=coalescer, username=username, broker=broker)
+            assert pbs.qstat(job_id="1000.pbs00").job_id == "1000.pbs00"
+        assert broker.stream.call_count == 2
@@ -0,0 +1,39 @@
+import pytest
+
+from src.utils.ranges import IndexRanges, parse_ranges
+
+
+class TestIndexRanges:
+    @pytest.mark.parametrize(
+        "indices, expected",
+        [
+            ([], ""),
+            ([1], "1"),
+            ([1, 2, 3, 5, 7, 8], "1-3,5,7-8"),
+            ([5, 1, 2, 4, 3, 9], "1-5,9"),
+        ],
+    )
+    def test_str(self, indices, expected):
+        ranges = IndexRanges()
+        for idx in indices:
+            ranges.add(idx)
+        assert str(ranges) == expected
+        assert ranges.count == len(indices)
+
+
+class TestParseRanges:
+    @pytest.mark.parametrize(
+        "value, expected",
+        [
+            ("3", [3]),
+            ("1-4", [1, 2, 3, 4]),
+            ("1-10:3,15", [1, 4, 7, 10, 15]),
+        ],
+    )
+    def test_parse(self, value, expected):
+        assert list(parse_ranges(value)) == expected
+
+    @pytest.mark.parametrize("value", ["", "a", "4-1", "1-4:0", "-1", "1,"])
+    def test_malformed(self, value):
+        with pytest.raises(ValueError):
+            list(parse_ranges(value))
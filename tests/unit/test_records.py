@@ -0,0 +1,52 @@
+import json
+import random
+
+from benchmarks.generator import qstat_record
+from src.models.job import JobStatus
+from src.services.pbs import build_job
+from src.services.records import JobRecord
+
+
+def _record(idx=1):
+    return qstat_record(idx, random.Random(idx))
+
+
+class TestJobRecord:
+    def test_builds_same_job(self):
+        record = _record()
+        job = JobRecord("1.pbs00", record)
+        assert job.record() == record
+        assert job.job() == build_job("1.pbs00", record)
+
+    def test_lookup_attributes(self):
+        record = _record()
+        job = JobRecord("1.pbs00", record)
+        stat = job.job()
+        assert job.owner == stat.owner
+        assert job.queue == stat.queue
+        assert job.status is stat.status
+        assert job.created_at == int(stat.timeline.created_at.timestamp())
+        assert job.updated_at == int(stat.timeline.updated_at.timestamp())
+
+    def test_strings_interned(self):
+        first, second = _record(1), _record(2)
+        second["queue"] = "".join(first["queue"])
+        assert JobRecord("1.pbs00", first).queue is JobRecord("2.pbs00", second).queue
+
+    def test_partial_record(self):
+        job = JobRecord("1.pbs00", {"job_state": "X", "ctime": "not a date"})
+        assert job.status is JobStatus.EXPIRED
+        assert job.owner is None
+        assert job.created_at is None
+
+    def test_compact(self):
+        record = _record()
+        job = JobRecord("1.pbs00", record)
+        assert len(job._raw) < len(json.dumps(record)) / 2
+
+    def test_equality(self):
+        record = _record()
+        assert JobRecord("1.pbs00", record) == JobRecord("1.pbs00", dict(record))
+        assert JobRecord("1.pbs00", record) != JobRecord("2.pbs00", record)
+        record["comment"] = "changed"
+        assert JobRecord("1.pbs00", record) != JobRecord("1.pbs00", _record())
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from src.services.pbs import PBS
+from src.services.snapshot import QstatSnapshot
+
+
+@pytest.fixture()
+def snapshot():
+    pbs = PBS(
+        env={
+            "EXEC_PATH": "/opt/pbs",
+            "HOME_PATH": "/var/spool/pbs",
+            "SERVER": "pbs00",
+        }
+    )
+    return QstatSnapshot(sched=pbs, interval=1, max_age=60)
+
+
+class TestQstatSnapshot:
+    def test_refresh_indexes_jobs(self, snapshot, qstat_data, qstat_job, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        snapshot.refresh()
+        assert snapshot.fresh is True
+        assert snapshot.get("1000.pbs00") == qstat_job
+        assert snapshot.get("1001.pbs00") is None
+
+    def test_empty_server(self, snapshot, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": json.dumps({})})
+        snapshot.refresh()
+        assert snapshot.fresh is True
+        assert snapshot.get("1000.pbs00") is None
+
+    def test_stale_snapshot_is_ignored(self, snapshot, qstat_data, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        assert snapshot.get("1000.pbs00") is None
+        snapshot.refresh()
+        snapshot.max_age = -1
+        assert snapshot.fresh is False
+        assert snapshot.get("1000.pbs00") is None
+
+    def test_unchanged_jobs_keep_records(self, snapshot, qstat_data, mock_shell):
+        mock_shell.configure_mock(**{"output.return_value": qstat_data})
+        snapshot.refresh()
+        record = snapshot.record("1000.pbs00")
+        etag, body = snapshot.encoded("1000.pbs00")
+        snapshot.refresh()
+        assert snapshot.record("1000.pbs00") is record
+        assert snapshot.encoded("1000.pbs00")[1] is body
+
+        data = json.loads(qstat_data)
+        data["Jobs"]["1000.pbs00"]["job_state"] = "F"
+        mock_shell.configure_mock(**{"output.return_value": json.dumps(data)})
+        snapshot.refresh()
+        assert snapshot.record("1000.pbs00") is not record
+        assert snapshot.encoded("1000.pbs00")[0] != etag
+
+    def test_encoded_cache_bounded(self, snapshot, qstat_data, mock_shell):
+        data = json.loads(qstat_data)
+        job = data["Jobs"]["1000.pbs00"]
+        data["Jobs"] = {f"{idx}.pbs00": job for idx in range(5)}
+        mock_shell.configure_mock(**{"output.return_value": json.dumps(data)})
+        snapshot.refresh()
+        snapshot.cache_size = 2
+        for idx in range(5):
+            assert snapshot.encoded(f"{idx}.pbs00")
+        assert list(snapshot._encoded) == ["3.pbs00", "4.pbs00"]
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from src.services.tracing import Tracer, accumulate, span
+
+
+@pytest.fixture()
+def tracer(tmp_path):
+    return Tracer(path=str(tmp_path / "traces.jsonl"), users=("alice",))
+
+
+def _busy():
+    return sum(range(1000))
+
+
+class TestTracer:
+    def test_span_without_trace(self):
+        with span("idle", size=1) as attrs:
+            attrs["more"] = 2
+        accumulate("idle", 1.0)
+
+    def test_nested_spans(self, tracer):
+        token = tracer.start("GET /pbs/qstat")
+        tracer.authorize("alice")
+        with span("outer"):
+            with span("inner", action="qstat") as attrs:
+                attrs["size"] = 10
+        accumulate("job.build", 0.25)
+        accumulate("job.build", 0.25, count=2)
+        trace = tracer.finish(token, status=200)
+
+        inner, outer = trace.spans
+        assert (outer["name"], outer["depth"]) == ("outer", 0)
+        assert (inner["name"], inner["depth"]) == ("inner", 1)
+        assert inner["action"] == "qstat" and inner["size"] == 10
+        assert outer["start"] <= inner["start"]
+        assert outer["duration"] >= inner["duration"]
+        assert trace.totals == {"job.build": [0.5, 3]}
+
+    def test_trace_is_written(self, tracer):
+        token = tracer.start("GET /pbs/qstat")
+        tracer.authorize("alice")
+        with span("work"):
+            pass
+        trace = tracer.finish(token, status=200)
+        with open(tracer.path) as fp:
+            (record,) = map(json.loads, fp)
+        assert record["trace_id"] == trace.id
+        assert record["name"] == "GET /pbs/qstat"
+        assert record["status"] == 200
+        assert [item["name"] for item in record["spans"]] == ["work"]
+
+    @pytest.mark.parametrize("username", ["bob", None])
+    def test_unauthorized_trace_is_dropped(self, tracer, username):
+        token = tracer.start("GET /pbs/qstat", profile=True)
+        tracer.authorize(username)
+        with span("work"):
+            pass
+        assert tracer.finish(token) is None
+        assert not tracer._profiling.locked()
+
+    def test_unauthenticated_trace_is_dropped(self, tracer, tmp_path):
+        token = tracer.start("GET /pbs/qstat")
+        assert tracer.finish(token) is None
+        assert not (tmp_path / "traces.jsonl").exists()
+
+    def test_profile(self, tracer):
+        token = tracer.start("GET /pbs/qstat", profile=True)
+        tracer.authorize("alice")
+        _busy()
+        trace = tracer.finish(token)
+        record = trace.record()
+        assert any("_busy" in item["function"] for item in record["profile"])
+        assert not tracer._profiling.locked()
+
+    def test_profile_rate(self, tmp_path):
+        tracer = Tracer(
+            path=str(tmp_path / "t.jsonl"), users=("alice",), profile_rate=1
+        )
+        token = tracer.start("GET /pbs/qstat")
+        tracer.authorize("alice")
+        assert "profile" in tracer.finish(token).record()